@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:30
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_user_preferred_region'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('quiz_count', models.PositiveIntegerField(default=0)),
+                ('ratio_sum', models.FloatField(default=0, verbose_name='Sum of quiz score / length ratios')),
+                ('best_score', models.IntegerField(default=None, null=True)),
+                ('best_length', models.IntegerField(default=None, null=True)),
+                ('by_region', models.JSONField(default=dict)),
+                ('by_mode', models.JSONField(default=dict)),
+                ('by_difficulty', models.JSONField(default=dict)),
+            ],
+            options={
+                'verbose_name': 'User stats',
+                'verbose_name_plural': 'User stats',
+            },
+        ),
+    ]
@@ -44,3 +44,45 @@ class User(AbstractBaseUser, PermissionsMixin):
 
     def __str__(self):
         return self.username
+
+
+class UserStats(models.Model):
+    """
+    Rollup of a user's quiz results, updated incrementally whenever the user finishes a quiz.
+    Breakdowns map a region ID, quiz mode or difficulty to {"count": quizzes taken, "ratio_sum": sum of score ratios}.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name="stats")
+    quiz_count = models.PositiveIntegerField(default=0)
+    ratio_sum = models.FloatField(default=0, verbose_name="Sum of quiz score / length ratios")
+    best_score = models.IntegerField(null=True, default=None)
+    best_length = models.IntegerField(null=True, default=None)
+    by_region = models.JSONField(default=dict)
+    by_mode = models.JSONField(default=dict)
+    by_difficulty = models.JSONField(default=dict)
+
+    class Meta:
+        verbose_name = "User stats"
+        verbose_name_plural = "User stats"
+
+    def __str__(self):
+        return f"Stats of {self.user}"
+
+    @property
+    def accuracy(self) -> float:
+        """Average score ratio of all quizzes as a percentage."""
+        return self.ratio_sum / self.quiz_count * 100 if self.quiz_count else 0
+
+    def add_quiz(self, score: int, length: int, region_id: int | None, mode: str, difficulty: str) -> None:
+        """Add the result of a finished quiz to the rollup. Doesn't save the rollup."""
+        ratio = score / length
+        self.quiz_count += 1
+        self.ratio_sum += ratio
+        if self.best_score is None or ratio > self.best_score / self.best_length:
+            self.best_score, self.best_length = score, length
+        breakdowns = [(self.by_mode, mode), (self.by_difficulty, difficulty)]
+        if region_id is not None:
+            breakdowns.append((self.by_region, str(region_id)))
+        for breakdown, key in breakdowns:
+            group = breakdown.setdefault(key, {"count": 0, "ratio_sum": 0})
+            group["count"] += 1
+            group["ratio_sum"] += ratio
@@ -0,0 +1,108 @@
+from django.db import transaction
+from django.db.models import Count, F, FloatField, OuterRef, Subquery, Sum
+from django.db.models.functions import Cast
+
+from accounts.models import UserStats
+from quiz.models import Quiz
+
+
+SCORE_RATIO = Cast(F("score"), FloatField()) / F("length")
+BREAKDOWN_FIELDS = {"by_region": "region_id", "by_mode": "mode", "by_difficulty": "difficulty"}
+
+
+def build_user_stats(user_ids: list[int], exclude_quiz_id=None) -> list[UserStats]:
+    """
+    Build the stats rollups of users from all of their quizzes with aggregate queries. The rollups aren't saved.
+
+    :param user_ids: IDs of the users whose rollups are built.
+    :param exclude_quiz_id: ID of a quiz left out of the rollups, e.g. one that is added to them afterwards.
+    :return stats: Unsaved rollups of the users.
+    """
+    user_quizzes = Quiz.objects.filter(length__gt=0).exclude(id=exclude_quiz_id)
+    quizzes = user_quizzes.filter(user_id__in=user_ids)
+    best_quiz = (
+        user_quizzes
+        .filter(user_id=OuterRef("user_id"))
+        .annotate(ratio=SCORE_RATIO)
+        .order_by("-ratio", "-length")
+    )
+    totals = (
+        quizzes
+        .values("user_id")
+        .annotate(
+            quiz_count=Count("id"),
+            ratio_sum=Sum(SCORE_RATIO),
+            best_score=Subquery(best_quiz.values("score")[:1]),
+            best_length=Subquery(best_quiz.values("length")[:1])
+        )
+    )
+    stats = {user_id: UserStats(user_id=user_id) for user_id in user_ids}
+    for row in totals:
+        user_id = row.pop("user_id")
+        for field, value in row.items():
+            setattr(stats[user_id], field, value)
+    for breakdown, field in BREAKDOWN_FIELDS.items():
+        groups = quizzes.exclude(**{field: None}).values("user_id", field).annotate(
+            count=Count("id"), ratio_sum=Sum(SCORE_RATIO)
+        )
+        for group in groups:
+            getattr(stats[group["user_id"]], breakdown)[str(group[field])] = {
+                "count": group["count"],
+                "ratio_sum": group["ratio_sum"]
+            }
+    return list(stats.values())
+
+
+def rebuild_user_stats(user_ids: list[int]) -> None:
+    """
+    Rebuild the stats rollups of users from all of their quizzes, see build_user_stats.
+
+    :param user_ids: IDs of the users whose rollups are rebuilt.
+    """
+    stats = build_user_stats(user_ids)
+    with transaction.atomic():
+        UserStats.objects.filter(user_id__in=user_ids).delete()
+        UserStats.objects.bulk_create(stats)
+
+
+def record_quiz(quiz: Quiz) -> None:
+    """
+    Add a finished quiz to the stats rollup of its user.
+
+    :param quiz: Saved quiz.
+    """
+    if quiz.user_id is None or not quiz.length:
+        return
+    with transaction.atomic():
+        stats = UserStats.objects.select_for_update().filter(user_id=quiz.user_id).first()
+        if stats is None:  # first quiz since rollups were added, include the user's earlier quizzes
+            # A concurrent quiz of the same user may create the rollup first, then that one is locked and updated
+            stats = build_user_stats([quiz.user_id], exclude_quiz_id=quiz.id)
+            UserStats.objects.bulk_create(stats, ignore_conflicts=True)
+            stats = UserStats.objects.select_for_update().get(user_id=quiz.user_id)
+        stats.add_quiz(quiz.score, quiz.length, quiz.region_id, quiz.mode, quiz.difficulty)
+        stats.save()
+
+
+def invalidate_user_stats(user_ids) -> None:
+    """
+    Remove the stats rollups of users, e.g. after their quizzes have been changed or deleted.
+    Rollups are rebuilt the next time they are read or the users finish a quiz.
+
+    :param user_ids: IDs of the users.
+    """
+    UserStats.objects.filter(user_id__in=user_ids).delete()
+
+
+def get_user_stats(user_id: int) -> UserStats:
+    """
+    Get the stats rollup of a user, building it if it doesn't exist yet.
+
+    :param user_id: ID of the user.
+    :return stats: Stats rollup of the user.
+    """
+    stats = UserStats.objects.filter(user_id=user_id).first()
+    if stats is None:  # a concurrent request may build the rollup too
+        UserStats.objects.bulk_create(build_user_stats([user_id]), ignore_conflicts=True)
+        stats = UserStats.objects.get(user_id=user_id)
+    return stats
@@ -0,0 +1,22 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from accounts.services import invalidate_user_stats, record_quiz
+from quiz.models import Quiz
+
+
+@receiver(post_save, sender=Quiz)
+def update_user_stats_on_save(sender, instance, created, **kwargs):
+    """New quizzes are added to the stats rollup incrementally, other changes rebuild it on the next read."""
+    if instance.user_id is None:
+        return
+    if created:
+        record_quiz(instance)
+    else:
+        invalidate_user_stats([instance.user_id])
+
+
+@receiver(post_delete, sender=Quiz)
+def update_user_stats_on_delete(sender, instance, **kwargs):
+    if instance.user_id is not None:
+        invalidate_user_stats([instance.user_id])
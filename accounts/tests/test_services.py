@@ -0,0 +1,110 @@
+"""Unit tests for business logic"""
+
+from django.contrib.auth import get_user_model
+from model_bakery import baker
+import pytest
+
+from accounts import services
+from accounts.models import UserStats
+from quiz.models import Quiz, Region
+
+
+User = get_user_model()
+
+
+def make_quiz(user, score: int, length: int = 10, **kwargs) -> Quiz:
+    defaults = {"mode": "MULTI", "difficulty": "NML", "region": None}
+    return baker.make(Quiz, user=user, score=score, length=length, **(defaults | kwargs))
+
+
+@pytest.mark.django_db
+def test_record_quiz_1():
+    """Finished quizzes should be added to the user's stats rollup incrementally."""
+    user = baker.make(User)
+    region = baker.make(Region)
+
+    make_quiz(user, 5, region=region)
+    make_quiz(user, 9, mode="OPEN", difficulty="HRD")
+    make_quiz(user, 7, region=region)
+    stats = UserStats.objects.get(user=user)
+
+    assert stats.quiz_count == 3
+    assert stats.accuracy == pytest.approx(70)
+    assert (stats.best_score, stats.best_length) == (9, 10)
+    assert stats.by_region == {str(region.id): {"count": 2, "ratio_sum": pytest.approx(1.2)}}
+    assert stats.by_mode["MULTI"]["count"] == 2
+    assert stats.by_difficulty["HRD"] == {"count": 1, "ratio_sum": pytest.approx(0.9)}
+
+
+@pytest.mark.django_db
+def test_record_quiz_2(django_assert_num_queries):
+    """Recording a quiz shouldn't depend on the number of quizzes the user has taken."""
+    user = baker.make(User)
+    for score in range(10):
+        make_quiz(user, score)
+    quiz = make_quiz(user, 10)
+
+    # lock and update the rollup within a savepoint
+    with django_assert_num_queries(4):
+        services.record_quiz(quiz)
+
+
+@pytest.mark.django_db
+def test_record_quiz_3(monkeypatch):
+    """A missing rollup should be built from earlier quizzes, even if a concurrent quiz creates it first."""
+    user = baker.make(User)
+    make_quiz(user, 4)
+    services.invalidate_user_stats([user.id])
+    build_user_stats = services.build_user_stats
+
+    def build_concurrently(user_ids, exclude_quiz_id=None):
+        stats = build_user_stats(user_ids, exclude_quiz_id)
+        UserStats.objects.bulk_create(build_user_stats(user_ids, exclude_quiz_id))  # the concurrent quiz wins
+        return stats
+
+    monkeypatch.setattr(services, "build_user_stats", build_concurrently)
+    make_quiz(user, 6)
+    stats = UserStats.objects.get(user=user)
+
+    assert stats.quiz_count == 2
+    assert stats.accuracy == pytest.approx(50)
+
+
+@pytest.mark.django_db
+def test_rebuild_user_stats():
+    """Rebuilt rollups should match incrementally updated ones."""
+    user_1, user_2 = baker.make(User, _quantity=2)
+    region = baker.make(Region)
+    for score, mode in ((3, "MULTI"), (8, "OPEN"), (6, "MULTI")):
+        make_quiz(user_1, score, mode=mode, region=region)
+    make_quiz(user_2, 4, length=5)
+    incremental_stats = {stats.user_id: stats for stats in UserStats.objects.all()}
+
+    services.rebuild_user_stats([user_1.id, user_2.id, baker.make(User).id])
+    rebuilt_stats = {stats.user_id: stats for stats in UserStats.objects.all()}
+
+    assert len(rebuilt_stats) == 3
+    for user_id, stats in incremental_stats.items():
+        rebuilt = rebuilt_stats[user_id]
+        assert (rebuilt.quiz_count, rebuilt.best_score, rebuilt.best_length) == (
+            stats.quiz_count, stats.best_score, stats.best_length
+        )
+        assert rebuilt.ratio_sum == pytest.approx(stats.ratio_sum)
+        assert rebuilt.by_region.keys() == stats.by_region.keys()
+        assert rebuilt.by_mode.keys() == stats.by_mode.keys()
+
+
+@pytest.mark.django_db
+def test_get_user_stats():
+    """Rollups removed after changes to quizzes should be rebuilt when read."""
+    user = baker.make(User)
+    quiz = make_quiz(user, 5)
+    make_quiz(user, 7)
+
+    quiz.score = 10
+    quiz.save()
+    removed = not UserStats.objects.filter(user=user).exists()
+    stats = services.get_user_stats(user.id)
+
+    assert removed
+    assert (stats.quiz_count, stats.best_score) == (2, 10)
@@ -7,7 +7,9 @@ from django.views.decorators.http import require_http_methods
 from django.utils.translation import gettext_lazy as _
 
 from accounts.forms import CustomAuthenticationForm, CustomUserCreationForm
-from quiz.services import get_available_regions
+from accounts.services import get_user_stats
+from quiz.models import DIFFICULTY_LABELS, MODE_LABELS, Region
+from quiz.services import get_region_catalog
 
 
 class CustomLoginView(LoginView):
@@ -51,24 +53,35 @@ def account_deleted(request):
     return render(request, "account_deleted.html")
 
 
+def _breakdown_rows(groups: dict[str, dict], labels: dict[str, str]) -> list[tuple[str, int, float]]:
+    """(label, quizzes taken, accuracy %) rows of a stats breakdown, most played first."""
+    rows = [
+        (labels.get(key, key), group["count"], group["ratio_sum"] / group["count"] * 100)
+        for key, group in groups.items()
+    ]
+    return sorted(rows, key=lambda row: -row[1])
+
+
 @login_required
 def user_stats(request):
-    user_quizzes = request.user.quiz_set.all()
-    total_quizzes = user_quizzes.count()
-    if not user_quizzes:
-        accuracy = 0
-        best_score = "N/A"
-    else:
-        accuracy = round(sum(quiz.score / quiz.length for quiz in user_quizzes) / total_quizzes * 100, 1)
-        best_quiz = max(user_quizzes, key=lambda quiz: (quiz.score / quiz.length))
-        best_score = f"{best_quiz.score} / {best_quiz.length}"
+    stats = get_user_stats(request.user.id)
+    best_score = f"{stats.best_score} / {stats.best_length}" if stats.best_score is not None else "N/A"
+    region_names = {
+        str(region_id): name
+        for region_id, name in Region.objects.filter(id__in=stats.by_region).values_list("id", "full_name")
+    }
     return render(
         request,
         "my_stats.html",
         context = {
-            "total_quizzes": total_quizzes,
-            "accuracy": accuracy,
-            "best_score": best_score
+            "total_quizzes": stats.quiz_count,
+            "accuracy": stats.accuracy,
+            "best_score": best_score,
+            "breakdowns": [
+                (_("StatsByRegionTitle"), _breakdown_rows(stats.by_region, region_names)),
+                (_("StatsByModeTitle"), _breakdown_rows(stats.by_mode, MODE_LABELS)),
+                (_("StatsByDifficultyTitle"), _breakdown_rows(stats.by_difficulty, DIFFICULTY_LABELS))
+            ]
         }
     )
 
@@ -80,5 +93,5 @@ def user_profile(request):
         user = request.user
         user.preferred_region_id = region_id
         user.save()
-    available_regions = sorted(get_available_regions(), key=lambda r: r.display_name.lower())
+    available_regions = get_region_catalog("observed")
     return render(request, "my_profile.html", context={"regions": available_regions})
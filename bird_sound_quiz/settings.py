@@ -103,6 +103,14 @@ DATABASES = {
     }
 }
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Use a shared cache (e.g. CACHE_URL=rediscache://127.0.0.1:6379/1) to share cached data between worker processes
+
+CACHES = {
+    'default': env.cache_url('CACHE_URL', default='locmemcache://')
+}
+
 # Custom user model
 AUTH_USER_MODEL = 'accounts.User'
 
@@ -191,3 +199,24 @@ MEDIA_URL = "media/"
 
 # Determines whether to self-host downloaded audio files or to use files hosted by Xeno-Canto instead
 SELF_HOST_AUDIO = env("SELF_HOST_AUDIO", default=False)
+
+# Self-hosted audio is served by quiz.views.audio_view, see quiz.audio:
+# - AUDIO_CACHE_MAX_AGE: lifetime in seconds of audio files in browser and proxy caches
+# - AUDIO_URL_MAX_AGE: minimum lifetime in seconds of signed audio URLs, 0 for unsigned URLs that never expire
+# - AUDIO_SENDFILE: "x-accel-redirect" (nginx) or "x-sendfile" (Apache, lighttpd) to let the web server send the files
+# - AUDIO_ACCEL_REDIRECT_PREFIX: internal nginx location that serves MEDIA_ROOT
+AUDIO_CACHE_MAX_AGE = env.int("AUDIO_CACHE_MAX_AGE", default=60 * 60 * 24 * 365)
+AUDIO_URL_MAX_AGE = env.int("AUDIO_URL_MAX_AGE", default=0)
+AUDIO_SENDFILE = env("AUDIO_SENDFILE", default=None)
+AUDIO_ACCEL_REDIRECT_PREFIX = env("AUDIO_ACCEL_REDIRECT_PREFIX", default="/protected-media/")
+
+# Pre-generated quiz pools: number of quiz blueprints kept per (region, difficulty, mode) and their lifetime in seconds
+QUIZ_POOL_SIZE = env.int("QUIZ_POOL_SIZE", default=20)
+QUIZ_POOL_TIMEOUT = env.int("QUIZ_POOL_TIMEOUT", default=60 * 60 * 24)
+
+# Lifetime in seconds of cached results pages of finished quizzes
+QUIZ_RESULTS_CACHE_TIMEOUT = env.int("QUIZ_RESULTS_CACHE_TIMEOUT", default=60 * 60 * 24 * 7)
+
+# Leaderboards: number of entries kept per leaderboard and lifetime in seconds of cached leaderboards
+LEADERBOARD_SIZE = env.int("LEADERBOARD_SIZE", default=50)
+LEADERBOARD_CACHE_TIMEOUT = env.int("LEADERBOARD_CACHE_TIMEOUT", default=60 * 60)
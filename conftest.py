@@ -0,0 +1,9 @@
+"""Fixtures shared by the tests of all apps"""
+
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def media_root(settings, tmp_path):
+    """Write files created by tests, e.g. with model_bakery's _create_files, to a temporary directory."""
+    settings.MEDIA_ROOT = tmp_path
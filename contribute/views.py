@@ -4,7 +4,7 @@ from django.shortcuts import render, redirect
 from contribute.services import get_observations_to_type_annotate
 from contribute.models import ObservationTypeAnnotation
 from quiz.models import Region, Observation, OccurrenceType, OCC_TYPE_DESCRIPTIONS
-from quiz.services import get_available_regions
+from quiz.services import get_region_catalog
 
 
 @login_required
@@ -17,7 +17,7 @@ def start_view(request):
                 return redirect("species_status", region_id=region_id)
             case _:
                 raise ValueError("Unknown task")
-    regions = sorted(get_available_regions(), key=lambda r: r.display_name.lower())
+    regions = get_region_catalog("observed")
     return render(request, "start.html", context={"regions": regions})
 
 
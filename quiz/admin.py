@@ -6,6 +6,7 @@ from quiz.models import Region, Species, SpeciesList, ListSpecies
 @admin.register(Region)
 class RegionAdmin(admin.ModelAdmin):
     list_display = ('code', 'display_name', 'parent_region')
+    list_select_related = ('parent_region',)
     search_fields = ('code', 'name_en', 'name_fi')
     list_filter = ('parent_region',)
     ordering = ('code',)
@@ -14,7 +15,7 @@ class RegionAdmin(admin.ModelAdmin):
     def display_name(self, obj):
         return obj.display_name
 
-    display_name.admin_order_field = 'name_en'
+    display_name.admin_order_field = 'full_name'
     display_name.short_description = 'Display Name'
 
 
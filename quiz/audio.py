@@ -0,0 +1,245 @@
+"""
+Serving of self-hosted audio files.
+
+Audio files are stored with AudioStorage, whose URLs point to quiz.views.audio_view instead of MEDIA_URL. The view
+supports conditional and Range requests (browsers seek audio with Range requests, and mobile Safari won't play audio
+without them) and can hand the transfer off to the web server with X-Accel-Redirect (nginx) or X-Sendfile (Apache,
+lighttpd), so that Python workers never stream the files themselves.
+
+If AUDIO_URL_MAX_AGE is set, audio URLs are signed and expire. Expiry times are rounded up so that URLs stay the same
+for a while and browsers and proxies can still cache the files.
+
+Downloaded files are stored by content: a file with SHA-256 digest "3fa2..." is stored as "audio/3f/a2/3fa2....mp3".
+Sharding by hash prefix keeps directories small, and recordings with identical payloads share a single file.
+"""
+
+import hashlib
+import mimetypes
+import os
+from pathlib import Path
+import re
+import time
+from urllib.parse import unquote, urlsplit
+
+from django.conf import settings
+from django.core import signing
+from django.core.files.storage import FileSystemStorage
+from django.http import FileResponse, HttpRequest, HttpResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.crypto import constant_time_compare
+from django.utils.deconstruct import deconstructible
+from django.utils.http import http_date, parse_etags
+
+
+SIGNING_SALT = "quiz.audio.url"
+CONTENT_TYPES = {
+    ".mp3": "audio/mpeg",
+    ".ogg": "audio/ogg",
+    ".m4a": "audio/mp4",
+    ".wav": "audio/wav"
+}
+CHUNK_SIZE = 64 * 1024
+HASH_ALGORITHM = "sha256"
+SHARD_DEPTH = 2  # number of directory levels
+SHARD_WIDTH = 2  # hex digits per level, i.e. 256 directories per level
+CONTENT_ADDRESSED_PATTERN = rf"/([0-9a-f]{{{SHARD_WIDTH}}}/){{{SHARD_DEPTH}}}[0-9a-f]{{64}}\.[0-9a-z]+$"
+
+
+def get_url_expiry(now: float | None = None) -> int | None:
+    """
+    Get the expiry time of audio URLs signed now, or None if URLs aren't signed.
+    Expiry times are rounded up to the next multiple of a quarter of AUDIO_URL_MAX_AGE, so URLs are valid for at least
+    AUDIO_URL_MAX_AGE seconds and URLs signed during the same quarter are identical.
+    """
+    if not settings.AUDIO_URL_MAX_AGE:
+        return None
+    step = max(settings.AUDIO_URL_MAX_AGE // 4, 1)
+    now = time.time() if now is None else now
+    return (int(now) // step + 1) * step + settings.AUDIO_URL_MAX_AGE
+
+
+def _signature(path: str, expires: int) -> str:
+    return signing.Signer(salt=SIGNING_SALT).signature(f"{path}:{expires}")
+
+
+def sign_audio_url(url: str) -> str:
+    """Add an expiry time and a signature to an audio URL, if URLs are signed."""
+    expires = get_url_expiry()
+    if expires is None:
+        return url
+    return f"{url}?expires={expires}&signature={_signature(unquote(urlsplit(url).path), expires)}"
+
+
+def check_audio_signature(request: HttpRequest) -> bool:
+    """Check that a request has a valid, unexpired signature if URLs are signed."""
+    if not settings.AUDIO_URL_MAX_AGE:
+        return True
+    try:
+        expires = int(request.GET.get("expires", ""))
+    except ValueError:
+        return False
+    signature = request.GET.get("signature", "")
+    return expires >= time.time() and constant_time_compare(signature, _signature(request.path, expires))
+
+
+def hash_file(path: Path) -> str:
+    """Get the hex digest of a file's contents."""
+    with open(path, "rb") as f_in:
+        return hashlib.file_digest(f_in, HASH_ALGORITHM).hexdigest()
+
+
+def get_content_addressed_name(upload_to: str, digest: str, extension: str) -> str:
+    """
+    Get the storage name of a file in the content-addressed layout.
+
+    :param upload_to: Directory of the file field, e.g. "audio".
+    :param digest: Hex digest of the file's contents.
+    :param extension: File extension including the dot, e.g. ".mp3".
+    :return name: Storage name, e.g. "audio/3f/a2/3fa2....mp3".
+    """
+    shards = [digest[i * SHARD_WIDTH:(i + 1) * SHARD_WIDTH] for i in range(SHARD_DEPTH)]
+    return "/".join([upload_to.rstrip("/"), *shards, f"{digest}{extension.lower()}"])
+
+
+def is_content_addressed(name: str) -> bool:
+    """Check if a storage name is in the content-addressed layout."""
+    return re.search(CONTENT_ADDRESSED_PATTERN, name) is not None
+
+
+@deconstructible
+class AudioStorage(FileSystemStorage):
+    """File system storage whose URLs point to the audio view. Locations default to MEDIA_ROOT."""
+
+    def url(self, name: str) -> str:
+        return sign_audio_url(reverse("audio", kwargs={"name": name}))
+
+    def unsigned_url(self, name: str) -> str:
+        """URL of a file without a signature, e.g. for caching. Sign it with sign_audio_url before use."""
+        return reverse("audio", kwargs={"name": name})
+
+    def store_by_content(self, path: Path, upload_to: str, keep_original: bool = False) -> str:
+        """
+        Move a file into the content-addressed layout. If a file with identical contents has already been stored, the
+        file is removed and the stored one is reused, so stored files may be shared and must never be deleted through
+        a single recording.
+
+        :param path: Path of the file, e.g. a freshly downloaded file in the storage.
+        :param upload_to: Directory of the file field, e.g. "audio".
+        :param keep_original: Hard link the file instead of moving it, so it can be removed once its new name is saved.
+        :return name: Storage name of the stored file.
+        """
+        name = get_content_addressed_name(upload_to, hash_file(path), path.suffix)
+        destination = Path(self.path(name))
+        if destination.exists():
+            if destination != path and not keep_original:
+                path.unlink()
+            return name
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        if not keep_original:
+            os.replace(path, destination)  # atomic, so concurrent moves of identical files are safe
+            return name
+        try:
+            os.link(path, destination)
+        except FileExistsError:  # an identical file was stored concurrently
+            pass
+        return name
+
+
+def parse_range(header: str, size: int) -> tuple[int, int] | None:
+    """
+    Parse a single-range Range header, e.g. "bytes=0-1023", "bytes=1024-" or "bytes=-500".
+
+    :param header: Value of the Range header.
+    :param size: Size of the file in bytes.
+    :return: Tuple of (first byte, last byte) of the range, clamped to the file size, or None if the header should be
+        ignored (malformed or multiple ranges, which may be answered with the whole file).
+    :raises ValueError: If the range is not satisfiable.
+    """
+    unit, _, ranges = header.partition("=")
+    if unit.strip() != "bytes" or "," in ranges:
+        return None
+    start, sep, end = ranges.strip().partition("-")
+    if not sep or not (start or end) or not all(part.isdigit() for part in (start, end) if part):
+        return None
+    if not start:  # suffix range: last N bytes
+        if int(end) == 0:
+            raise ValueError("Empty suffix range")
+        return max(size - int(end), 0), size - 1
+    first, last = int(start), int(end) if end else size - 1
+    if first >= size:
+        raise ValueError("Range starts after the end of the file")
+    if last < first:
+        return None
+    return first, min(last, size - 1)
+
+
+def _iter_file_range(path: Path, start: int, length: int):
+    with open(path, "rb") as f_in:
+        f_in.seek(start)
+        while length > 0:
+            chunk = f_in.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def serve_audio(request: HttpRequest, name: str, path: Path) -> HttpResponse:
+    """
+    Serve an audio file with validators, long-lived caching and Range support.
+    The signature of the request should have been checked with check_audio_signature.
+
+    :param request: GET or HEAD request.
+    :param name: Storage name of the file, e.g. "audio/XC123.mp3".
+    :param path: Path of the file.
+    :return response: 200, 206, 304 or 416 response.
+    :raises FileNotFoundError: If the file doesn't exist.
+    """
+    stat = path.stat()
+    etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+    content_type = CONTENT_TYPES.get(path.suffix.lower()) or mimetypes.guess_type(path.name)[0]
+    content_type = content_type or "application/octet-stream"
+    max_age = settings.AUDIO_CACHE_MAX_AGE
+    if settings.AUDIO_URL_MAX_AGE:  # signed URLs shouldn't be cached beyond their expiry
+        max_age = min(max_age, int(request.GET["expires"]) - int(time.time()))
+
+    def finalize(response: HttpResponse) -> HttpResponse:
+        response.headers["ETag"] = etag
+        response.headers["Last-Modified"] = http_date(stat.st_mtime)
+        response.headers["Accept-Ranges"] = "bytes"
+        patch_cache_control(response, public=True, max_age=max(max_age, 0), immutable=True)
+        return response
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if not_modified is not None:
+        return finalize(not_modified)
+
+    match settings.AUDIO_SENDFILE:
+        case "x-accel-redirect":  # nginx serves the file from an internal location, including Range requests
+            response = HttpResponse(content_type=content_type)
+            response.headers["X-Accel-Redirect"] = f"{settings.AUDIO_ACCEL_REDIRECT_PREFIX.rstrip('/')}/{name}"
+            return finalize(response)
+        case "x-sendfile":
+            response = HttpResponse(content_type=content_type)
+            response.headers["X-Sendfile"] = os.fspath(path)
+            return finalize(response)
+
+    byte_range = None
+    range_header = request.headers.get("Range")
+    # If-Range: only send a part if the client's copy is still current, otherwise send the whole file
+    if range_header and etag in parse_etags(request.headers.get("If-Range", etag)):
+        try:
+            byte_range = parse_range(range_header, stat.st_size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response.headers["Content-Range"] = f"bytes */{stat.st_size}"
+            return response
+    if byte_range is None:
+        return finalize(FileResponse(open(path, "rb"), content_type=content_type))
+    first, last = byte_range
+    length = last - first + 1
+    response = StreamingHttpResponse(_iter_file_range(path, first, length), status=206, content_type=content_type)
+    response.headers["Content-Range"] = f"bytes {first}-{last}/{stat.st_size}"
+    response.headers["Content-Length"] = str(length)
+    return finalize(response)
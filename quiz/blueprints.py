@@ -0,0 +1,112 @@
+"""
+Pools of pre-generated quiz blueprints kept in the Django cache.
+
+Each (region, difficulty, mode, subregion inclusion) combination has a ring buffer of QUIZ_POOL_SIZE slots. The
+buffer is tracked with two ever-increasing counters: blueprints are pushed to the slot at the tail counter and popped
+from the slot at the head counter. Counters are updated with atomic cache increments, so the pool can be shared by
+several workers when a shared cache backend (e.g. Redis or Memcached) is configured.
+
+Slots are reserved by incrementing a counter before they are written, so a concurrent pop may claim a slot that
+hasn't been written yet, or one that was overwritten after the buffer wrapped around. Slots store the counter value
+they were written for, and a pop that finds another value treats the slot as empty and tries the next one.
+"""
+
+from itertools import batched, product
+
+from django.conf import settings
+from django.core.cache import cache
+
+from quiz.models import Quiz
+
+
+STAT_KEYS = ("hits", "misses", "refills")
+POP_ATTEMPTS = 3
+CLEAR_BATCH_SIZE = 100  # regions per cache request
+
+
+def _pool_key(region_id: int, difficulty: str, mode: str, include_subregions: bool) -> str:
+    return f"quiz_pool:{region_id}:{difficulty}:{mode}:{int(include_subregions)}"
+
+
+def _stat_key(stat: str) -> str:
+    return f"quiz_pool:stats:{stat}"
+
+
+def _incr(key: str) -> int:
+    """Atomically increment a counter that never expires, creating it if necessary."""
+    cache.add(key, 0, timeout=None)
+    return cache.incr(key)
+
+
+def get_pool_size(region_id: int, difficulty: str, mode: str, include_subregions: bool = False) -> int:
+    """Number of blueprints currently in a pool."""
+    key = _pool_key(region_id, difficulty, mode, include_subregions)
+    counters = cache.get_many([f"{key}:head", f"{key}:tail"])
+    return max(counters.get(f"{key}:tail", 0) - counters.get(f"{key}:head", 0), 0)
+
+
+def push_quiz_blueprint(
+    region_id: int,
+    difficulty: str,
+    mode: str,
+    blueprint: dict,
+    include_subregions: bool = False
+) -> bool:
+    """
+    Add a blueprint to the tail of a pool.
+
+    :return: True if the blueprint was added, False if the pool is already full.
+    """
+    if get_pool_size(region_id, difficulty, mode, include_subregions) >= settings.QUIZ_POOL_SIZE:
+        return False
+    key = _pool_key(region_id, difficulty, mode, include_subregions)
+    index = _incr(f"{key}:tail") - 1
+    if index >= cache.get(f"{key}:head", 0) + settings.QUIZ_POOL_SIZE:
+        return False  # concurrent pushes filled the pool, the reserved slot is skipped by pops
+    slot_key = f"{key}:slot:{index % settings.QUIZ_POOL_SIZE}"
+    cache.set(slot_key, (index, blueprint), timeout=settings.QUIZ_POOL_TIMEOUT)
+    _incr(_stat_key("refills"))
+    return True
+
+
+def pop_quiz_blueprint(region_id: int, difficulty: str, mode: str, include_subregions: bool = False) -> dict | None:
+    """
+    Take a blueprint from the head of a pool.
+
+    :return blueprint: Quiz blueprint, or None if the pool is empty.
+    """
+    blueprint = None
+    key = _pool_key(region_id, difficulty, mode, include_subregions)
+    for _ in range(POP_ATTEMPTS):
+        if get_pool_size(region_id, difficulty, mode, include_subregions) == 0:
+            break
+        index = _incr(f"{key}:head") - 1
+        if index >= cache.get(f"{key}:tail", 0):
+            cache.decr(f"{key}:head")  # a concurrent pop emptied the pool, give the claimed index back
+            break
+        # Slots aren't deleted: a push may already be reusing the slot. Popped slots are overwritten or expire.
+        slot_index, slot_blueprint = cache.get(f"{key}:slot:{index % settings.QUIZ_POOL_SIZE}", (None, None))
+        if slot_index == index:  # otherwise the slot is unwritten, skipped, overwritten or expired
+            blueprint = slot_blueprint
+            break
+    _incr(_stat_key("hits" if blueprint is not None else "misses"))
+    return blueprint
+
+
+def clear_quiz_pools(region_ids: list[int]) -> None:
+    """Remove the blueprints of all pools of given regions, e.g. after the species of the regions have changed."""
+    for region_ids_batch in batched(region_ids, CLEAR_BATCH_SIZE):
+        keys = []
+        for region_id, difficulty, mode, include_subregions in product(
+            region_ids_batch, Quiz.QuizDifficulty.values, Quiz.QuizMode.values, (False, True)
+        ):
+            key = _pool_key(region_id, difficulty, mode, include_subregions)
+            keys.extend([f"{key}:head", f"{key}:tail"])
+            keys.extend(f"{key}:slot:{index}" for index in range(settings.QUIZ_POOL_SIZE))
+        cache.delete_many(keys)
+
+
+def get_quiz_pool_stats() -> dict[str, int]:
+    """Get hit, miss and refill counts of all pools."""
+    stats = cache.get_many([_stat_key(stat) for stat in STAT_KEYS])
+    return {stat: stats.get(_stat_key(stat), 0) for stat in STAT_KEYS}
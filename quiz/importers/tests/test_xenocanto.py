@@ -1,11 +1,15 @@
 """Unit tests for data importing from Xeno-Canto API."""
 
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import Mock
+
 from model_bakery import baker
 import pytest
 import requests
 import responses
 
 from quiz.importers import xenocanto
+from quiz.importers.util import RateLimiter
 from quiz.models import Species, Recording, SoundType
 
 
@@ -207,6 +211,31 @@ def test_get_recordings_by_species_3():
         assert len(page["results"]) == 1  # three recordings, one on each page
 
 
+@responses.activate
+def test_get_recordings_by_species_4():
+    """With an executor, pages after the first one should be fetched concurrently and counted by the rate limiter."""
+    species = baker.prepare(Species, name_sci="Larus canus")
+    url = "https://xeno-canto.org/api/3/recordings"
+    for page in range(1, 5):
+        params = {"query": 'sp:"Larus canus" grp:birds q:A len:5-30', "key": "key"} | ({"page": page} if page > 1 else {})
+        responses.add(
+            responses.GET,
+            url=url,
+            match=[responses.matchers.query_param_matcher(params)],
+            json={"numRecordings": "4", "numPages": 4, "results": [{"id": str(page)}]}
+        )
+    rate_limiter = Mock(spec=RateLimiter)
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        results = list(xenocanto.get_recordings_by_species(
+            species=species, session=requests.Session(), api_key="key", rate_limiter=rate_limiter, executor=executor
+        ))
+
+    assert results[0]["results"] == [{"id": "1"}]  # first page comes first, the rest in the order they arrive
+    assert sorted(page["results"][0]["id"] for page in results) == ["1", "2", "3", "4"]
+    assert rate_limiter.wait.call_count == 4
+
+
 @pytest.mark.django_db
 def test_convert_to_recording_1():
     species = baker.make(Species, name_sci="Larus canus")
@@ -253,3 +282,49 @@ def test_convert_to_recording_2():
     recording = xenocanto.convert_to_recording(recording_obj, species)
 
     assert recording is None
+
+
+@responses.activate
+def test_download_audio_1(tmp_path):
+    """Audio file should be streamed to a partial file and renamed to its destination when complete."""
+    recording = baker.prepare(Recording, url="//xeno-canto.org/123")
+    responses.add(responses.GET, url="https://xeno-canto.org/123/download", body=b"audio bytes")
+    destination = tmp_path / "audio" / "XC123.mp3"
+
+    size = xenocanto.download_audio(recording, requests.Session(), destination, chunk_size=4)
+
+    assert size == 11
+    assert destination.read_bytes() == b"audio bytes"
+    assert not (tmp_path / "audio" / "XC123.mp3.part").exists()
+
+
+@responses.activate
+def test_download_audio_2(tmp_path):
+    """An interrupted download should be resumed with a Range request."""
+    recording = baker.prepare(Recording, url="//xeno-canto.org/123")
+    responses.add(
+        responses.GET,
+        url="https://xeno-canto.org/123/download",
+        match=[responses.matchers.header_matcher({"Range": "bytes=6-"})],
+        status=206,
+        body=b"bytes"
+    )
+    destination = tmp_path / "XC123.mp3"
+    (tmp_path / "XC123.mp3.part").write_bytes(b"audio ")
+
+    xenocanto.download_audio(recording, requests.Session(), destination)
+
+    assert destination.read_bytes() == b"audio bytes"
+
+
+@responses.activate
+def test_download_audio_3(tmp_path):
+    """If the server ignores the Range header, the partial file should be overwritten with the whole file."""
+    recording = baker.prepare(Recording, url="//xeno-canto.org/123")
+    responses.add(responses.GET, url="https://xeno-canto.org/123/download", body=b"audio bytes")
+    destination = tmp_path / "XC123.mp3"
+    (tmp_path / "XC123.mp3.part").write_bytes(b"audio ")
+
+    xenocanto.download_audio(recording, requests.Session(), destination)
+
+    assert destination.read_bytes() == b"audio bytes"
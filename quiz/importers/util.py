@@ -1,13 +1,19 @@
+import threading
+import time
+from urllib.parse import urlsplit
+
 import requests
 from requests.adapters import HTTPAdapter
 from urllib3.util import Retry
 
 
-def get_retry_request_session(retries: int = 5) -> requests.Session:
+def get_retry_request_session(retries: int = 5, pool_size: int = 10) -> requests.Session:
     """
     Creates a request session that retries failed requests.
 
     :param retries: Maximum number of retries for a request.
+    :param pool_size: Maximum number of connections kept open per host, should match the number of threads using the
+        session.
     :returns session: Request session with retry strategy.
     """
 
@@ -16,8 +22,45 @@ def get_retry_request_session(retries: int = 5) -> requests.Session:
         status_forcelist=[408, 429, 500, 502, 503, 504],
         backoff_factor=1
     )
-    adapter = HTTPAdapter(max_retries=retry_strategy)
+    adapter = HTTPAdapter(max_retries=retry_strategy, pool_connections=pool_size, pool_maxsize=pool_size)
     session = requests.Session()
     session.mount("http://", adapter)
     session.mount("https://", adapter)
     return session
+
+
+_thread_local = threading.local()
+
+
+def get_thread_session() -> requests.Session:
+    """Request sessions aren't thread-safe, so each worker thread gets a retrying session of its own."""
+    if not hasattr(_thread_local, "session"):
+        _thread_local.session = get_retry_request_session(pool_size=1)
+    return _thread_local.session
+
+
+class RateLimiter:
+    """
+    Thread-safe rate limiter that spaces out requests to each host evenly.
+    Threads reserve the next free time slot of a host and sleep until it without holding the lock.
+    """
+
+    def __init__(self, requests_per_second: float):
+        """
+        :param requests_per_second: Maximum request rate per host, 0 for no limit.
+        """
+        self.interval = 1 / requests_per_second if requests_per_second > 0 else 0
+        self._next_slots = {}
+        self._lock = threading.Lock()
+
+    def wait(self, url: str) -> None:
+        """Block until a request to the host of a URL can be made."""
+        if not self.interval:
+            return
+        host = urlsplit(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slots.get(host, now))
+            self._next_slots[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
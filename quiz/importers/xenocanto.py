@@ -1,13 +1,21 @@
 from collections.abc import Iterator
+from concurrent.futures import Executor, as_completed
+from datetime import date
+import os
 import re
 import pathlib
 
 from django.core.exceptions import ValidationError
 import requests
 
+from quiz.importers.util import RateLimiter, get_thread_session
 from quiz.models import Recording, SoundType, Species
 
 
+RECORDINGS_API_URL = "https://xeno-canto.org/api/3/recordings"
+DOWNLOAD_TIMEOUT = (10, 60)  # seconds to connect and between received bytes
+
+
 SOUND_TYPE_MAPPING = {
     "song": SoundType.SONG,
     "dawn song": SoundType.SONG,
@@ -25,7 +33,36 @@ SOUND_TYPE_MAPPING = {
 }
 
 
-def get_recordings_by_species(species: Species, session: requests.Session, api_key: str) -> Iterator[dict]:
+def get_recordings_page(
+    session: requests.Session,
+    params: dict,
+    page: int = 1,
+    rate_limiter: RateLimiter | None = None
+) -> dict:
+    """
+    Fetches a page of recording metadata from Xeno-Canto API.
+
+    :param session: Request session.
+    :param params: Query parameters of the API request.
+    :param page: Number of the page.
+    :param rate_limiter: Rate limiter shared by all threads making requests to Xeno-Canto.
+    :return: Xeno-Canto response dict.
+    """
+    if page > 1:
+        params = {**params, "page": page}
+    if rate_limiter is not None:
+        rate_limiter.wait(RECORDINGS_API_URL)
+    return session.get(RECORDINGS_API_URL, params=params).json()
+
+
+def get_recordings_by_species(
+    species: Species,
+    session: requests.Session,
+    api_key: str,
+    rate_limiter: RateLimiter | None = None,
+    executor: Executor | None = None,
+    since: date | None = None
+) -> Iterator[dict]:
     """
     Fetches metadata of bird call audio recordings for given species from Xeno-Canto API.
     Query filters used in API request:
@@ -33,29 +70,45 @@ def get_recordings_by_species(species: Species, session: requests.Session, api_k
         - only match recordings of birds
         - minimum recording quality A (best quality)
         - length between 5 and 30 seconds
+        - optionally, uploaded on or after a date
 
     :param species:  Species object with scientific and English names.
     :param session:  Request session.
     :param api_key:  Xeno-Canto API key.
+    :param rate_limiter: Rate limiter shared by all threads making requests to Xeno-Canto.
+    :param executor: If given, the pages after the first one are fetched concurrently in its threads, each thread with
+        a session of its own. Pages are then yielded in the order they arrive.
+    :param since: Only fetch recordings uploaded on or after this date.
     :return: Iterator that contains Xeno-Canto response dicts.
     """
-    url = "https://xeno-canto.org/api/3/recordings"
+    filters = "grp:birds q:A len:5-30" + (f" since:{since.isoformat()}" if since else "")
     params = {
-        "query": f'sp:"{species.name_sci}" grp:birds q:A len:5-30',
+        "query": f'sp:"{species.name_sci}" {filters}',
         "key": api_key
     }
-    first_page = session.get(url, params=params).json()
+    first_page = get_recordings_page(session, params, rate_limiter=rate_limiter)
     if first_page["numRecordings"] == "0":  # on empty result, try querying with English name
         params = {
-            "query": f'en:"={species.name_en}" grp:birds q:A len:5-30',
+            "query": f'en:"={species.name_en}" {filters}',
             "key": api_key
         }
-        first_page = session.get(url, params=params).json()
+        first_page = get_recordings_page(session, params, rate_limiter=rate_limiter)
     yield first_page
     num_pages = first_page['numPages']
-    for page in range(2, num_pages + 1):
-        next_page = session.get(url, params={**params, 'page': page}).json()
-        yield next_page
+    if executor is None:
+        for page in range(2, num_pages + 1):
+            yield get_recordings_page(session, params, page, rate_limiter)
+        return
+    futures = [
+        executor.submit(lambda page: get_recordings_page(get_thread_session(), params, page, rate_limiter), page)
+        for page in range(2, num_pages + 1)
+    ]
+    try:
+        for future in as_completed(futures):
+            yield future.result()
+    finally:  # stop fetching if a page fails or the caller stops early
+        for future in futures:
+            future.cancel()
 
 
 def extract_license_type(license_url: str) -> str:
@@ -132,23 +185,49 @@ def convert_to_recording(recording_obj: dict, species: Species) -> Recording | N
         audio=file_name
     )
     try:
-        recording.clean_fields()
+        recording.clean_fields(exclude=["species"])  # species exists, validating it would query the database
     except ValidationError:
         return
     return recording
 
 
-def download_audio(recording: Recording, session: requests.Session) -> bytes:
+def download_audio(
+    recording: Recording,
+    session: requests.Session,
+    destination: pathlib.Path,
+    rate_limiter: RateLimiter | None = None,
+    chunk_size: int = 64 * 1024
+) -> int:
     """
     Downloads an audio file of a recording object from Xeno-Canto.
+    The file is streamed in chunks to a ".part" file next to the destination, which is renamed to the destination
+    once the download is complete. If a partial file exists from an interrupted download, the download is resumed
+    with an HTTP Range request.
 
     :param recording: Recording object for which an audio file is downloaded.
     :param session: Request session.
-    :return audio: Audio file bytes.
+    :param destination: Path of the downloaded file.
+    :param rate_limiter: Optional rate limiter shared by concurrent downloads.
+    :param chunk_size: Number of bytes written at a time.
+    :return size: Size of the downloaded file in bytes.
     :raises: HTTPError if request fails.
     """
     download_url = f"https:{recording.url}/download"
-    response = session.get(download_url)
-    response.raise_for_status()
-    audio = response.content
-    return audio
+    partial_path = destination.with_name(f"{destination.name}.part")
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    offset = partial_path.stat().st_size if partial_path.exists() else 0
+    headers = {"Range": f"bytes={offset}-"} if offset else {}
+    if rate_limiter is not None:
+        rate_limiter.wait(download_url)
+    with session.get(download_url, headers=headers, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+        if response.status_code == 416:  # partial file doesn't match the file anymore, start over
+            partial_path.unlink()
+            return download_audio(recording, session, destination, rate_limiter, chunk_size)
+        response.raise_for_status()
+        # The server may ignore the Range header and send the whole file
+        mode = "ab" if response.status_code == 206 else "wb"
+        with open(partial_path, mode) as f_out:
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                f_out.write(chunk)
+    os.replace(partial_path, destination)
+    return destination.stat().st_size
@@ -0,0 +1,256 @@
+"""
+Daily, weekly and all-time leaderboards of the best quizzes of logged-in users, globally and per region.
+
+Ranking quizzes on every page view would scan the Quiz table, so each leaderboard is kept as a top-K rollup instead:
+when a user finishes a quiz, it's added to every leaderboard it belongs to if it beats the user's current entry and,
+when the leaderboard is cached and full, its lowest ranked entry. Reading a leaderboard is then a single cache read,
+or one indexed query of at most LEADERBOARD_SIZE rows on a cache miss.
+
+Only full-length quizzes of a known difficulty are ranked. Their recordings, difficulty and mode come from the signed
+quiz token of the quiz page (see quiz.tokens), so users can't pick them when submitting results.
+
+Leaderboards may grow past their size while they aren't cached, and boards of past days and weeks are never read
+again. The compact_leaderboards command trims leaderboards back to their size and drops boards of past periods.
+"""
+
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import NamedTuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from quiz.models import LeaderboardEntry, Quiz
+from quiz.services import QUIZ_LENGTH
+
+
+Period = LeaderboardEntry.Period
+DIFFICULTY_POINTS = {
+    Quiz.QuizDifficulty.BEGINNER: 1,
+    Quiz.QuizDifficulty.NORMAL: 2,
+    Quiz.QuizDifficulty.HARD: 3
+}
+ENTRY_FIELDS = ["quiz_id", "points", "score", "length", "difficulty", "finished_at"]
+
+
+class Board(NamedTuple):
+    key: str
+    period: str
+    period_start: date | None
+    region_id: int | None
+
+
+class LeaderboardRow(NamedTuple):
+    rank: int
+    user_id: int
+    username: str
+    points: int
+    score: int
+    length: int
+    difficulty: str
+    finished_at: datetime
+
+
+def get_points(score: int, difficulty: str) -> int:
+    """Leaderboard points of a quiz: correct answers weighted by difficulty, so harder quizzes rank first."""
+    return score * DIFFICULTY_POINTS[difficulty]
+
+
+def is_ranked(quiz: Quiz) -> bool:
+    """Check if a quiz can be ranked: it's a full-length quiz of a logged-in user with a known difficulty."""
+    return quiz.user_id is not None and quiz.length == QUIZ_LENGTH and quiz.difficulty in DIFFICULTY_POINTS
+
+
+def get_period_start(period: str, when: datetime) -> date | None:
+    """First day of the day or week (starting on Monday) that `when` falls on, or None for the all-time period."""
+    day = timezone.localdate(when)
+    match period:
+        case Period.DAY:
+            return day
+        case Period.WEEK:
+            return day - timedelta(days=day.weekday())
+        case Period.ALL_TIME:
+            return None
+        case _:
+            raise ValueError(f"Unknown leaderboard period: {period}")
+
+
+def get_board(period: str, when: datetime, region_id: int | None = None) -> Board:
+    """
+    Get the leaderboard of a period and region.
+
+    :param period: One of LeaderboardEntry.Period values.
+    :param when: Any time within the period.
+    :param region_id: ID of the region, or None for the global leaderboard.
+    :return board: Leaderboard with a key such as "week:2025-06-02:12" or "all::".
+    """
+    period_start = get_period_start(period, when)
+    key = f"{period}:{period_start.isoformat() if period_start else ''}:{region_id or ''}"
+    return Board(key, period, period_start, region_id)
+
+
+def get_quiz_boards(finished_at: datetime, region_id: int | None) -> list[Board]:
+    """Get the global and regional leaderboards of every period that a quiz finished at a given time belongs to."""
+    region_ids = [None] if region_id is None else [None, region_id]
+    return [get_board(period, finished_at, reg_id) for period in Period for reg_id in region_ids]
+
+
+def _cache_key(board_key: str) -> str:
+    return f"leaderboard:{board_key}"
+
+
+def invalidate_leaderboards(board_keys) -> None:
+    """Remove cached leaderboards."""
+    cache.delete_many([_cache_key(key) for key in board_keys])
+
+
+def get_leaderboard(period: str, region_id: int | None = None) -> list[LeaderboardRow]:
+    """
+    Get the current top entries of a leaderboard, best first. Equal points are ranked by who got them first.
+
+    :param period: One of LeaderboardEntry.Period values.
+    :param region_id: ID of the region, or None for the global leaderboard.
+    :return rows: At most LEADERBOARD_SIZE rows.
+    """
+    board = get_board(period, timezone.now(), region_id)
+    rows = cache.get(_cache_key(board.key))
+    if rows is None:
+        entries = (
+            LeaderboardEntry.objects
+            .filter(board=board.key)
+            .order_by("-points", "finished_at")
+            .values_list("user_id", "user__username", "points", "score", "length", "difficulty", "finished_at")
+        )[:settings.LEADERBOARD_SIZE]
+        rows = [LeaderboardRow(rank, *entry) for rank, entry in enumerate(entries, start=1)]
+        cache.set(_cache_key(board.key), rows, timeout=settings.LEADERBOARD_CACHE_TIMEOUT)
+    return rows
+
+
+def _make_entry(board: Board, quiz: Quiz, points: int) -> LeaderboardEntry:
+    return LeaderboardEntry(
+        board=board.key,
+        period=board.period,
+        period_start=board.period_start,
+        region_id=board.region_id,
+        user_id=quiz.user_id,
+        quiz_id=quiz.id,
+        points=points,
+        score=quiz.score,
+        length=quiz.length,
+        difficulty=quiz.difficulty,
+        finished_at=quiz.finished_at
+    )
+
+
+def record_quiz(quiz: Quiz) -> None:
+    """
+    Add a finished quiz to the leaderboards it belongs to, if it's the user's best quiz on them.
+
+    :param quiz: Saved quiz.
+    """
+    if not is_ranked(quiz):
+        return
+    points = get_points(quiz.score, quiz.difficulty)
+    if not points:
+        return
+    boards = {board.key: board for board in get_quiz_boards(quiz.finished_at, quiz.region_id)}
+    # Cached boards tell without a query whether the quiz is good enough for them
+    cached_boards = cache.get_many([_cache_key(key) for key in boards])
+    for key in list(boards):
+        rows = cached_boards.get(_cache_key(key))
+        if rows is not None and len(rows) >= settings.LEADERBOARD_SIZE and points <= rows[-1].points:
+            del boards[key]
+    if not boards:
+        return
+    with transaction.atomic():
+        entries = {
+            entry.board: entry
+            for entry in LeaderboardEntry.objects.select_for_update().filter(board__in=boards, user_id=quiz.user_id)
+        }
+        new_entries = []
+        updated_entries = []
+        for key, board in boards.items():
+            entry = entries.get(key)
+            if entry is None:
+                new_entries.append(_make_entry(board, quiz, points))
+            elif points > entry.points:
+                updated_entry = _make_entry(board, quiz, points)
+                updated_entry.id = entry.id
+                updated_entries.append(updated_entry)
+        LeaderboardEntry.objects.bulk_update(updated_entries, ENTRY_FIELDS)
+        # A concurrent quiz of the same user may have just created an entry, losing this one is better than failing
+        LeaderboardEntry.objects.bulk_create(new_entries, ignore_conflicts=True)
+        changed_boards = [entry.board for entry in new_entries + updated_entries]
+        if changed_boards:
+            transaction.on_commit(lambda: invalidate_leaderboards(changed_boards))
+
+
+def compact_leaderboards(now: datetime | None = None) -> tuple[int, int]:
+    """
+    Delete leaderboards of past days and weeks and trim the remaining leaderboards to LEADERBOARD_SIZE entries.
+
+    :param now: Current time, defaults to timezone.now().
+    :return: Tuple of (number of expired entries deleted, number of entries trimmed).
+    """
+    now = now or timezone.now()
+    expired = LeaderboardEntry.objects.none()
+    for period in (Period.DAY, Period.WEEK):
+        expired |= LeaderboardEntry.objects.filter(period=period, period_start__lt=get_period_start(period, now))
+    num_expired, _ = expired.delete()
+    num_trimmed = 0
+    full_boards = (
+        LeaderboardEntry.objects
+        .values("board")
+        .annotate(num_entries=Count("id"))
+        .filter(num_entries__gt=settings.LEADERBOARD_SIZE)
+        .values_list("board", flat=True)
+    )
+    for board_key in full_boards:
+        entries = LeaderboardEntry.objects.filter(board=board_key)
+        top_ids = list(
+            entries.order_by("-points", "finished_at").values_list("id", flat=True)[:settings.LEADERBOARD_SIZE]
+        )
+        num_deleted, _ = entries.exclude(id__in=top_ids).delete()
+        num_trimmed += num_deleted
+    return num_expired, num_trimmed
+
+
+def rebuild_leaderboards(now: datetime | None = None) -> int:
+    """
+    Rebuild all current leaderboards from the Quiz table, e.g. after quiz results have been regraded.
+    Quizzes are streamed once and only the best quiz of each user per leaderboard is kept in memory.
+
+    :param now: Current time, defaults to timezone.now().
+    :return: Number of leaderboard entries created.
+    """
+    now = now or timezone.now()
+    current_starts = {period: get_period_start(period, now) for period in Period}
+    best = defaultdict(dict)  # board key -> user ID -> best entry
+    quizzes = (
+        Quiz.objects
+        .filter(user__isnull=False, length=QUIZ_LENGTH, difficulty__in=DIFFICULTY_POINTS, score__gt=0)
+        .only("id", "user_id", "region_id", "difficulty", "score", "length", "finished_at")
+        .iterator(chunk_size=5000)
+    )
+    for quiz in quizzes:
+        points = get_points(quiz.score, quiz.difficulty)
+        for board in get_quiz_boards(quiz.finished_at, quiz.region_id):
+            if board.period_start != current_starts[board.period]:
+                continue
+            entry = best[board.key].get(quiz.user_id)
+            # Quizzes aren't streamed in order, so of equally good quizzes the earliest one is kept
+            if entry is None or (-points, quiz.finished_at) < (-entry.points, entry.finished_at):
+                best[board.key][quiz.user_id] = _make_entry(board, quiz, points)
+    entries = []
+    for board_entries in best.values():
+        ranked = sorted(board_entries.values(), key=lambda entry: (-entry.points, entry.finished_at))
+        entries.extend(ranked[:settings.LEADERBOARD_SIZE])
+    with transaction.atomic():
+        old_boards = list(LeaderboardEntry.objects.values_list("board", flat=True).distinct())
+        LeaderboardEntry.objects.all().delete()
+        LeaderboardEntry.objects.bulk_create(entries, batch_size=1000)
+    invalidate_leaderboards({*old_boards, *best})
+    return len(entries)
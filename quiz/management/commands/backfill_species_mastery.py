@@ -0,0 +1,71 @@
+"""Command for rebuilding per-user species mastery from answer history"""
+
+from itertools import batched
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from quiz.models import Answer, Quiz, SpeciesMastery
+
+
+def backfill_users(user_ids: tuple[int, ...]) -> int:
+    """
+    Rebuild the species mastery rows of users by replaying their answers in chronological order.
+
+    :param user_ids: IDs of the users.
+    :return: Number of answers replayed.
+    """
+    answers = (
+        Answer.objects
+        .filter(quiz__user_id__in=user_ids, recording__isnull=False)
+        .order_by("quiz__finished_at", "id")
+        .values_list("quiz__user_id", "recording__species_id", "is_correct", "quiz__finished_at")
+    )
+    masteries = {}
+    num_answers = 0
+    for user_id, species_id, is_correct, finished_at in answers.iterator(chunk_size=5000):
+        mastery = masteries.get((user_id, species_id))
+        if mastery is None:
+            mastery = SpeciesMastery(user_id=user_id, species_id=species_id, last_seen=finished_at)
+            masteries[(user_id, species_id)] = mastery
+        mastery.record_answer(is_correct, finished_at)
+        num_answers += 1
+    with transaction.atomic():
+        SpeciesMastery.objects.filter(user_id__in=user_ids).delete()
+        SpeciesMastery.objects.bulk_create(masteries.values(), batch_size=1000)
+    return num_answers
+
+
+class Command(BaseCommand):
+    help = "Rebuild per-user species mastery from the answers of all finished quizzes"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "-c", "--chunk-size",
+            type=int,
+            default=100,
+            help="Number of users whose answers are loaded and saved at a time (default: %(default)s)"
+        )
+
+    def handle(self, *args, **kwargs):
+        user_ids = (
+            Quiz.objects
+            .filter(user__isnull=False)
+            .order_by("user_id")
+            .values_list("user_id", flat=True)
+            .distinct()
+            .iterator(chunk_size=kwargs["chunk_size"])
+        )
+        started_at = time.perf_counter()
+        num_users = num_answers = 0
+        for chunk in batched(user_ids, kwargs["chunk_size"]):
+            num_answers += backfill_users(chunk)
+            num_users += len(chunk)
+            self.stdout.write(
+                f"{num_users} users, {num_answers} answers "
+                f"({num_answers / (time.perf_counter() - started_at):.0f} answers/s)"
+            )
+        self.stdout.write(
+            self.style.SUCCESS(f"Successfully rebuilt species mastery of {num_users} users from {num_answers} answers.")
+        )
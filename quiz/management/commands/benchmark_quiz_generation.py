@@ -0,0 +1,156 @@
+"""Command for benchmarking quiz generation queries"""
+
+from collections import defaultdict
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, reset_queries, transaction
+from django.test.utils import CaptureQueriesContext
+
+from quiz.models import Observation, Recording, Region, RegionQuizPool, Species
+from quiz.services import QUIZ_LENGTH, get_quiz_multiple_choices, get_quiz_recordings, get_species_by_region
+
+
+def legacy_multiple_choices(quiz_species, available_species):
+    """Previous implementation: one randomly ordered query per quiz question."""
+    options = {}
+    for sp in quiz_species:
+        choice_species_names = list(
+            available_species.exclude(id=sp.id).order_by("?").values_list("name", flat=True)
+        )[:3]
+        choice_species_names.append(sp.name)
+        random.shuffle(choice_species_names)
+        options[sp.id] = choice_species_names
+    return options
+
+
+def current_multiple_choices(quiz_species, available_species):
+    return get_quiz_multiple_choices(quiz_species, available_species, num_choices=3, mode="random")
+
+
+def legacy_quiz_recordings(quiz_species, available_species):
+    """Previous implementation: load all recording IDs of the species and pick one per species in Python."""
+    species_ids = [sp.id for sp in quiz_species]
+    candidate_recordings = Recording.objects.filter(species_id__in=species_ids).values_list("species_id", "id")
+    recordings_by_species = defaultdict(list)
+    for sp_id, rec_id in candidate_recordings:
+        recordings_by_species[sp_id].append(rec_id)
+    selected_recording_ids = [random.choice(recs) for recs in recordings_by_species.values()]
+    return list(Recording.objects.select_related("species").filter(id__in=selected_recording_ids))
+
+
+def current_quiz_recordings(quiz_species, available_species):
+    return list(get_quiz_recordings(quiz_species))
+
+
+BENCHMARKS = {
+    "choices": {
+        "legacy": legacy_multiple_choices,
+        "current": current_multiple_choices,
+    },
+    "recordings": {
+        "legacy": legacy_quiz_recordings,
+        "current": current_quiz_recordings,
+    },
+}
+
+
+class Command(BaseCommand):
+    help = "Benchmark quiz generation against synthetic regions. All benchmark data is rolled back afterwards."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "-t", "--target",
+            type=str,
+            choices=list(BENCHMARKS),
+            default="choices",
+            help="Which part of quiz generation to benchmark (default: %(default)s)"
+        )
+        parser.add_argument(
+            "-s", "--sizes",
+            type=int,
+            nargs="+",
+            default=[300, 3000, 10000],
+            help="Number of species in the synthetic regions (default: %(default)s)"
+        )
+        parser.add_argument(
+            "-n", "--repeats",
+            type=int,
+            default=20,
+            help="How many quizzes to generate per region size and implementation (default: %(default)s)"
+        )
+        parser.add_argument(
+            "-r", "--recordings-per-species",
+            type=int,
+            default=100,
+            help="Number of synthetic recordings per species, used by the recordings benchmark (default: %(default)s)"
+        )
+
+    def handle(self, *args, **kwargs):
+        implementations = BENCHMARKS[kwargs["target"]]
+        self.stdout.write(f"{'species':>8} {'implementation':>15} {'queries':>8} {'median ms':>10} {'max ms':>8}")
+        for size in kwargs["sizes"]:
+            with transaction.atomic():
+                region = self.create_region(size)
+                if kwargs["target"] == "recordings":
+                    self.create_recordings(region, kwargs["recordings_per_species"])
+                available_species = get_species_by_region(region.id)
+                for name, implementation in implementations.items():
+                    num_queries, timings = self.run(implementation, available_species, kwargs["repeats"])
+                    self.stdout.write(
+                        f"{size:>8} {name:>15} {num_queries:>8} "
+                        f"{statistics.median(timings):>10.1f} {max(timings):>8.1f}"
+                    )
+                transaction.set_rollback(True)
+
+    @staticmethod
+    def create_region(size: int) -> Region:
+        """Create a region with `size` pooled species. Must be called inside a transaction that is rolled back."""
+        region = Region.objects.create(code=f"BENCH-{size}", name_en=f"Benchmark region {size}")
+        species = Species.objects.bulk_create(
+            [Species(name_en=f"Benchmark bird {i}", name_sci=f"Benchmarkus {size} {i}") for i in range(size)],
+            batch_size=1000
+        )
+        Observation.objects.bulk_create([Observation(region=region, species=sp) for sp in species], batch_size=1000)
+        RegionQuizPool.objects.bulk_create(
+            [RegionQuizPool(region=region, species=sp, recording_count=1, eligible_sound_types="SNG") for sp in species],
+            batch_size=1000
+        )
+        return region
+
+    @staticmethod
+    def create_recordings(region: Region, per_species: int) -> None:
+        """Create `per_species` recordings for each pooled species of a region."""
+        species_ids = RegionQuizPool.objects.filter(region=region).values_list("species_id", flat=True)
+        recording_id = (Recording.objects.order_by("-id").values_list("id", flat=True).first() or 0) + 1
+        batch = []
+        for sp_id in species_ids:
+            for _ in range(per_species):
+                batch.append(Recording(
+                    id=recording_id,
+                    species_id=sp_id,
+                    url=f"//bench/{recording_id}",
+                    sound_type="SNG",
+                    audio=f"audio/bench/{recording_id}.mp3"
+                ))
+                recording_id += 1
+            if len(batch) >= 10000:
+                Recording.objects.bulk_create(batch, batch_size=1000)
+                batch = []
+        Recording.objects.bulk_create(batch, batch_size=1000)
+
+    @staticmethod
+    def run(implementation, available_species, repeats: int) -> tuple[int, list[float]]:
+        """Run an implementation `repeats` times, return queries per quiz and wall times in milliseconds."""
+        species_ids = list(available_species.values_list("id", flat=True))
+        timings = []
+        for _ in range(repeats):
+            quiz_species = list(Species.objects.filter(id__in=random.sample(species_ids, QUIZ_LENGTH)))
+            reset_queries()  # keep the bounded query log from overflowing after creating benchmark data
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                implementation(quiz_species, available_species)
+                timings.append((time.perf_counter() - start) * 1000)
+        return len(queries), timings
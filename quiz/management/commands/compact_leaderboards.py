@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from quiz.leaderboards import compact_leaderboards, rebuild_leaderboards
+
+
+class Command(BaseCommand):
+    help = "Drop leaderboards of past days and weeks and trim leaderboards to their size, run e.g. hourly"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rebuild",
+            action="store_true",
+            help="Rebuild current leaderboards from all quizzes instead, e.g. after quiz results have changed"
+        )
+
+    def handle(self, *args, **kwargs):
+        if kwargs["rebuild"]:
+            num_entries = rebuild_leaderboards()
+            self.stdout.write(self.style.SUCCESS(f"Successfully rebuilt leaderboards ({num_entries} entries)"))
+            return
+        num_expired, num_trimmed = compact_leaderboards()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Successfully compacted leaderboards: {num_expired} expired and {num_trimmed} trimmed entries deleted"
+            )
+        )
@@ -1,53 +1,91 @@
 """Commmand for downloading audio files of recordings"""
 
-import os
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from pathlib import Path
 
-from django.conf import settings
-from django.core.files.base import ContentFile
 from django.core.management.base import BaseCommand
 from tqdm import tqdm
 
 from quiz.importers.xenocanto import download_audio
-from quiz.importers.util import get_retry_request_session
+from quiz.importers.util import RateLimiter, get_thread_session
 from quiz.models import Recording
+from quiz.services import refresh_region_quiz_pool
+
+
+def download_recording(recording: Recording, rate_limiter: RateLimiter) -> Recording:
+    """
+    Download the audio file of a recording in a worker thread, unless the file already exists, and move it into the
+    content-addressed layout. The new storage name is set on the recording.
+    """
+    destination = Path(recording.audio.path)
+    if not destination.exists():  # a file may have been downloaded before the previous run was interrupted
+        download_audio(recording, get_thread_session(), destination, rate_limiter)
+    recording.audio.name = recording.audio.storage.store_by_content(destination, recording.audio.field.upload_to)
+    recording.downloaded = True
+    return recording
 
 
 class Command(BaseCommand):
     help = "Download audio files of recordings from Xeno-Canto."
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "-w", "--workers",
+            type=int,
+            default=8,
+            help="Number of concurrent downloads (default: %(default)s)"
+        )
+        parser.add_argument(
+            "-r", "--rate-limit",
+            type=float,
+            default=4,
+            help="Maximum number of requests per second to each host, 0 for no limit (default: %(default)s)"
+        )
+        parser.add_argument(
+            "-b", "--batch-size",
+            type=int,
+            default=500,
+            help="Number of recordings loaded and marked as downloaded at a time (default: %(default)s)"
+        )
+
     def handle(self, *args, **kwargs):
-        # TODO: multithreading
-        session = get_retry_request_session()
-        recordings = Recording.objects.all()
-        for recording in tqdm(recordings):
-            audio_path = Path(settings.MEDIA_ROOT) / recording.audio.name
-            if os.path.exists(audio_path):
-                recording.downloaded = True
-                recording.save()
-                continue  # skip files that have already been downloaded
-            try:
-                audio = download_audio(recording, session)
-            except Exception as e:
-                self.stderr.write(f"Failed to download {recording.url} with error: {repr(e)}")
-                continue
-            filename = Path(recording.audio.name).name
-            recording.audio.save(filename, ContentFile(audio), save=False)
-            recording.downloaded = True
-            recording.save()
+        self.batch_size = kwargs["batch_size"]
+        self.downloaded = []
+        recordings = Recording.objects.filter(downloaded=False)
+        rate_limiter = RateLimiter(kwargs["rate_limit"])
+        max_pending = kwargs["workers"] * 4  # bounds the number of recordings held in memory
+        pending = {}
+        try:
+            with (
+                ThreadPoolExecutor(max_workers=kwargs["workers"]) as executor,
+                tqdm(total=recordings.count()) as self.progress
+            ):
+                for recording in recordings.only("id", "url", "audio").iterator(chunk_size=self.batch_size):
+                    if len(pending) >= max_pending:
+                        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            self.collect(pending.pop(future), future)
+                    pending[executor.submit(download_recording, recording, rate_limiter)] = recording
+                for future in wait(pending).done:
+                    self.collect(pending.pop(future), future)
+        finally:
+            self.save_downloaded()  # interrupted downloads are resumed on the next run
         self.stdout.write(
             self.style.SUCCESS('Finished downloading files.')
         )
         failed = Recording.objects.filter(downloaded=False)
-        if failed:
+        num_failed = failed.count()
+        if num_failed:
             self.stdout.write(
-                self.style.NOTICE(f"Download failed for {len(failed)} rows. Drop rows? (y/n) ")
+                self.style.NOTICE(f"Download failed for {num_failed} rows. Drop rows? (y/n) ")
             )
             while True:
                 answer = input("> ").lower()
                 match answer:
                     case "y" | "yes":
+                        affected_species_ids = list(failed.values_list("species_id", flat=True).distinct())
                         dropped, _ = failed.delete()
+                        refresh_region_quiz_pool(species_ids=affected_species_ids)
                         self.stdout.write(self.style.NOTICE(f"Dropped {dropped} rows."))
                         break
                     case "n" | "no":
@@ -59,3 +97,21 @@ class Command(BaseCommand):
         self.stdout.write(
             self.style.SUCCESS('Download process finished successfully.')
         )
+
+    def collect(self, recording: Recording, future: Future) -> None:
+        """Record the result of a finished download, saving downloaded flags once a batch is full."""
+        self.progress.update()
+        try:
+            future.result()
+        except Exception as e:
+            self.stderr.write(f"Failed to download {recording.url} with error: {repr(e)}")
+            return
+        self.downloaded.append(recording)
+        if len(self.downloaded) >= self.batch_size:
+            self.save_downloaded()
+
+    def save_downloaded(self) -> None:
+        """Save the storage names of downloaded files and mark their recordings as downloaded."""
+        if self.downloaded:
+            Recording.objects.bulk_update(self.downloaded, ["audio", "downloaded"])
+            self.downloaded = []
@@ -9,6 +9,7 @@ from tqdm import tqdm
 from quiz.importers.ebird import get_species_codes_by_region
 from quiz.importers.util import get_retry_request_session
 from quiz.models import Observation, Species, Region
+from quiz.services import refresh_region_quiz_pool
 
 
 class Command(BaseCommand):
@@ -70,6 +71,7 @@ class Command(BaseCommand):
                 for sp in observed_species
             ]
             Observation.objects.bulk_create(observations, ignore_conflicts=True)
+        refresh_region_quiz_pool(region_ids=[region.id for region in regions])
 
         self.stdout.write(
             self.style.SUCCESS('Successfully populated the observation table')
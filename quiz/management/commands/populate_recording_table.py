@@ -1,14 +1,66 @@
 """Command for populating the database"""
 
+from concurrent.futures import Executor, ThreadPoolExecutor
+from datetime import timedelta
 import pathlib
+from queue import SimpleQueue
+from typing import NamedTuple
 
 from django.conf import settings
 from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
 from tqdm import tqdm
 
-from quiz.importers.util import get_retry_request_session
+from quiz.importers.util import RateLimiter, get_thread_session
 from quiz.importers.xenocanto import get_recordings_by_species, convert_to_recording
-from quiz.models import Recording, Species, Observation, Region
+from quiz.models import Recording, RecordingSyncCheckpoint, Species, Observation, Region
+from quiz.services import refresh_region_quiz_pool
+
+
+class FetchResult(NamedTuple):
+    species: Species
+    recordings: list[Recording]
+    finished: bool = False  # last result of the species, all of its recordings have been sent
+    error: Exception | None = None
+
+
+def fetch_species_recordings(
+    species: Species,
+    results: SimpleQueue,
+    page_executor: Executor,
+    rate_limiter: RateLimiter,
+    checkpoint: RecordingSyncCheckpoint | None = None
+) -> None:
+    """
+    Fetch and convert the recordings of a species in a worker thread. Each page of recordings is put into the results
+    queue as soon as it arrives, followed by a finished result. Worker threads never touch the database.
+    If a checkpoint is given, only recordings uploaded since the checkpoint are fetched.
+    """
+    since, max_recording_id = None, None
+    if checkpoint is not None:
+        # Xeno-Canto upload dates have a resolution of a day and aren't in UTC, the overlap is dropped by ID
+        since = checkpoint.synced_at.date() - timedelta(days=1)
+        max_recording_id = checkpoint.max_recording_id
+    try:
+        recording_pages = get_recordings_by_species(
+            species=species,
+            session=get_thread_session(),
+            api_key=settings.XENOCANTO_API_KEY,
+            rate_limiter=rate_limiter,
+            executor=page_executor,
+            since=since
+        )
+        for page in recording_pages:
+            rec_objs = [convert_to_recording(rec, species) for rec in page["recordings"]]
+            results.put(FetchResult(species, [
+                obj for obj in rec_objs
+                if obj is not None and (max_recording_id is None or int(obj.id) > max_recording_id)
+            ]))
+    except Exception as e:
+        results.put(FetchResult(species, [], finished=True, error=e))
+    else:
+        results.put(FetchResult(species, [], finished=True))
 
 
 class Command(BaseCommand):
@@ -33,9 +85,40 @@ class Command(BaseCommand):
             default=True,
             help="Skip recordings of species that already have recordings in the database (default: %(default)s)"
         )
+        parser.add_argument(
+            "-i", "--incremental",
+            action="store_true",
+            help=(
+                "Only fetch recordings uploaded since the last completed sync of each species, "
+                "species that have never been synced are fetched in full (ignores --skip-existing)"
+            )
+        )
+        parser.add_argument(
+            "-w", "--workers",
+            type=int,
+            default=4,
+            help="Number of species fetched at a time (default: %(default)s)"
+        )
+        parser.add_argument(
+            "-p", "--page-workers",
+            type=int,
+            default=4,
+            help="Number of result pages fetched at a time, shared by all species (default: %(default)s)"
+        )
+        parser.add_argument(
+            "--rate-limit",
+            type=float,
+            default=2,
+            help="Maximum number of requests per second to xeno-canto, 0 for no limit (default: %(default)s)"
+        )
+        parser.add_argument(
+            "-b", "--batch-size",
+            type=int,
+            default=2000,
+            help="Number of recordings inserted at a time (default: %(default)s)"
+        )
 
     def handle(self, *args, **kwargs):
-        session = get_retry_request_session()
         region_provided = kwargs.get("region") or kwargs.get("region_file")
         if not region_provided:
             self.stdout.write(
@@ -74,19 +157,117 @@ class Command(BaseCommand):
             )
             return
         observed_species = Species.objects.filter(id__in=observed_species_ids)
-        if kwargs["skip_existing"]:
+        checkpoints = {}
+        if kwargs["incremental"]:
+            checkpoints = RecordingSyncCheckpoint.objects.in_bulk(list(observed_species_ids))
+        elif kwargs["skip_existing"]:
             observed_species = observed_species.filter(recording__isnull=True).distinct()
-        for species in tqdm(observed_species):
-            recording_pages = get_recordings_by_species(species=species, session=session, api_key=settings.XENOCANTO_API_KEY)
-            for page in recording_pages:
-                batch = page["recordings"]
-                rec_objs = [convert_to_recording(rec, species) for rec in batch]
-                valid_rec_objs = [obj for obj in rec_objs if obj is not None]
-                Recording.objects.bulk_create(
-                    valid_rec_objs,
-                    ignore_conflicts=True  # silently ignores recordings already found in the db
-                )
+        self.import_recordings(list(observed_species), checkpoints, **kwargs)
 
         self.stdout.write(
             self.style.SUCCESS('Successfully populated the recording table')
         )
+
+    def import_recordings(
+        self,
+        species_list: list[Species],
+        checkpoints: dict[int, RecordingSyncCheckpoint],
+        **kwargs
+    ) -> None:
+        """
+        Fetch recordings of species concurrently and insert them in large batches.
+        Species are fetched by a pool of worker threads, and the remaining pages of a species are fetched by a second
+        pool once its first page has arrived. All requests share one rate limit. Converted recordings are sent back
+        through a queue to this thread, the only one that writes to the database.
+
+        Once all recordings of a species have been fetched, its checkpoint is saved in the same transaction as its last
+        recordings. If the import is interrupted, species that were completed are only fetched incrementally on the
+        next incremental run, and the others are fetched again from their previous checkpoints.
+
+        :param species_list: Species whose recordings are fetched.
+        :param checkpoints: Checkpoints by species ID, species with a checkpoint are only fetched incrementally.
+        """
+        self.started_at = timezone.now()  # recordings uploaded during the import are fetched again on the next sync
+        self.batch_size = kwargs["batch_size"]
+        self.batch = []
+        self.finished_species_ids = []
+        self.finished_checkpoints = []
+        self.max_recording_ids = {
+            species_id: checkpoint.max_recording_id for species_id, checkpoint in checkpoints.items()
+        }
+        rate_limiter = RateLimiter(kwargs["rate_limit"])
+        results = SimpleQueue()  # fetching is rate-limited, so the queue stays short
+        species_executor = ThreadPoolExecutor(max_workers=kwargs["workers"])
+        page_executor = ThreadPoolExecutor(max_workers=kwargs["page_workers"])
+        try:
+            for species in species_list:
+                species_executor.submit(
+                    fetch_species_recordings, species, results, page_executor, rate_limiter, checkpoints.get(species.id)
+                )
+            with tqdm(total=len(species_list)) as progress:
+                num_remaining = len(species_list)
+                while num_remaining:
+                    if self.collect(results.get()):
+                        num_remaining -= 1
+                        progress.update()
+                    if len(self.batch) >= self.batch_size:
+                        self.save_batch()
+        finally:
+            # After an interrupt, don't wait for species that are still being fetched: they aren't checkpointed and are
+            # fetched again on the next run. Only the results that have already arrived are saved.
+            species_executor.shutdown(wait=False, cancel_futures=True)
+            page_executor.shutdown(wait=False, cancel_futures=True)
+            while not results.empty():
+                self.collect(results.get_nowait())
+            self.save_batch()
+
+    def collect(self, result: FetchResult) -> bool:
+        """
+        Add the recordings of a fetch result to the batch, and the checkpoint of its species if the species is finished.
+
+        :return: True if the result was the last one of its species.
+        """
+        species_id = result.species.id
+        self.batch.extend(result.recordings)
+        if result.recordings:
+            self.max_recording_ids[species_id] = max(
+                self.max_recording_ids.get(species_id) or 0, *(int(obj.id) for obj in result.recordings)
+            )
+        if not result.finished:
+            return False
+        if result.error is not None:  # not checkpointed, so the species is fetched again next time
+            name = result.species.name_sci
+            self.stderr.write(f"Failed to fetch recordings of {name} with error: {repr(result.error)}")
+        else:
+            self.finished_checkpoints.append(RecordingSyncCheckpoint(
+                species_id=species_id,
+                synced_at=self.started_at,
+                max_recording_id=self.max_recording_ids.get(species_id)
+            ))
+        self.finished_species_ids.append(species_id)
+        return True
+
+    def save_batch(self) -> None:
+        """
+        Insert fetched recordings together with the checkpoints of species whose recordings have all been fetched, and
+        refresh the quiz pool of those species.
+        """
+        with transaction.atomic():
+            if self.batch:
+                Recording.objects.bulk_create(
+                    self.batch,
+                    batch_size=self.batch_size,
+                    ignore_conflicts=True  # silently ignores recordings already found in the db
+                )
+                self.batch = []
+            if self.finished_checkpoints:
+                RecordingSyncCheckpoint.objects.bulk_create(
+                    self.finished_checkpoints,
+                    update_conflicts=True,
+                    unique_fields=["species"],
+                    update_fields=["synced_at", "max_recording_id"]
+                )
+                self.finished_checkpoints = []
+        if self.finished_species_ids:
+            refresh_region_quiz_pool(species_ids=self.finished_species_ids)
+            self.finished_species_ids = []
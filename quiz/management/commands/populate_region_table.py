@@ -4,6 +4,7 @@ from django.core.management.base import BaseCommand
 from quiz.importers.ebird import get_regions, convert_to_region
 from quiz.importers.util import get_retry_request_session
 from quiz.models import Region
+from quiz.services import refresh_region_hierarchy
 
 
 class Command(BaseCommand):
@@ -44,6 +45,8 @@ class Command(BaseCommand):
                     "parent_region": region.parent_region
                 }
             )
+        # Renamed regions change the stored display names of their subregions
+        refresh_region_hierarchy(Region.objects.filter(code__in=[region.code for region in valid_region_objs]))
         self.stdout.write(
             self.style.SUCCESS('Successfully populated the region table')
         )
@@ -0,0 +1,82 @@
+"""Command for topping up pools of pre-generated quizzes"""
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from quiz.blueprints import get_pool_size, get_quiz_pool_stats, push_quiz_blueprint
+from quiz.models import Quiz, Region
+from quiz.services import (
+    generate_quiz_blueprint, get_quiz_regions, get_regions_requiring_subregions, get_regions_with_beginner_quiz
+)
+
+
+class Command(BaseCommand):
+    help = "Fill pools of pre-generated quizzes for every region, difficulty and mode"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "-r", "--region",
+            type=str,
+            nargs="+",
+            help="Only fill pools of selected regions (default: all regions with enough species for a quiz)"
+        )
+        parser.add_argument(
+            "-i", "--interval",
+            type=int,
+            default=None,
+            help="Keep running and refill pools every INTERVAL seconds (default: refill once and exit)"
+        )
+        parser.add_argument(
+            "--stats",
+            action="store_true",
+            help="Print pool hit, miss and refill counts and exit"
+        )
+
+    def handle(self, *args, **kwargs):
+        if kwargs["stats"]:
+            for stat, count in get_quiz_pool_stats().items():
+                self.stdout.write(f"{stat}: {count}")
+            return
+        while True:
+            num_generated = self.refill(kwargs.get("region"))
+            self.stdout.write(
+                self.style.SUCCESS(f"Successfully refilled quiz pools ({num_generated} quizzes generated)")
+            )
+            if kwargs["interval"] is None:
+                break
+            time.sleep(kwargs["interval"])
+
+    def refill(self, region_codes: list[str] | None) -> int:
+        regions = get_quiz_regions(include_subregions=True)
+        if region_codes:
+            regions = regions.filter(code__in=region_codes)
+        beginner_region_ids = set(get_regions_with_beginner_quiz())
+        subregion_quiz_region_ids = set(get_regions_requiring_subregions())
+        parent_region_ids = set(Region.objects.filter(subregions__isnull=False).values_list("id", flat=True))
+        num_generated = 0
+        for region_id in regions.values_list("id", flat=True):
+            for difficulty in Quiz.QuizDifficulty.values:
+                if difficulty == Quiz.QuizDifficulty.BEGINNER and region_id not in beginner_region_ids:
+                    continue
+                # Beginner quizzes don't use subregions, and regions without subregions have identical pools for both
+                # Quizzes of regions that require subregions always include them
+                subregion_options = [False]
+                if difficulty != Quiz.QuizDifficulty.BEGINNER and region_id in subregion_quiz_region_ids:
+                    subregion_options = [True]
+                elif difficulty != Quiz.QuizDifficulty.BEGINNER and region_id in parent_region_ids:
+                    subregion_options.append(True)
+                for mode in Quiz.QuizMode.values:
+                    for include_subregions in subregion_options:
+                        num_generated += self.refill_pool(region_id, difficulty, mode, include_subregions)
+        return num_generated
+
+    @staticmethod
+    def refill_pool(region_id: int, difficulty: str, mode: str, include_subregions: bool) -> int:
+        missing = settings.QUIZ_POOL_SIZE - get_pool_size(region_id, difficulty, mode, include_subregions)
+        for i in range(missing):
+            blueprint = generate_quiz_blueprint(region_id, difficulty, mode, include_subregions)
+            if not push_quiz_blueprint(region_id, difficulty, mode, blueprint, include_subregions):
+                return i
+        return max(missing, 0)
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from quiz.models import Region
+from quiz.services import refresh_region_quiz_pool
+
+
+class Command(BaseCommand):
+    help = "Rebuild the precomputed region quiz pool table from observations and recordings"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "-r", "--region",
+            type=str,
+            nargs="+",
+            help="Only rebuild pool rows of selected regions (default: all regions)"
+        )
+
+    def handle(self, *args, **kwargs):
+        region_ids = None
+        if kwargs.get("region"):
+            region_ids = list(Region.objects.filter(code__in=kwargs["region"]).values_list("id", flat=True))
+        num_rows = refresh_region_quiz_pool(region_ids=region_ids)
+        self.stdout.write(
+            self.style.SUCCESS(f"Successfully refreshed the quiz pool table ({num_rows} rows)")
+        )
@@ -0,0 +1,108 @@
+"""Command for moving downloaded audio files into the content-addressed, sharded layout"""
+
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+import os
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from tqdm import tqdm
+
+from quiz.audio import CONTENT_ADDRESSED_PATTERN, is_content_addressed
+from quiz.models import Recording
+
+
+FILE_FIELDS = ("audio", "audio_opus", "audio_aac")
+
+
+def shard_recording(recording: Recording) -> list[Path]:
+    """
+    Link the audio files of a recording into the content-addressed layout in a worker thread and set their new names.
+    The original files are kept until the new names have been saved, so an interrupted run can be resumed.
+
+    :return paths: Paths of the original files.
+    """
+    paths = []
+    for field in FILE_FIELDS:
+        file = getattr(recording, field)
+        if file and not is_content_addressed(file.name):
+            path = Path(file.path)
+            file.name = file.storage.store_by_content(path, file.field.upload_to, keep_original=True)
+            paths.append(path)
+    return paths
+
+
+class Command(BaseCommand):
+    help = (
+        "Move downloaded audio files from the flat media/audio/ directory into directories sharded by content hash, "
+        "deduplicating identical files"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "-w", "--workers",
+            type=int,
+            default=os.cpu_count(),
+            help="Number of files hashed and moved at a time (default: number of CPUs)"
+        )
+        parser.add_argument(
+            "-b", "--batch-size",
+            type=int,
+            default=500,
+            help="Number of recordings loaded and saved at a time (default: %(default)s)"
+        )
+
+    def handle(self, *args, **kwargs):
+        self.batch_size = kwargs["batch_size"]
+        self.batch = []
+        self.original_paths = []
+        self.num_failed = 0
+
+        unsharded = Q()
+        for field in FILE_FIELDS:
+            unsharded |= ~Q(**{field: ""}) & ~Q(**{f"{field}__regex": CONTENT_ADDRESSED_PATTERN})
+        recordings = Recording.objects.filter(unsharded, downloaded=True)
+        # hashlib releases the GIL while hashing, so threads can hash files in parallel
+        max_pending = kwargs["workers"] * 4
+        pending = {}
+        try:
+            with (
+                ThreadPoolExecutor(max_workers=kwargs["workers"]) as executor,
+                tqdm(total=recordings.count()) as self.progress
+            ):
+                for recording in recordings.only("id", *FILE_FIELDS).iterator(chunk_size=self.batch_size):
+                    if len(pending) >= max_pending:
+                        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            self.collect(pending.pop(future), future)
+                    pending[executor.submit(shard_recording, recording)] = recording
+                for future in wait(pending).done:
+                    self.collect(pending.pop(future), future)
+        finally:
+            self.save_batch()
+        self.stdout.write(
+            self.style.SUCCESS(f"Finished moving audio files, {self.num_failed} recordings failed.")
+        )
+
+    def collect(self, recording: Recording, future: Future) -> None:
+        """Record the result of a finished move, saving storage names once a batch is full."""
+        self.progress.update()
+        try:
+            paths = future.result()
+        except Exception as e:
+            self.num_failed += 1
+            self.stderr.write(f"Failed to move audio files of recording {recording.id} with error: {repr(e)}")
+            return
+        self.batch.append(recording)
+        self.original_paths.extend(paths)
+        if len(self.batch) >= self.batch_size:
+            self.save_batch()
+
+    def save_batch(self) -> None:
+        """Save the new storage names of moved files, then remove the original files."""
+        if self.batch:
+            Recording.objects.bulk_update(self.batch, FILE_FIELDS)
+            self.batch = []
+        for path in self.original_paths:
+            path.unlink(missing_ok=True)
+        self.original_paths = []
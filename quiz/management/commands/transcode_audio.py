@@ -0,0 +1,198 @@
+"""Command for transcoding downloaded audio files into compact, loudness-normalized variants"""
+
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+import os
+from pathlib import Path
+import shutil
+import subprocess
+from typing import NamedTuple
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from tqdm import tqdm
+
+from quiz.models import Recording
+
+
+LOUDNORM_FILTER = "loudnorm=I=-16:TP=-1.5:LRA=11"  # EBU R128 loudness normalization
+TRANSCODE_TIMEOUT = 300  # seconds
+
+
+class AudioFormat(NamedTuple):
+    field: str  # Recording field of the variant, its size is stored in "{field}_size"
+    extension: str
+    codec: str
+    muxer: str
+    sample_rate: int
+    default_bitrate: str
+    extra_args: tuple[str, ...] = ()
+
+
+FORMATS = {
+    "opus": AudioFormat("audio_opus", ".ogg", "libopus", "ogg", 48000, "32k"),
+    # moov atom at the start of the file so that playback can start before the whole file has been downloaded
+    "aac": AudioFormat("audio_aac", ".m4a", "aac", "ipod", 44100, "48k", ("-movflags", "+faststart"))
+}
+
+
+def build_ffmpeg_command(
+    ffmpeg: str,
+    source: Path,
+    destination: Path,
+    audio_format: AudioFormat,
+    bitrate: str
+) -> list[str]:
+    """
+    Build an ffmpeg command that transcodes an audio file into a mono, loudness-normalized variant.
+
+    :param ffmpeg: Path of the ffmpeg binary.
+    :param source: Path of the original audio file.
+    :param destination: Path of the transcoded file.
+    :param audio_format: Format of the transcoded file.
+    :param bitrate: Target bitrate, e.g. "32k".
+    :return command: Command line arguments.
+    """
+    return [
+        ffmpeg, "-nostdin", "-hide_banner", "-loglevel", "error", "-y",
+        "-i", str(source),
+        "-vn", "-map_metadata", "-1",  # drop cover art and tags
+        "-af", LOUDNORM_FILTER,
+        "-ac", "1", "-ar", str(audio_format.sample_rate),  # loudnorm would otherwise upsample to 192 kHz
+        "-c:a", audio_format.codec, "-b:a", bitrate,
+        *audio_format.extra_args,
+        "-f", audio_format.muxer,  # the output is written to a ".part" file, so its format can't be guessed
+        str(destination)
+    ]
+
+
+def transcode_file(ffmpeg: str, source: Path, destination: Path, audio_format: AudioFormat, bitrate: str) -> int:
+    """
+    Transcode an audio file to a temporary file and rename it to its destination once complete.
+
+    :return size: Size of the transcoded file in bytes.
+    :raises RuntimeError: If ffmpeg fails.
+    """
+    partial_path = destination.with_name(f"{destination.name}.part")
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    command = build_ffmpeg_command(ffmpeg, source, partial_path, audio_format, bitrate)
+    try:
+        subprocess.run(command, check=True, capture_output=True, timeout=TRANSCODE_TIMEOUT)
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+        partial_path.unlink(missing_ok=True)
+        raise RuntimeError((e.stderr or b"").decode(errors="replace").strip() or str(e)) from e
+    os.replace(partial_path, destination)
+    return destination.stat().st_size
+
+
+def transcode_recording(
+    recording: Recording,
+    formats: list[AudioFormat],
+    ffmpeg: str,
+    bitrates: dict[str, str],
+    force: bool
+) -> Recording:
+    """
+    Transcode the missing variants of a recording in a worker thread, store them by content and set their names and
+    sizes on the recording.
+    """
+    source = Path(recording.audio.path)
+    for audio_format in formats:
+        variant = getattr(recording, audio_format.field)
+        if variant and not force:
+            continue
+        upload_to = variant.field.upload_to
+        destination = Path(variant.storage.path(f"{upload_to}/XC{recording.id}{audio_format.extension}"))
+        size = transcode_file(ffmpeg, source, destination, audio_format, bitrates[audio_format.field])
+        setattr(recording, audio_format.field, variant.storage.store_by_content(destination, upload_to))
+        setattr(recording, f"{audio_format.field}_size", size)
+    return recording
+
+
+class Command(BaseCommand):
+    help = "Transcode downloaded audio files into compact Opus and AAC variants with normalized loudness"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "-f", "--formats",
+            nargs="+",
+            choices=FORMATS,
+            default=list(FORMATS),
+            help="Variant formats to create (default: %(default)s)"
+        )
+        parser.add_argument(
+            "-w", "--workers",
+            type=int,
+            default=os.cpu_count(),
+            help="Number of ffmpeg processes run at a time (default: number of CPUs)"
+        )
+        parser.add_argument(
+            "-b", "--batch-size",
+            type=int,
+            default=500,
+            help="Number of recordings loaded and saved at a time (default: %(default)s)"
+        )
+        parser.add_argument("--opus-bitrate", default=FORMATS["opus"].default_bitrate, help="(default: %(default)s)")
+        parser.add_argument("--aac-bitrate", default=FORMATS["aac"].default_bitrate, help="(default: %(default)s)")
+        parser.add_argument("--ffmpeg", default="ffmpeg", help="Path of the ffmpeg binary (default: %(default)s)")
+        parser.add_argument("--force", action="store_true", help="Transcode variants that already exist again")
+
+    def handle(self, *args, **kwargs):
+        ffmpeg = shutil.which(kwargs["ffmpeg"])
+        if ffmpeg is None:
+            raise CommandError(f"ffmpeg binary {kwargs['ffmpeg']} not found. Please install ffmpeg or use --ffmpeg.")
+        formats = [FORMATS[name] for name in kwargs["formats"]]
+        bitrates = {FORMATS["opus"].field: kwargs["opus_bitrate"], FORMATS["aac"].field: kwargs["aac_bitrate"]}
+        self.fields = [
+            field for audio_format in formats for field in (audio_format.field, f"{audio_format.field}_size")
+        ]
+        self.batch_size = kwargs["batch_size"]
+        self.batch = []
+        self.num_failed = 0
+
+        recordings = Recording.objects.filter(downloaded=True)
+        if not kwargs["force"]:
+            missing = Q()
+            for audio_format in formats:
+                missing |= Q(**{audio_format.field: ""})
+            recordings = recordings.filter(missing)
+        # ffmpeg runs in its own processes, so threads are enough to keep every CPU busy
+        max_pending = kwargs["workers"] * 4
+        pending = {}
+        try:
+            with (
+                ThreadPoolExecutor(max_workers=kwargs["workers"]) as executor,
+                tqdm(total=recordings.count()) as self.progress
+            ):
+                for recording in recordings.only("id", "audio", *self.fields).iterator(chunk_size=self.batch_size):
+                    if len(pending) >= max_pending:
+                        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            self.collect(pending.pop(future), future)
+                    future = executor.submit(transcode_recording, recording, formats, ffmpeg, bitrates, kwargs["force"])
+                    pending[future] = recording
+                for future in wait(pending).done:
+                    self.collect(pending.pop(future), future)
+        finally:
+            self.save_batch()
+        self.stdout.write(
+            self.style.SUCCESS(f"Finished transcoding audio files, {self.num_failed} recordings failed.")
+        )
+
+    def collect(self, recording: Recording, future: Future) -> None:
+        """Record the result of a finished transcoding job, saving variants once a batch is full."""
+        self.progress.update()
+        try:
+            future.result()
+        except Exception as e:
+            self.num_failed += 1
+            self.stderr.write(f"Failed to transcode {recording.audio.name} with error: {repr(e)}")
+            return
+        self.batch.append(recording)
+        if len(self.batch) >= self.batch_size:
+            self.save_batch()
+
+    def save_batch(self) -> None:
+        """Save the variant names and sizes of transcoded recordings."""
+        if self.batch:
+            Recording.objects.bulk_update(self.batch, self.fields)
+            self.batch = []
@@ -1,28 +1,177 @@
+"""Command for regrading the answers of finished quizzes"""
+
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import batched
+import multiprocessing
+import time
+import uuid
+
+import django
 from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import QuerySet
+from django.utils import timezone
+
+from accounts.services import invalidate_user_stats
+from quiz.leaderboards import rebuild_leaderboards
+from quiz.models import Answer, Quiz, Species
+from quiz.services import grade_answer, invalidate_quiz_results
+from quiz.utils import get_accepted_answers, get_name_fields
+
+
+UPDATE_BATCH_SIZE = 1000
+
+
+def load_accepted_answers() -> dict[int, list[str]]:
+    """Load the accepted answers of every species with a single query."""
+    species = Species.objects.only("id", *get_name_fields(Species)).iterator(chunk_size=2000)
+    return {sp.id: get_accepted_answers(sp) for sp in species}
+
+
+def update_chunk(quiz_rows: tuple[tuple], accepted_answers: dict[int, list[str]]) -> tuple[int, int, int]:
+    """
+    Regrade the answers of a chunk of quizzes and save the answers and quizzes whose results have changed.
+
+    :param quiz_rows: (quiz ID, user ID, mode, score) rows of the quizzes.
+    :param accepted_answers: Mapping of species ID to its accepted answers, see load_accepted_answers.
+    :return: Tuple of (number of answers, number of changed answers, number of changed quizzes).
+    """
+    modes = {quiz_id: mode for quiz_id, _, mode, _ in quiz_rows}
+    scores = dict.fromkeys(modes, 0)
+    answers = Answer.objects.filter(quiz_id__in=modes).values_list(
+        "id", "quiz_id", "user_answer", "is_correct", "recording__species_id"
+    )
+    num_answers = 0
+    changed_answers = defaultdict(list)  # new correctness -> answer IDs
+    changed_quiz_ids = set()
+    for answer_id, quiz_id, user_answer, is_correct, species_id in answers:
+        num_answers += 1
+        if species_id is not None:  # if recording has been deleted, keep correctness as is
+            new_is_correct = grade_answer(user_answer, species_id, accepted_answers.get(species_id, []), modes[quiz_id])
+            if new_is_correct != is_correct:
+                changed_answers[new_is_correct].append(answer_id)
+                changed_quiz_ids.add(quiz_id)
+                is_correct = new_is_correct
+        scores[quiz_id] += is_correct
+    changed_scores = defaultdict(list)  # new score -> quiz IDs
+    changed_user_ids = set()
+    for quiz_id, user_id, _, score in quiz_rows:
+        if scores[quiz_id] != score:
+            changed_scores[scores[quiz_id]].append(quiz_id)
+            changed_quiz_ids.add(quiz_id)
+            if user_id is not None:
+                changed_user_ids.add(user_id)
+
+    # Changed rows are updated with one UPDATE per new value, which is much cheaper to build and run than
+    # the CASE WHEN statements of bulk_update
+    graded_at = timezone.now()
+    regraded_quiz_ids = changed_quiz_ids.difference(*changed_scores.values())  # answers changed, score didn't
+    with transaction.atomic():
+        for is_correct, answer_ids in changed_answers.items():
+            for ids in batched(answer_ids, UPDATE_BATCH_SIZE):
+                Answer.objects.filter(id__in=ids).update(is_correct=is_correct)
+        for score, quiz_ids in changed_scores.items():
+            for ids in batched(quiz_ids, UPDATE_BATCH_SIZE):
+                Quiz.objects.filter(id__in=ids).update(score=score, graded_at=graded_at)
+        for ids in batched(regraded_quiz_ids, UPDATE_BATCH_SIZE):
+            Quiz.objects.filter(id__in=ids).update(graded_at=graded_at)
+        invalidate_user_stats(changed_user_ids)
+    invalidate_quiz_results(changed_quiz_ids)
+    num_changed_answers = sum(len(answer_ids) for answer_ids in changed_answers.values())
+    num_changed_quizzes = sum(len(quiz_ids) for quiz_ids in changed_scores.values())
+    return num_answers, num_changed_answers, num_changed_quizzes
 
-from quiz.models import Quiz
-from quiz.utils import check_answer
+
+def update_quizzes(quizzes: QuerySet[Quiz], chunk_size: int):
+    """
+    Regrade quizzes chunk by chunk.
+
+    :param quizzes: Quizzes to regrade.
+    :param chunk_size: Number of quizzes loaded and saved at a time.
+    :return: Generator of (number of quizzes, answers, changed answers, changed quizzes) per chunk.
+    """
+    accepted_answers = load_accepted_answers()
+    quiz_rows = quizzes.order_by("id").values_list("id", "user_id", "mode", "score").iterator(chunk_size=chunk_size)
+    for chunk in batched(quiz_rows, chunk_size):
+        yield len(chunk), *update_chunk(chunk, accepted_answers)
+
+
+def get_id_ranges(num_ranges: int) -> list[tuple[uuid.UUID, uuid.UUID | None]]:
+    """Split the space of (random) quiz UUIDs into equally sized [start, end) ranges. The last range has no end."""
+    bounds = [uuid.UUID(int=i * 2 ** 128 // num_ranges) for i in range(num_ranges)]
+    return list(zip(bounds, [*bounds[1:], None]))
+
+
+def update_id_range(start: uuid.UUID, end: uuid.UUID | None, chunk_size: int) -> tuple[int, int, int, int]:
+    """Regrade the quizzes in an ID range in a worker process, return the totals of update_quizzes."""
+    quizzes = Quiz.objects.filter(id__gte=start)
+    if end is not None:
+        quizzes = quizzes.filter(id__lt=end)
+    totals = [0, 0, 0, 0]
+    for counts in update_quizzes(quizzes, chunk_size):
+        totals = [total + count for total, count in zip(totals, counts)]
+    return tuple(totals)
 
 
 class Command(BaseCommand):
     help = "Update quiz results after answer checking logic has changed"
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "-c", "--chunk-size",
+            type=int,
+            default=1000,
+            help="Number of quizzes loaded and saved at a time (default: %(default)s)"
+        )
+        parser.add_argument(
+            "-w", "--workers",
+            type=int,
+            default=1,
+            help="Number of worker processes, each regrading a range of quiz IDs (default: %(default)s)"
+        )
+
     def handle(self, *args, **kwargs):
-        quizzes = Quiz.objects.all()
-        for quiz in quizzes:
-            quiz_score = 0
-            answers = quiz.answers.all()
-            for answer in answers:
-                if answer.recording is None:  # if recording has been deleted, keep correctness as is
-                    continue
-                correct_species = answer.recording.species
-                is_correct = check_answer(answer.user_answer, correct_species)
-                quiz_score += is_correct
-                answer.is_correct = is_correct
-                answer.save()
-            quiz.score = quiz_score
-            quiz.save()
+        self.num_quizzes = Quiz.objects.count()
+        self.totals = [0, 0, 0, 0]
+        self.started_at = self.reported_at = time.perf_counter()
+        if kwargs["workers"] > 1:
+            # Spawned workers set up Django and open their own database connections
+            with ProcessPoolExecutor(
+                max_workers=kwargs["workers"],
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=django.setup
+            ) as executor:
+                futures = [
+                    executor.submit(update_id_range, start, end, kwargs["chunk_size"])
+                    for start, end in get_id_ranges(kwargs["workers"] * 16)  # small ranges for frequent progress
+                ]
+                for future in as_completed(futures):
+                    self.report(future.result())
+        else:
+            for counts in update_quizzes(Quiz.objects.all(), kwargs["chunk_size"]):
+                self.report(counts)
 
+        num_quizzes, num_answers, changed_answers, changed_quizzes = self.totals
+        if changed_quizzes:  # scores are updated without signals, so leaderboards are rebuilt once at the end
+            rebuild_leaderboards()
+        elapsed = time.perf_counter() - self.started_at
         self.stdout.write(
-            self.style.SUCCESS("Successfully updated quiz results.")
+            self.style.SUCCESS(
+                f"Successfully updated quiz results: {changed_answers}/{num_answers} answers and "
+                f"{changed_quizzes}/{num_quizzes} quizzes changed in {elapsed:.1f} s "
+                f"({num_answers / max(elapsed, 1e-9):.0f} answers/s)."
+            )
         )
+
+    def report(self, counts: tuple[int, int, int, int], interval: float = 1.0) -> None:
+        """Add counts of a processed chunk or ID range to the totals, and print progress at most every second."""
+        self.totals = [total + count for total, count in zip(self.totals, counts)]
+        now = time.perf_counter()
+        if now - self.reported_at >= interval:
+            self.reported_at = now
+            num_quizzes, num_answers, _, _ = self.totals
+            self.stdout.write(
+                f"{num_quizzes}/{self.num_quizzes} quizzes, {num_answers} answers "
+                f"({num_answers / (now - self.started_at):.0f} answers/s)"
+            )
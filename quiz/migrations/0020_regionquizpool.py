@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:01
+
+from collections import defaultdict
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def populate_quiz_pool(apps, schema_editor):
+    Observation = apps.get_model("quiz", "Observation")
+    Recording = apps.get_model("quiz", "Recording")
+    RegionQuizPool = apps.get_model("quiz", "RegionQuizPool")
+
+    recording_counts = defaultdict(int)
+    sound_types = defaultdict(set)
+    for species_id, sound_type in Recording.objects.values_list("species_id", "sound_type").iterator():
+        recording_counts[species_id] += 1
+        sound_types[species_id].add(sound_type)
+
+    pool_rows = [
+        RegionQuizPool(
+            region_id=region_id,
+            species_id=species_id,
+            recording_count=recording_counts[species_id],
+            eligible_sound_types=",".join(sorted(sound_types[species_id]))
+        )
+        for region_id, species_id in Observation.objects.values_list("region_id", "species_id").iterator()
+        if species_id in recording_counts
+    ]
+    RegionQuizPool.objects.bulk_create(pool_rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0019_quiz_difficulty'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RegionQuizPool',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('recording_count', models.PositiveIntegerField(verbose_name='Number of recordings of the species')),
+                ('eligible_sound_types', models.CharField(max_length=50, verbose_name='Comma-separated sound types of recordings')),
+                ('region', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='quiz_pool', to='quiz.region')),
+                ('species', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='quiz.species')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('region', 'species'), name='unique_pool_region_species')],
+            },
+        ),
+        migrations.RunPython(populate_quiz_pool, migrations.RunPython.noop),
+    ]
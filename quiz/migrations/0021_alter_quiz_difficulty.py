@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0020_regionquizpool'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='quiz',
+            name='difficulty',
+            field=models.CharField(choices=[('BGN', 'Beginner / Easy difficulty'), ('NML', 'Normal / default difficulty'), ('HRD', 'Hard difficulty, taxonomically close choices')], max_length=3),
+        ),
+    ]
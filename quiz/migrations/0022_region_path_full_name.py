@@ -0,0 +1,56 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:15
+
+from django.db import migrations, models
+
+
+def populate_hierarchy_fields(apps, schema_editor):
+    Region = apps.get_model("quiz", "Region")
+    regions = {region.id: region for region in Region.objects.all()}
+
+    def update(region):
+        if region.path:
+            return
+        parent = regions.get(region.parent_region_id)
+        if parent:
+            update(parent)
+        region.path = f"{parent.path}/{region.code}" if parent else region.code
+        for language in ("en", "fi"):
+            name = getattr(region, f"name_{language}") or region.name_en
+            parent_name = getattr(parent, f"full_name_{language}") if parent else None
+            setattr(region, f"full_name_{language}", f"{parent_name} - {name}" if parent_name else name)
+        region.full_name = region.full_name_en
+
+    for region in regions.values():
+        update(region)
+    Region.objects.bulk_update(regions.values(), ["path", "full_name", "full_name_en", "full_name_fi"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0021_alter_quiz_difficulty'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='region',
+            name='full_name',
+            field=models.CharField(default='', editable=False, max_length=255, verbose_name='Display name with parent region names'),
+        ),
+        migrations.AddField(
+            model_name='region',
+            name='full_name_en',
+            field=models.CharField(default='', editable=False, max_length=255, null=True, verbose_name='Display name with parent region names'),
+        ),
+        migrations.AddField(
+            model_name='region',
+            name='full_name_fi',
+            field=models.CharField(default='', editable=False, max_length=255, null=True, verbose_name='Display name with parent region names'),
+        ),
+        migrations.AddField(
+            model_name='region',
+            name='path',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=100, verbose_name='Codes of ancestor regions and the region separated by slashes'),
+        ),
+        migrations.RunPython(populate_hierarchy_fields, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:16
+
+from django.db import migrations, models
+
+
+def populate_subtree_rollups(apps, schema_editor):
+    Region = apps.get_model("quiz", "Region")
+    RegionQuizPool = apps.get_model("quiz", "RegionQuizPool")
+
+    region_ids = dict(Region.objects.values_list("code", "id"))
+    rollups = {}
+    direct_rows = RegionQuizPool.objects.filter(includes_subregions=False).values_list(
+        "region__path", "species_id", "recording_count", "eligible_sound_types"
+    )
+    for path, species_id, recording_count, sound_types in direct_rows.iterator():
+        for code in path.split("/"):
+            if code in region_ids:
+                rollups[(region_ids[code], species_id)] = (recording_count, sound_types)
+    RegionQuizPool.objects.bulk_create(
+        [
+            RegionQuizPool(
+                region_id=region_id,
+                species_id=species_id,
+                recording_count=recording_count,
+                eligible_sound_types=sound_types,
+                includes_subregions=True
+            )
+            for (region_id, species_id), (recording_count, sound_types) in rollups.items()
+        ],
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0022_region_path_full_name'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='regionquizpool',
+            name='unique_pool_region_species',
+        ),
+        migrations.AddField(
+            model_name='regionquizpool',
+            name='includes_subregions',
+            field=models.BooleanField(default=False, verbose_name='Subtree rollup: species observed in the region or its subregions'),
+        ),
+        migrations.AddConstraint(
+            model_name='regionquizpool',
+            constraint=models.UniqueConstraint(fields=('region', 'includes_subregions', 'species'), name='unique_pool_region_subregions_species'),
+        ),
+        migrations.RunPython(populate_subtree_rollups, migrations.RunPython.noop),
+    ]
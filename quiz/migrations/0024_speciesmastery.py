@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:32
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0023_regionquizpool_includes_subregions'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SpeciesMastery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('correct', models.PositiveIntegerField(default=0)),
+                ('last_seen', models.DateTimeField()),
+                ('ease', models.FloatField(default=2.5)),
+                ('species', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='quiz.species')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='species_mastery', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'species'), name='unique_mastery_user_species')],
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:37
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0024_speciesmastery'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeaderboardEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('board', models.CharField(max_length=40, verbose_name='Leaderboard key, e.g. "day:2025-06-01:12"')),
+                ('period', models.CharField(choices=[('day', 'Daily leaderboard'), ('week', 'Weekly leaderboard'), ('all', 'All-time leaderboard')], max_length=4)),
+                ('period_start', models.DateField(null=True, verbose_name='First day of the period, null for all-time leaderboards')),
+                ('points', models.PositiveIntegerField()),
+                ('score', models.IntegerField()),
+                ('length', models.IntegerField()),
+                ('difficulty', models.CharField(choices=[('BGN', 'Beginner / Easy difficulty'), ('NML', 'Normal / default difficulty'), ('HRD', 'Hard difficulty, taxonomically close choices')], max_length=3)),
+                ('finished_at', models.DateTimeField()),
+                ('quiz', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='quiz.quiz')),
+                ('region', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='quiz.region', verbose_name='Region, null for global leaderboards')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['board', '-points', 'finished_at'], name='leaderboard_rank_idx')],
+                'constraints': [models.UniqueConstraint(fields=('board', 'user'), name='unique_leaderboard_board_user')],
+            },
+        ),
+    ]
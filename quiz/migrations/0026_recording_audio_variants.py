@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0025_leaderboardentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recording',
+            name='audio_aac',
+            field=models.FileField(blank=True, max_length=255, upload_to='audio/aac', verbose_name='AAC variant'),
+        ),
+        migrations.AddField(
+            model_name='recording',
+            name='audio_aac_size',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='AAC variant size in bytes'),
+        ),
+        migrations.AddField(
+            model_name='recording',
+            name='audio_opus',
+            field=models.FileField(blank=True, max_length=255, upload_to='audio/opus', verbose_name='Opus variant'),
+        ),
+        migrations.AddField(
+            model_name='recording',
+            name='audio_opus_size',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Opus variant size in bytes'),
+        ),
+    ]
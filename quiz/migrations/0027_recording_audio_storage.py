@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:44
+
+import quiz.audio
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0026_recording_audio_variants'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recording',
+            name='audio',
+            field=models.FileField(max_length=255, storage=quiz.audio.AudioStorage(), unique=True, upload_to='audio'),
+        ),
+        migrations.AlterField(
+            model_name='recording',
+            name='audio_aac',
+            field=models.FileField(blank=True, max_length=255, storage=quiz.audio.AudioStorage(), upload_to='audio/aac', verbose_name='AAC variant'),
+        ),
+        migrations.AlterField(
+            model_name='recording',
+            name='audio_opus',
+            field=models.FileField(blank=True, max_length=255, storage=quiz.audio.AudioStorage(), upload_to='audio/opus', verbose_name='Opus variant'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:47
+
+import quiz.audio
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0027_recording_audio_storage'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recording',
+            name='audio',
+            field=models.FileField(max_length=255, storage=quiz.audio.AudioStorage(), upload_to='audio'),
+        ),
+    ]
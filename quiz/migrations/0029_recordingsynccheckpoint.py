@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0028_recording_audio_not_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecordingSyncCheckpoint',
+            fields=[
+                ('species', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='sync_checkpoint', serialize=False, to='quiz.species')),
+                ('synced_at', models.DateTimeField(verbose_name='Start time of the last completed sync')),
+                ('max_recording_id', models.IntegerField(null=True, verbose_name='Highest synced Xeno-Canto ID')),
+            ],
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:10
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def populate_graded_at(apps, schema_editor):
+    Quiz = apps.get_model("quiz", "Quiz")
+    Quiz.objects.update(graded_at=models.F("finished_at"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0029_recordingsynccheckpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='quiz',
+            name='graded_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now, verbose_name='When the answers were last graded'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(populate_graded_at, migrations.RunPython.noop),
+    ]
@@ -1,9 +1,11 @@
 import uuid
 
+from django.conf import settings
 from django.db import models
-from django.utils.translation import gettext_lazy as _
+from django.utils.translation import gettext_lazy as _, override
 
 from accounts.models import User
+from quiz.audio import AudioStorage
 from quiz.utils import create_region_display_name
 
 
@@ -47,8 +49,30 @@ class Recording(models.Model):
     sound_type = models.CharField(max_length=3, choices=SoundType, db_index=True)
     license = models.CharField(max_length=30, verbose_name="Creative Commons license type")
     license_url = models.CharField(max_length=255, verbose_name="Creative Commons license info URL", null=True)
-    audio = models.FileField(upload_to="audio", max_length=255, unique=True)
+    # Stored by content once downloaded (see quiz.audio), so recordings with identical payloads share a file
+    audio = models.FileField(upload_to="audio", storage=AudioStorage(), max_length=255)
     downloaded = models.BooleanField(verbose_name="Audio file downloaded", default=False)
+    audio_opus = models.FileField(
+        upload_to="audio/opus", storage=AudioStorage(), max_length=255, blank=True, verbose_name="Opus variant"
+    )
+    audio_opus_size = models.PositiveIntegerField(null=True, blank=True, verbose_name="Opus variant size in bytes")
+    audio_aac = models.FileField(
+        upload_to="audio/aac", storage=AudioStorage(), max_length=255, blank=True, verbose_name="AAC variant"
+    )
+    audio_aac_size = models.PositiveIntegerField(null=True, blank=True, verbose_name="AAC variant size in bytes")
+
+
+class RecordingSyncCheckpoint(models.Model):
+    """
+    Progress of syncing the recordings of a species from Xeno-Canto. A checkpoint is saved in the same transaction as
+    the last recordings of a completed sync, so incremental syncs only ask for recordings uploaded since then.
+    """
+    species = models.OneToOneField(Species, on_delete=models.CASCADE, primary_key=True, related_name="sync_checkpoint")
+    synced_at = models.DateTimeField(verbose_name="Start time of the last completed sync")
+    max_recording_id = models.IntegerField(null=True, verbose_name="Highest synced Xeno-Canto ID")
+
+    def __str__(self):
+        return f"Recording sync checkpoint of {self.species}"
 
 
 class Region(models.Model):
@@ -63,9 +87,36 @@ class Region(models.Model):
         related_name='subregions'
     )
 
+    path = models.CharField(max_length=100, db_index=True, editable=False, default="", verbose_name="Codes of ancestor regions and the region separated by slashes")
+    full_name = models.CharField(max_length=255, editable=False, default="", verbose_name="Display name with parent region names")
+
     @property
     def display_name(self):
-        return create_region_display_name(self)
+        return self.full_name or create_region_display_name(self)
+
+    def update_hierarchy_fields(self) -> list[str]:
+        """
+        Update the stored path and localized display names from the parent region's stored values.
+
+        :return: Names of updated fields.
+        """
+        parent = self.parent_region
+        self.path = f"{parent.path}/{self.code}" if parent else self.code
+        updated_fields = ["path"]
+        for language, _name in settings.LANGUAGES:
+            with override(language):
+                name = self.name
+                parent_name = parent.display_name if parent else None
+            field_name = f"full_name_{language}"
+            setattr(self, field_name, f"{parent_name} - {name}" if parent_name else name)
+            updated_fields.append(field_name)
+        return updated_fields
+
+    def save(self, *args, **kwargs):
+        updated_fields = self.update_hierarchy_fields()
+        if kwargs.get("update_fields") is not None:
+            kwargs["update_fields"] = {*kwargs["update_fields"], *updated_fields}
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return self.display_name
@@ -119,6 +170,26 @@ class Observation(models.Model):
         return self.OCC_TYPE_DESCRIPTIONS.get(self.type)
 
 
+class RegionQuizPool(models.Model):
+    """
+    Precomputed quiz pool: species that have been observed in a region and have at least one recording.
+    Rows are refreshed by the import commands, see quiz.services.refresh_region_quiz_pool.
+    """
+    region = models.ForeignKey(Region, on_delete=models.CASCADE, related_name="quiz_pool")
+    species = models.ForeignKey(Species, on_delete=models.CASCADE)
+    recording_count = models.PositiveIntegerField(verbose_name="Number of recordings of the species")
+    eligible_sound_types = models.CharField(max_length=50, verbose_name="Comma-separated sound types of recordings")
+    includes_subregions = models.BooleanField(default=False, verbose_name="Subtree rollup: species observed in the region or its subregions")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["region", "includes_subregions", "species"],
+                name="unique_pool_region_subregions_species"
+            )
+        ]
+
+
 class Quiz(models.Model):
     class QuizMode(models.TextChoices):
         MULTI = "MULTI", _("Multiple choice")
@@ -127,6 +198,7 @@ class Quiz(models.Model):
     class QuizDifficulty(models.TextChoices):
         BEGINNER = ("BGN", _("Beginner / Easy difficulty"))
         NORMAL = ("NML", _("Normal / default difficulty"))
+        HARD = ("HRD", _("Hard difficulty, taxonomically close choices"))
 
     id = models.UUIDField(primary_key=True, editable=False, default=uuid.uuid4)
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, default=None)
@@ -137,11 +209,24 @@ class Quiz(models.Model):
     score = models.IntegerField()
     started_at = models.DateTimeField()
     finished_at = models.DateTimeField(auto_now_add=True)
+    graded_at = models.DateTimeField(auto_now_add=True, verbose_name="When the answers were last graded")
 
     def __str__(self):
         return f"Quiz {self.id} by {self.user}"
 
 
+# Labels of quiz modes and difficulties shown in the UI, e.g. on leaderboards and stats pages
+MODE_LABELS = {
+    Quiz.QuizMode.MULTI: _("MultipleChoiceOption"),
+    Quiz.QuizMode.OPEN: _("OpenAnswerOption")
+}
+DIFFICULTY_LABELS = {
+    Quiz.QuizDifficulty.BEGINNER: _("BeginnerDifficulty"),
+    Quiz.QuizDifficulty.NORMAL: _("NormalDifficulty"),
+    Quiz.QuizDifficulty.HARD: _("HardDifficulty")
+}
+
+
 class Answer(models.Model):
     quiz = models.ForeignKey(Quiz, on_delete=models.CASCADE, related_name="answers")
     recording = models.ForeignKey(Recording, on_delete=models.SET_NULL, null=True)
@@ -152,6 +237,76 @@ class Answer(models.Model):
         return f"Answer {self.id} in Quiz {self.quiz_id}"
 
 
+class SpeciesMastery(models.Model):
+    """
+    How well a user knows a species, updated incrementally whenever the user finishes a quiz.
+    The ease factor works like in SM-2 spaced repetition: it grows with correct answers and shrinks with wrong ones,
+    so species with a low ease are the ones the user should practice.
+    """
+    DEFAULT_EASE = 2.5
+    MIN_EASE = 1.3
+    MAX_EASE = 3.0
+    CORRECT_EASE_STEP = 0.1
+    WRONG_EASE_STEP = -0.3
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="species_mastery")
+    species = models.ForeignKey(Species, on_delete=models.CASCADE)
+    attempts = models.PositiveIntegerField(default=0)
+    correct = models.PositiveIntegerField(default=0)
+    last_seen = models.DateTimeField()
+    ease = models.FloatField(default=DEFAULT_EASE)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "species"], name="unique_mastery_user_species")
+        ]
+
+    def __str__(self):
+        return f"Mastery of {self.species} by {self.user}"
+
+    def record_answer(self, is_correct: bool, seen_at) -> None:
+        """Update the mastery with an answer to a question about the species. Doesn't save the mastery."""
+        self.attempts += 1
+        self.correct += is_correct
+        self.last_seen = max(self.last_seen, seen_at) if self.last_seen else seen_at
+        step = self.CORRECT_EASE_STEP if is_correct else self.WRONG_EASE_STEP
+        self.ease = min(max(self.ease + step, self.MIN_EASE), self.MAX_EASE)
+
+
+class LeaderboardEntry(models.Model):
+    """
+    Best quiz of a user on a leaderboard, added incrementally whenever a user finishes a quiz.
+    Only the top entries of each leaderboard are kept, see quiz.leaderboards.
+    """
+    class Period(models.TextChoices):
+        DAY = "day", _("Daily leaderboard")
+        WEEK = "week", _("Weekly leaderboard")
+        ALL_TIME = "all", _("All-time leaderboard")
+
+    board = models.CharField(max_length=40, verbose_name="Leaderboard key, e.g. \"day:2025-06-01:12\"")
+    period = models.CharField(max_length=4, choices=Period)
+    period_start = models.DateField(null=True, verbose_name="First day of the period, null for all-time leaderboards")
+    region = models.ForeignKey(Region, on_delete=models.CASCADE, null=True, verbose_name="Region, null for global leaderboards")
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    quiz = models.ForeignKey(Quiz, on_delete=models.CASCADE)
+    points = models.PositiveIntegerField()
+    score = models.IntegerField()
+    length = models.IntegerField()
+    difficulty = models.CharField(max_length=3, choices=Quiz.QuizDifficulty)
+    finished_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["board", "user"], name="unique_leaderboard_board_user")
+        ]
+        indexes = [
+            models.Index(fields=["board", "-points", "finished_at"], name="leaderboard_rank_idx")
+        ]
+
+    def __str__(self):
+        return f"{self.user} on leaderboard {self.board}"
+
+
 class SpeciesListType(models.TextChoices):
     BEGINNER = ("BGN", _("List of easily recognizable species, used for regional beginner quizzes"))
 
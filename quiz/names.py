@@ -0,0 +1,140 @@
+"""
+Per-language indexes of normalized species names for typo-tolerant answer checking.
+
+An answer that is a few typos away from the correct species may still be an exact or closer match of another species
+("Common Teal" vs. "Common Tern"). To tell these apart, the answer is looked up from an index of every species name
+in each language. An index is built once per process and species catalog version: the version is a random token in
+the Django cache that is replaced whenever species change, so every worker rebuilds its indexes on the next lookup.
+
+Since an answer is only rejected when another species is strictly closer than the correct one, and at most two typos
+are tolerated, the index only needs to find names at edit distance 0 or 1. For that, each name of length L is stored
+under its first L // 2 characters and its last L - L // 2 - 1 characters. A single edit, including a transposition,
+leaves at least one of these two parts untouched, so comparing the candidates that share a part with the answer is
+enough to find every name within distance 1.
+"""
+
+from collections import defaultdict
+from enum import StrEnum
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+from quiz.models import Species
+from quiz.utils import edit_distance, get_answer_distance, normalize_answer
+
+
+CATALOG_VERSION_KEY = "species_catalog:version"
+
+
+class Verdict(StrEnum):
+    EXACT = "exact"
+    TYPO = "typo"  # a few typos away from the correct species
+    OTHER_SPECIES = "other_species"  # close to the correct species, but closer to another one
+    WRONG = "wrong"
+
+
+class SpeciesNameIndex:
+    """Index of normalized species names in one language for finding names within edit distance 1."""
+
+    def __init__(self, names: list[tuple[int, str]]):
+        """
+        :param names: (species ID, name) pairs. Names are normalized with normalize_answer.
+        """
+        self.exact = defaultdict(set)
+        self.parts = defaultdict(list)
+        for species_id, name in names:
+            name = normalize_answer(name or "")
+            if not name:
+                continue
+            self.exact[name].add(species_id)
+            for key in self._part_keys(name, len(name)):
+                self.parts[key].append((species_id, name))
+
+    def __len__(self):
+        return len(self.exact)
+
+    @staticmethod
+    def _part_keys(text: str, length: int) -> tuple[tuple, tuple]:
+        """Keys of the prefix and suffix parts of a name of the given length that `text` should share."""
+        prefix_length = length // 2
+        suffix_length = length - prefix_length - 1
+        return ("prefix", length, text[:prefix_length]), ("suffix", length, text[len(text) - suffix_length:])
+
+    def find(self, query: str, max_distance: int) -> set[int]:
+        """
+        Find species with a name within an edit distance of a query.
+
+        :param query: Normalized query string.
+        :param max_distance: Largest edit distance, 0 or 1.
+        :return species_ids: IDs of the matching species.
+        """
+        if max_distance < 0:
+            return set()
+        species_ids = set(self.exact.get(query, ()))
+        if max_distance == 0:
+            return species_ids
+        if max_distance > 1:
+            raise ValueError("SpeciesNameIndex only supports edit distances up to 1")
+        for length in (len(query) - 1, len(query), len(query) + 1):
+            if length < 1:
+                continue
+            for key in self._part_keys(query, length):
+                for species_id, name in self.parts.get(key, ()):
+                    if species_id not in species_ids and edit_distance(query, name, 1) <= 1:
+                        species_ids.add(species_id)
+        return species_ids
+
+
+_indexes: tuple[str, dict[str, SpeciesNameIndex]] | None = None
+
+
+def get_catalog_version() -> str:
+    """Get the current species catalog version, starting a new one if the cache has none (e.g. after a restart)."""
+    cache.add(CATALOG_VERSION_KEY, uuid.uuid4().hex, timeout=None)
+    return cache.get(CATALOG_VERSION_KEY)
+
+
+def invalidate_species_name_indexes() -> None:
+    """Make every process rebuild its species name indexes on the next lookup."""
+    cache.set(CATALOG_VERSION_KEY, uuid.uuid4().hex, timeout=None)
+
+
+def get_species_name_indexes() -> dict[str, SpeciesNameIndex]:
+    """
+    Get the species name indexes of all languages, building them if the species catalog has changed.
+
+    :return indexes: Mapping of language code (or "sci" for scientific names) to name index.
+    """
+    global _indexes
+    version = get_catalog_version()
+    if _indexes is None or _indexes[0] != version:
+        name_fields = [f"name_{code}" for code, _ in settings.LANGUAGES] + ["name_sci"]
+        rows = list(Species.objects.values_list("id", *name_fields))
+        indexes = {
+            field.removeprefix("name_"): SpeciesNameIndex([(row[0], row[i]) for row in rows])
+            for i, field in enumerate(name_fields, start=1)
+        }
+        _indexes = (version, indexes)
+    return _indexes[1]
+
+
+def match_answer(user_answer: str, species_id: int, accepted_answers: list[str]) -> Verdict:
+    """
+    Check an answer to a quiz question, tolerating typos unless the answer is closer to another species.
+
+    :param user_answer: Answer given by user.
+    :param species_id: ID of the correct species.
+    :param accepted_answers: Normalized names of the correct species, see quiz.utils.get_accepted_answers.
+    :return verdict: Verdict of the answer.
+    """
+    distance = get_answer_distance(user_answer, accepted_answers)
+    if distance is None:
+        return Verdict.WRONG
+    if distance == 0:
+        return Verdict.EXACT
+    answer = normalize_answer(user_answer)
+    for index in get_species_name_indexes().values():
+        if index.find(answer, distance - 1) - {species_id}:
+            return Verdict.OTHER_SPECIES
+    return Verdict.TYPO
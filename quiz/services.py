@@ -1,10 +1,32 @@
 from collections import defaultdict
+from datetime import datetime
 from enum import Enum
 import random
+from typing import NamedTuple
+from urllib.parse import urlsplit
 
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, Q, Window
+from django.db.models.functions import Random, RowNumber
 from django.db.models.query import QuerySet
+from django.utils.translation import get_language
 
-from quiz.models import Species, Recording, Region
+from quiz.blueprints import clear_quiz_pools
+from quiz.models import (
+    Answer, ListSpecies, Species, SpeciesMastery, Quiz, Recording, Region, Observation, RegionQuizPool
+)
+from quiz.names import Verdict, match_answer
+from quiz.utils import get_accepted_answers, normalize_answer
+
+
+QUIZ_LENGTH = 10
+BEGINNER_SOUND_TYPES = ("SNG", "CAL")  # beginner quizzes only use species with songs or calls
+AUDIO_VARIANT_TYPES = {  # transcoded audio variant field of Recording -> MIME type of the variant
+    "audio_opus": 'audio/ogg; codecs="opus"',
+    "audio_aac": 'audio/mp4; codecs="mp4a.40.2"'
+}
 
 
 class SelectionMode(str, Enum):
@@ -12,41 +34,287 @@ class SelectionMode(str, Enum):
     TAXONOMIC = "taxonomic"
 
 
-def get_species_by_region(region_id: int) -> QuerySet[Species]:
+class QuizResults(NamedTuple):
+    score: int
+    graded_at: datetime
+    # (user answer, correct answer, is correct, unsigned audio URL), the last two are None if the recording is deleted
+    answers: list[tuple[str, str | None, bool, str | None]]
+
+
+class AudioSource(NamedTuple):
+    url: str
+    type: str
+
+
+class RegionChoice(NamedTuple):
+    id: int
+    display_name: str
+
+
+REGION_CATALOGS = ("quiz", "observed")
+
+
+def get_species_by_region(region_id: int, include_subregions: bool = False) -> QuerySet[Species]:
     """
     Select species that have been observed in a region and have at least one recording.
 
     :param region_id: ID of the region that each selected species has to be observed in.
+    :param include_subregions: Whether to also select species that have been observed in subregions of the region.
     :returns: Query set of species from given region.
     """
     region_species = Species.objects.filter(
-        observation__region_id=region_id,
-        recording__isnull=False
-    ).distinct()
+        regionquizpool__region_id=region_id,
+        regionquizpool__includes_subregions=include_subregions
+    )
     return region_species
 
 
-def get_regions_with_beginner_quiz():
-    region_ids = list(Region.objects.filter(
-        specieslist__is_official=True,
-        specieslist__type="BGN"
-    ).values_list("id", flat=True).distinct())
+def sample_species(
+    species_set: QuerySet[Species],
+    k: int = QUIZ_LENGTH,
+    weights: dict[int, float] | None = None,
+    default_weight: float = 1.0
+) -> list[Species]:
+    """
+    Randomly select up to k species from a query set. Only IDs are loaded for sampling,
+    full species objects are loaded for the selected species only.
+
+    :param species_set: Query set of species to sample from.
+    :param k: How many species to select. If the query set has fewer species, all of them are selected.
+    :param weights: Optional mapping of species ID to a positive sampling weight, see get_mastery_weights.
+    :param default_weight: Weight of species missing from weights.
+    :return sampled_species: Selected species objects.
+    """
+    species_ids = list(species_set.values_list("id", flat=True))
+    if weights is None:
+        sampled_ids = random.sample(species_ids, min(k, len(species_ids)))
+    else:
+        # Weighted sampling without replacement (Efraimidis & Spirakis): keep the k largest random keys u^(1/w)
+        keys = {sp_id: random.random() ** (1 / weights.get(sp_id, default_weight)) for sp_id in species_ids}
+        sampled_ids = sorted(keys, key=keys.get, reverse=True)[:k]
+    sampled_species = list(Species.objects.filter(id__in=sampled_ids))
+    return sampled_species
+
+
+def refresh_region_quiz_pool(region_ids: list[int] | None = None, species_ids: list[int] | None = None) -> int:
+    """
+    Recompute rows of the precomputed region quiz pool table from observations and recordings.
+    Only pool rows within the given regions and species are refreshed, omitted arguments mean no restriction.
+    Subtree rollup rows of the given regions and their ancestor regions are refreshed as well.
+
+    :param region_ids: IDs of regions whose pool rows are refreshed.
+    :param species_ids: IDs of species whose pool rows are refreshed.
+    :return: Number of pool rows written.
+    """
+    observations = Observation.objects.all()
+    stale_rows = RegionQuizPool.objects.filter(includes_subregions=False)
+    if region_ids is not None:
+        observations = observations.filter(region_id__in=region_ids)
+        stale_rows = stale_rows.filter(region_id__in=region_ids)
+    if species_ids is not None:
+        observations = observations.filter(species_id__in=species_ids)
+        stale_rows = stale_rows.filter(species_id__in=species_ids)
+
+    recording_stats = (
+        Recording.objects
+            .filter(species_id__in=observations.values("species_id"))
+            .values_list("species_id", "sound_type")
+            .annotate(num_recordings=Count("id"))
+            .order_by()
+    )
+    recording_counts = defaultdict(int)
+    sound_types = defaultdict(set)
+    for species_id, sound_type, num_recordings in recording_stats:
+        recording_counts[species_id] += num_recordings
+        sound_types[species_id].add(sound_type)
+
+    pool_rows = [
+        RegionQuizPool(
+            region_id=region_id,
+            species_id=species_id,
+            recording_count=recording_counts[species_id],
+            eligible_sound_types=",".join(sorted(sound_types[species_id]))
+        )
+        for region_id, species_id in observations.values_list("region_id", "species_id")
+        if species_id in recording_counts
+    ]
+    with transaction.atomic():
+        if region_ids is None and species_ids is not None:
+            # Only rollups of regions where the species were or are observed, and of their ancestors, can change
+            region_ids = list({*stale_rows.values_list("region_id", flat=True), *(row.region_id for row in pool_rows)})
+        stale_rows.delete()
+        RegionQuizPool.objects.bulk_create(pool_rows, batch_size=1000)
+        num_rollup_rows, refreshed_region_ids = _refresh_subtree_rollups(region_ids, species_ids)
+    invalidate_region_catalogs()
+    clear_quiz_pools(refreshed_region_ids)  # pre-generated quizzes may use species that are no longer eligible
+    return len(pool_rows) + num_rollup_rows
+
+
+def _refresh_subtree_rollups(region_ids: list[int] | None, species_ids: list[int] | None) -> tuple[int, list[int]]:
+    """
+    Recompute subtree rollup rows of the quiz pool: for each region, species observed in the region or any of its
+    subregions. Rollups are refreshed for the given regions and all of their ancestors.
+
+    :return: Tuple of (number of rollup rows written, IDs of regions whose rollups were refreshed).
+    """
+    direct_rows = RegionQuizPool.objects.filter(includes_subregions=False)
+    stale_rows = RegionQuizPool.objects.filter(includes_subregions=True)
+    rollup_regions = Region.objects.all()
+    if region_ids is not None:
+        paths = list(Region.objects.filter(id__in=region_ids).values_list("path", flat=True))
+        rollup_regions = rollup_regions.filter(code__in={code for path in paths for code in path.split("/")})
+        stale_rows = stale_rows.filter(region__in=rollup_regions)
+        # Rollups of the ancestors depend on every region under the topmost ancestors
+        subtree_filter = Q(region__path__in=[path.split("/")[0] for path in paths])
+        for root_code in {path.split("/")[0] for path in paths}:
+            subtree_filter |= Q(region__path__startswith=f"{root_code}/")
+        direct_rows = direct_rows.filter(subtree_filter)
+    if species_ids is not None:
+        direct_rows = direct_rows.filter(species_id__in=species_ids)
+        stale_rows = stale_rows.filter(species_id__in=species_ids)
+
+    rollup_region_ids = dict(rollup_regions.values_list("code", "id"))
+    rollups = {}
+    for path, species_id, recording_count, sound_types in direct_rows.values_list(
+        "region__path", "species_id", "recording_count", "eligible_sound_types"
+    ):
+        for code in path.split("/"):
+            if code in rollup_region_ids:
+                rollups[(rollup_region_ids[code], species_id)] = (recording_count, sound_types)
+    rollup_rows = [
+        RegionQuizPool(
+            region_id=region_id,
+            species_id=species_id,
+            recording_count=recording_count,
+            eligible_sound_types=sound_types,
+            includes_subregions=True
+        )
+        for (region_id, species_id), (recording_count, sound_types) in rollups.items()
+    ]
+    stale_rows.delete()
+    RegionQuizPool.objects.bulk_create(rollup_rows, batch_size=1000)
+    return len(rollup_rows), list(rollup_region_ids.values())
+
+
+def get_regions_with_beginner_quiz() -> list[int]:
+    """List IDs of regions that have an official beginner species list. The list is cached until invalidated."""
+    region_ids = cache.get("region_catalog:beginner")
+    if region_ids is None:
+        region_ids = list(Region.objects.filter(
+            specieslist__is_official=True,
+            specieslist__type="BGN"
+        ).values_list("id", flat=True).distinct())
+        cache.set("region_catalog:beginner", region_ids, timeout=None)
     return region_ids
 
 
 def get_beginner_species_by_region(region_id: int) -> QuerySet[Species]:
+    """
+    Select species on the official beginner lists of a region that have been observed in the region or its subregions
+    and have songs or calls, using the quiz pool.
+
+    :param region_id: ID of the region.
+    :returns: Query set of beginner species from given region.
+    """
+    beginner_list_species = ListSpecies.objects.filter(
+        list__type="BGN",
+        list__regions__id=region_id,
+        list__is_official=True
+    ).values("species_id")
+    sound_type_filter = Q()
+    for sound_type in BEGINNER_SOUND_TYPES:  # sound types are stored as sorted, comma-separated codes
+        sound_type_filter |= Q(regionquizpool__eligible_sound_types__contains=sound_type)
     species_qs = Species.objects.filter(
-        listspecies__list__type="BGN",
-        listspecies__list__regions__id=region_id,
-        listspecies__list__is_official=True,
-        recording__sound_type__in=["SNG", "CAL"]
-    ).distinct()
+        sound_type_filter,
+        id__in=beginner_list_species,
+        regionquizpool__region_id=region_id,
+        regionquizpool__includes_subregions=True
+    )
     return species_qs
 
 
+class TaxonomyIndex:
+    """
+    In-memory index of the species that can be used as multiple choice options.
+    Species IDs are grouped by genus, family and order so that taxonomically close species can be looked up
+    without further queries. The index is built with a single query.
+    """
+    LEVELS = ("genus", "family", "order")
+
+    def __init__(self, available_species: QuerySet[Species]):
+        self.names = {}
+        self.taxa = {}
+        self.groups = {level: defaultdict(list) for level in self.LEVELS}
+        for sp_id, name, *taxa in available_species.values_list("id", "name", *self.LEVELS):
+            self.names[sp_id] = name
+            self.taxa[sp_id] = taxa
+            for level, taxon in zip(self.LEVELS, taxa):
+                if taxon:
+                    self.groups[level][taxon].append(sp_id)
+        self.species_ids = list(self.names)
+
+    @staticmethod
+    def _sample_excluding(population: list[int], k: int, excluded: set[int]) -> list[int]:
+        """Randomly sample up to k IDs that are not in `excluded` from a list of IDs."""
+        sampled = random.sample(population, min(k + len(excluded), len(population)))
+        return [sp_id for sp_id in sampled if sp_id not in excluded][:k]
+
+    def sample_random(self, species_id: int, k: int) -> list[int]:
+        """Sample k random species other than the given species."""
+        return self._sample_excluding(self.species_ids, k, {species_id})
+
+    def sample_taxonomic(self, species_id: int, k: int) -> list[int]:
+        """
+        Sample k species that are taxonomically closest to the given species: species of the same genus are preferred,
+        then species of the same family and then species of the same order. Remaining choices are filled randomly.
+        """
+        selected = []
+        excluded = {species_id}
+        taxa = self.taxa.get(species_id, (None, None, None))
+        for level, taxon in zip(self.LEVELS, taxa):
+            if len(selected) == k:
+                break
+            if not taxon:
+                continue
+            sampled = self._sample_excluding(self.groups[level][taxon], k - len(selected), excluded)
+            selected.extend(sampled)
+            excluded.update(sampled)
+        if len(selected) < k:
+            selected.extend(self._sample_excluding(self.species_ids, k - len(selected), excluded))
+        return selected
+
+
+def get_multiple_choice_ids(
+    target_species_id: int,
+    index: TaxonomyIndex,
+    num_choices: int = 3,
+    mode: SelectionMode = "random"
+) -> list[int]:
+    """
+    Select IDs of n species to be used for multiple choice questions for a given species.
+
+    :param target_species_id: ID of the species for which choices are selected.
+    :param index: Index of species from which choices are selected.
+    :param num_choices: How many choices to select.
+    :param mode: How to select choice species, see get_multiple_choices.
+    :return choice_species_ids: List of choice species IDs in a random order (target species included)
+    """
+    match mode:
+        case "random":
+            choice_species_ids = index.sample_random(target_species_id, num_choices)
+        case "taxonomic":
+            choice_species_ids = index.sample_taxonomic(target_species_id, num_choices)
+        case _:
+            raise ValueError('Unknown selection mode: mode should be one of {"random", "taxonomic"}')
+
+    choice_species_ids.append(target_species_id)
+    random.shuffle(choice_species_ids)
+    return choice_species_ids
+
+
 def get_multiple_choices(
     target_species: Species,
-    available_species: QuerySet[Species],
+    available_species: QuerySet[Species] | TaxonomyIndex,
     num_choices: int = 3,
     mode: SelectionMode = "random"
 ) -> list[str]:
@@ -54,52 +322,64 @@ def get_multiple_choices(
     Select n species to be used for multiple choice questions for a given species.
 
     :param target_species: Species for which choices are selected.
-    :param available_species: Query set of species from which choices are selected.
+    :param available_species: Query set of species from which choices are selected, or a prebuilt index of them.
     :param num_choices: How many choices to select.
     :param mode: How to select choice species:
         "random" -> select randomly
         "taxonomic" -> select from species taxonomically close to the target species
     :return choice_species_names: List of choice species names in a random order (target species included)
     """
-    match mode:
-        case "random":
-            choice_species_names = list(
-                available_species
-                    .exclude(id=target_species.id)
-                    .order_by("?")
-                    .values_list("name", flat=True)
-                )[:num_choices]
-        case "taxonomic":
-            # TODO: Add taxonomic choice selection
-            raise NotImplementedError("To be added")
-        case _:
-            raise ValueError('Unknown selection mode: mode should be one of {"random", "taxonomic"}')
-
-    choice_species_names.append(target_species.name)
-    random.shuffle(choice_species_names)
+    index = available_species if isinstance(available_species, TaxonomyIndex) else TaxonomyIndex(available_species)
+    choice_species_ids = get_multiple_choice_ids(target_species.id, index, num_choices=num_choices, mode=mode)
+    choice_species_names = [
+        target_species.name if sp_id == target_species.id else index.names[sp_id]
+        for sp_id in choice_species_ids
+    ]
     return choice_species_names
 
 
-def get_quiz_recordings(species_set: QuerySet[Species]) -> QuerySet[Recording]:
+def get_quiz_multiple_choices(
+    quiz_species: list[Species],
+    available_species: QuerySet[Species],
+    num_choices: int = 3,
+    mode: SelectionMode = "random"
+) -> dict[int, list[str]]:
+    """
+    Select multiple choices for every species in a quiz. Choice candidates are indexed once per quiz.
+
+    :param quiz_species: Species for which choices are selected.
+    :param available_species: Query set of species from which choices are selected.
+    :param num_choices: How many choices to select per species.
+    :param mode: How to select choice species, see get_multiple_choices.
+    :return options: Mapping of species ID to its list of choice species names.
+    """
+    index = TaxonomyIndex(available_species)
+    options = {
+        sp.id: get_multiple_choices(sp, index, num_choices=num_choices, mode=mode)
+        for sp in quiz_species
+    }
+    return options
+
+
+def get_quiz_recordings(species_set: QuerySet[Species] | list[Species]) -> QuerySet[Recording]:
     """
     Select recordings to be used in a quiz based on a set of species.
-    One recording per species is selected.
+    One random recording per species is selected in a single query by ranking each species' recordings
+    in random order with a window function.
 
     :param species_set: Query set of unique species.
     :return selected_recordings: Selected recording objects.
     """
     species_ids = [sp.id for sp in species_set]
-    candidate_recordings = Recording.objects.filter(species_id__in=species_ids).values_list("species_id", "id")
-
-    recordings_by_species = defaultdict(list)
-    for sp_id, rec_id in candidate_recordings:
-        recordings_by_species[sp_id].append(rec_id)
-
-    selected_recording_ids = []
-    for recs in recordings_by_species.values():
-        selected_recording_ids.append(random.choice(recs))
+    # Rank only recording IDs in the subquery so that full rows are read for the selected recordings only
+    selected_recording_ids = (
+        Recording.objects
+            .filter(species_id__in=species_ids)
+            .annotate(species_rank=Window(RowNumber(), partition_by=F("species_id"), order_by=Random()))
+            .filter(species_rank=1)
+            .values("id")
+    )
     selected_recordings = Recording.objects.select_related("species").filter(id__in=selected_recording_ids)
-
     return selected_recordings
 
 
@@ -107,3 +387,374 @@ def get_available_regions() -> QuerySet[Region]:
     """List all regions in the database that appear in at least one observation."""
     regions = Region.objects.filter(observation__isnull=False).distinct()
     return regions
+
+
+def get_quiz_regions(min_species: int = QUIZ_LENGTH, include_subregions: bool = False) -> QuerySet[Region]:
+    """
+    List regions that have enough species with recordings in the quiz pool for a full quiz.
+
+    :param min_species: Minimum number of eligible species in a region.
+    :param include_subregions: Whether to also count species observed in subregions of the region.
+    :return regions: Query set of regions with enough eligible species.
+    """
+    regions = Region.objects.annotate(
+        num_species=Count("quiz_pool", filter=Q(quiz_pool__includes_subregions=include_subregions))
+    ).filter(num_species__gte=min_species)
+    return regions
+
+
+def get_regions_requiring_subregions() -> list[int]:
+    """
+    List IDs of regions that only have enough species for a full quiz when species observed in their subregions are
+    included, e.g. countries whose observations are all recorded in states. Quizzes of these regions always include
+    subregions. The list is cached until invalidated.
+    """
+    region_ids = cache.get("region_catalog:subregions")
+    if region_ids is None:
+        region_ids = list(
+            get_quiz_regions(include_subregions=True)
+                .exclude(id__in=get_quiz_regions().values("id"))
+                .values_list("id", flat=True)
+        )
+        cache.set("region_catalog:subregions", region_ids, timeout=None)
+    return region_ids
+
+
+def refresh_region_hierarchy(root_regions: QuerySet[Region]) -> int:
+    """
+    Recompute stored paths and display names of all descendants of given regions, e.g. after a region was renamed.
+
+    :param root_regions: Regions whose descendants are refreshed.
+    :return: Number of refreshed regions.
+    """
+    roots = list(root_regions)
+    if not roots:
+        return 0
+    subtree_filter = Q()
+    for root in roots:
+        subtree_filter |= Q(path__startswith=f"{root.path}/")
+    descendants = sorted(Region.objects.filter(subtree_filter), key=lambda region: region.path.count("/"))
+    regions_by_id = {region.id: region for region in [*roots, *descendants]}
+    updated_fields = set()
+    for region in descendants:  # parents are always refreshed before their subregions
+        region.parent_region = regions_by_id[region.parent_region_id]
+        updated_fields.update(region.update_hierarchy_fields())
+    Region.objects.bulk_update(descendants, list(updated_fields), batch_size=1000)
+    invalidate_region_catalogs()
+    return len(descendants)
+
+
+def _region_catalog_key(catalog: str, language: str) -> str:
+    return f"region_catalog:{catalog}:{language}"
+
+
+def get_region_catalog(catalog: str = "quiz") -> list[RegionChoice]:
+    """
+    List regions as (id, display name) pairs sorted by display name in the active language.
+    The list is built once per language and cached until invalidated with invalidate_region_catalogs.
+
+    :param catalog: Which regions to list:
+        "quiz" -> regions with enough species for a quiz, counting species of subregions for regions that require
+            them, see get_regions_requiring_subregions
+        "observed" -> regions with at least one observation, see get_available_regions
+    :return catalog: Sorted list of regions.
+    """
+    key = _region_catalog_key(catalog, get_language() or settings.LANGUAGE_CODE)
+    region_choices = cache.get(key)
+    if region_choices is None:
+        match catalog:
+            case "quiz":
+                regions = get_quiz_regions(include_subregions=True)
+            case "observed":
+                regions = get_available_regions()
+            case _:
+                raise ValueError(f"Unknown region catalog: catalog should be one of {REGION_CATALOGS}")
+        region_choices = sorted(
+            (RegionChoice(*region) for region in regions.values_list("id", "full_name")),
+            key=lambda region: region.display_name.lower()
+        )
+        cache.set(key, region_choices, timeout=None)
+    return region_choices
+
+
+def invalidate_region_catalogs() -> None:
+    """Remove cached region catalogs of all languages."""
+    keys = [
+        _region_catalog_key(catalog, language)
+        for catalog in REGION_CATALOGS
+        for language, _ in settings.LANGUAGES
+    ]
+    cache.delete_many([*keys, "region_catalog:beginner", "region_catalog:subregions"])
+
+
+def get_quiz_settings(
+    region_id: int,
+    difficulty: str,
+    include_subregions: bool = False
+) -> tuple[QuerySet[Species], int, SelectionMode]:
+    """
+    Get the species pool and multiple choice settings of a quiz difficulty.
+
+    :param region_id: ID of the quiz region.
+    :param difficulty: Quiz difficulty, one of Quiz.QuizDifficulty values.
+    :param include_subregions: Whether to include species observed in subregions (not used by beginner quizzes).
+    :return: Tuple of (species available for the quiz, number of wrong choices, choice selection mode).
+    """
+    match difficulty:
+        case "BGN":
+            return get_beginner_species_by_region(region_id), 2, "random"
+        case "NML":
+            return get_species_by_region(region_id, include_subregions), 3, "random"
+        case "HRD":
+            return get_species_by_region(region_id, include_subregions), 3, "taxonomic"
+        case _:
+            raise ValueError("Unexpected difficulty")
+
+
+def generate_quiz_blueprint(
+    region_id: int,
+    difficulty: str,
+    mode: str,
+    include_subregions: bool = False,
+    practice_user_id: int | None = None
+) -> dict:
+    """
+    Generate the contents of a quiz: selected recordings and, in multiple choice mode, choices for each question.
+    The blueprint only contains IDs so that it can be cached and shared between languages.
+
+    :param region_id: ID of the quiz region.
+    :param difficulty: Quiz difficulty, one of Quiz.QuizDifficulty values.
+    :param mode: Quiz mode, one of Quiz.QuizMode values.
+    :param include_subregions: Whether to include species observed in subregions of the region.
+    :param practice_user_id: If given, favor species that this user hasn't mastered yet.
+    :return blueprint: Dict with keys "recording_ids" (list of recording IDs)
+        and "choice_ids" (mapping of species ID to choice species IDs).
+    """
+    region_species, num_choices, selection_mode = get_quiz_settings(region_id, difficulty, include_subregions)
+    if mode not in ("MULTI", "OPEN"):
+        raise ValueError("Unexpected game mode")
+    if practice_user_id is not None:
+        quiz_species = sample_species(
+            region_species,
+            QUIZ_LENGTH,
+            weights=get_mastery_weights(practice_user_id),
+            default_weight=get_mastery_weight(SpeciesMastery.DEFAULT_EASE)
+        )
+    else:
+        quiz_species = sample_species(region_species, QUIZ_LENGTH)
+    recording_ids = list(get_quiz_recordings(quiz_species).values_list("id", flat=True))
+    choice_ids = {}
+    if mode == "MULTI":
+        index = TaxonomyIndex(region_species)
+        choice_ids = {
+            sp.id: get_multiple_choice_ids(sp.id, index, num_choices=num_choices, mode=selection_mode)
+            for sp in quiz_species
+        }
+    blueprint = {"recording_ids": recording_ids, "choice_ids": choice_ids}
+    return blueprint
+
+
+def load_quiz_blueprint(blueprint: dict) -> tuple[list[Recording], dict[int, list[str]]] | None:
+    """
+    Load recordings and localized choice names of a quiz blueprint.
+
+    :param blueprint: Quiz blueprint created with generate_quiz_blueprint.
+    :return: Tuple of (recordings with their species, mapping of species ID to choice species names), or None if
+        recordings or species of the blueprint have been deleted since it was generated.
+    """
+    recordings = list(Recording.objects.select_related("species").filter(id__in=blueprint["recording_ids"]))
+    if len(recordings) != len(blueprint["recording_ids"]):
+        return None
+    choice_ids = blueprint["choice_ids"]
+    option_species_ids = {sp_id for ids in choice_ids.values() for sp_id in ids}
+    names = dict(Species.objects.filter(id__in=option_species_ids).values_list("id", "name")) if choice_ids else {}
+    if len(names) != len(option_species_ids):
+        return None
+    options = {target_id: [names[sp_id] for sp_id in ids] for target_id, ids in choice_ids.items()}
+    return recordings, options
+
+
+def get_audio_sources(recording: Recording) -> list[AudioSource]:
+    """
+    List the audio files of a recording in the order they should be offered to the browser, which plays the first one
+    it supports: transcoded variants from smallest to largest, then the original file.
+
+    :param recording: Recording whose audio files are listed.
+    :return sources: Audio files with their URLs and MIME types.
+    """
+    if not settings.SELF_HOST_AUDIO:
+        return [AudioSource(recording.xc_audio_url, "audio/mpeg")]
+    variants = sorted(
+        (getattr(recording, f"{field}_size"), getattr(recording, field).url, mime_type)
+        for field, mime_type in AUDIO_VARIANT_TYPES.items()
+        if getattr(recording, field)
+    )
+    return [AudioSource(url, mime_type) for _, url, mime_type in variants] + [
+        AudioSource(recording.audio.url, "audio/mpeg")
+    ]
+
+
+def get_audio_preload_links(sources: list[AudioSource]) -> list[str]:
+    """
+    Build Link header values that let the browser start fetching the first audio file of a quiz before the page has
+    been parsed. Only the first source is preloaded, as it is the one the browser plays if it supports its type.
+    Proxies and CDNs may turn these into 103 Early Hints responses.
+
+    :param sources: Audio files of the first recording, as returned by get_audio_sources.
+    :return links: Link header values, a preconnect to external audio hosts and a preload of the first source.
+    """
+    if not sources:
+        return []
+    links = []
+    url = urlsplit(sources[0].url)
+    if url.netloc:  # hosted by xeno-canto: open the connection while the page loads
+        links.append(f"<{url.scheme}://{url.netloc}>; rel=preconnect")
+    mime_type = sources[0].type.split(";")[0]  # codecs parameters would need escaping, and the type is enough here
+    links.append(f'<{sources[0].url}>; rel=preload; as=audio; type="{mime_type}"')
+    return links
+
+
+def grade_answer(user_answer: str, species_id: int, accepted_answers: list[str], mode: str) -> bool:
+    """
+    Check if an answer to a quiz question is correct. Multiple choice answers must match a species name exactly,
+    open answers may contain typos unless they are closer to another species.
+
+    :param user_answer: Answer given by user.
+    :param species_id: ID of the species that is the correct answer to the quiz question.
+    :param accepted_answers: Normalized names of the correct species, see quiz.utils.get_accepted_answers.
+    :param mode: Quiz mode, one of Quiz.QuizMode values.
+    :return is_correct: Boolean that indicates whether answer is correct.
+    """
+    if mode == Quiz.QuizMode.MULTI:
+        return normalize_answer(user_answer) in accepted_answers
+    return match_answer(user_answer, species_id, accepted_answers) in (Verdict.EXACT, Verdict.TYPO)
+
+
+def is_correct_answer(user_answer: str, species: Species, mode: str) -> bool:
+    """
+    Check if an answer to a quiz question is correct, see grade_answer.
+
+    :param user_answer: Answer given by user.
+    :param species: The species that is the correct answer to the quiz question.
+    :param mode: Quiz mode, one of Quiz.QuizMode values.
+    :return is_correct: Boolean that indicates whether answer is correct.
+    """
+    return grade_answer(user_answer, species.id, get_accepted_answers(species), mode)
+
+
+def save_quiz_results(quiz: Quiz, recording_ids: list[int], user_answers: list[str]) -> Quiz:
+    """
+    Grade the answers of a finished quiz and save the quiz with its answers in a single transaction.
+
+    :param quiz: Unsaved quiz without length and score.
+    :param recording_ids: IDs of the quiz recordings in question order.
+    :param user_answers: Answers given by user in question order.
+    :return quiz: The saved quiz.
+    """
+    recordings = Recording.objects.select_related("species").in_bulk(recording_ids)
+    answers = []
+    for recording_id, user_answer in zip(recording_ids, user_answers):
+        recording = recordings.get(recording_id)  # None if the recording has been deleted during the quiz
+        is_correct = recording is not None and is_correct_answer(user_answer, recording.species, quiz.mode)
+        answers.append(Answer(quiz=quiz, recording=recording, user_answer=user_answer, is_correct=is_correct))
+    quiz.length = len(answers)
+    quiz.score = sum(answer.is_correct for answer in answers)
+    with transaction.atomic():
+        quiz.save(force_insert=True)  # the ID may come from a quiz token, a resubmitted quiz must not be overwritten
+        Answer.objects.bulk_create(answers)
+        if quiz.user_id is not None:
+            update_species_mastery(
+                quiz.user_id,
+                [(answer.recording.species_id, answer.is_correct) for answer in answers if answer.recording],
+                quiz.finished_at
+            )
+    return quiz
+
+
+def get_mastery_weight(ease: float) -> float:
+    """Sampling weight of a species in practice quizzes: the lower the ease, the more likely the species is picked."""
+    return (SpeciesMastery.MAX_EASE / ease) ** 2
+
+
+def get_mastery_weights(user_id: int) -> dict[int, float]:
+    """
+    Get the practice sampling weights of species the user has seen, with a single indexed read.
+
+    :param user_id: ID of the user.
+    :return weights: Mapping of species ID to sampling weight.
+    """
+    masteries = SpeciesMastery.objects.filter(user_id=user_id).values_list("species_id", "ease")
+    return {species_id: get_mastery_weight(ease) for species_id, ease in masteries}
+
+
+def update_species_mastery(user_id: int, results: list[tuple[int, bool]], seen_at: datetime) -> None:
+    """
+    Update a user's species mastery rows with the answers of a quiz. Should be called inside a transaction.
+
+    :param user_id: ID of the user.
+    :param results: (species ID, is correct) pairs of the answers.
+    :param seen_at: When the answers were given.
+    """
+    masteries = {
+        mastery.species_id: mastery
+        for mastery in SpeciesMastery.objects.select_for_update().filter(
+            user_id=user_id, species_id__in={species_id for species_id, _ in results}
+        )
+    }
+    new_masteries = {}
+    for species_id, is_correct in results:
+        mastery = masteries.get(species_id) or new_masteries.get(species_id)
+        if mastery is None:
+            mastery = SpeciesMastery(user_id=user_id, species_id=species_id, last_seen=seen_at)
+            new_masteries[species_id] = mastery
+        mastery.record_answer(is_correct, seen_at)
+    SpeciesMastery.objects.bulk_update(masteries.values(), ["attempts", "correct", "last_seen", "ease"])
+    # A concurrent quiz of the same user may have just created a row, losing one answer is better than failing
+    SpeciesMastery.objects.bulk_create(new_masteries.values(), ignore_conflicts=True)
+
+
+def _quiz_results_key(quiz_id, language: str) -> str:
+    return f"quiz_results:{quiz_id}:{language}:{int(settings.SELF_HOST_AUDIO)}"
+
+
+def get_quiz_results(quiz_id) -> QuizResults | None:
+    """
+    Get the results of a finished quiz in the active language.
+    Finished quizzes don't change, so results are cached until invalidated with invalidate_quiz_results.
+
+    :param quiz_id: ID of the quiz.
+    :return results: Score, grading time and answers of the quiz, or None if the quiz doesn't exist.
+    """
+    key = _quiz_results_key(quiz_id, get_language() or settings.LANGUAGE_CODE)
+    results = cache.get(key)
+    if results is None:
+        quiz = Quiz.objects.filter(id=quiz_id).first()
+        if quiz is None:
+            return None
+        answers = Answer.objects.filter(quiz=quiz).order_by("id").select_related("recording__species")
+        results = QuizResults(
+            quiz.score,
+            quiz.graded_at,
+            [
+                (
+                    ans.user_answer,
+                    ans.recording.species.name,
+                    ans.is_correct,
+                    (
+                        ans.recording.audio.storage.unsigned_url(ans.recording.audio.name)
+                        if settings.SELF_HOST_AUDIO else ans.recording.xc_audio_url
+                    )
+                )
+                if ans.recording is not None else (ans.user_answer, None, ans.is_correct, None)  # deleted recording
+                for ans in answers
+            ]
+        )
+        cache.set(key, results, timeout=settings.QUIZ_RESULTS_CACHE_TIMEOUT)
+    return results
+
+
+def invalidate_quiz_results(quiz_ids: list) -> None:
+    """Remove cached results of quizzes in all languages, e.g. after they have been regraded."""
+    cache.delete_many([
+        _quiz_results_key(quiz_id, language) for quiz_id in quiz_ids for language, _ in settings.LANGUAGES
+    ])
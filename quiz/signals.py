@@ -0,0 +1,36 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from quiz.leaderboards import get_quiz_boards, invalidate_leaderboards, record_quiz
+from quiz.models import Observation, Quiz, Region, Species, SpeciesList
+from quiz.names import invalidate_species_name_indexes
+from quiz.services import invalidate_region_catalogs
+
+
+@receiver([post_save, post_delete], sender=Region)
+@receiver([post_save, post_delete], sender=Observation)
+@receiver([post_save, post_delete], sender=SpeciesList)
+@receiver(m2m_changed, sender=SpeciesList.regions.through)
+def invalidate_region_catalogs_on_change(sender, **kwargs):
+    """Cached region catalogs list region names and regions with observations or beginner lists."""
+    invalidate_region_catalogs()
+
+
+@receiver([post_save, post_delete], sender=Species)
+def invalidate_species_name_indexes_on_change(sender, **kwargs):
+    """Answer checking uses in-process indexes of all species names."""
+    invalidate_species_name_indexes()
+
+
+@receiver(post_save, sender=Quiz)
+def update_leaderboards_on_save(sender, instance, created, **kwargs):
+    """New quizzes are added to leaderboards incrementally, see quiz.leaderboards."""
+    if created:
+        record_quiz(instance)
+
+
+@receiver(post_delete, sender=Quiz)
+def invalidate_leaderboards_on_delete(sender, instance, **kwargs):
+    """Leaderboard entries of a deleted quiz are deleted with it, but cached leaderboards would still show them."""
+    if instance.user_id is not None:
+        invalidate_leaderboards(board.key for board in get_quiz_boards(instance.finished_at, instance.region_id))
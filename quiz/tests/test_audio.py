@@ -0,0 +1,134 @@
+"""Tests for serving self-hosted audio files"""
+
+import importlib
+
+from django.test import override_settings
+from django.urls import clear_url_caches, reverse
+import pytest
+
+from bird_sound_quiz import urls as project_urls
+from quiz import audio, urls
+from quiz.models import Recording
+
+
+@pytest.fixture
+def audio_file(settings, tmp_path):
+    settings.MEDIA_ROOT = tmp_path
+    settings.SELF_HOST_AUDIO = True
+    settings.AUDIO_URL_MAX_AGE = 0
+    settings.AUDIO_SENDFILE = None
+    (tmp_path / "audio").mkdir()
+    (tmp_path / "audio" / "XC1.mp3").write_bytes(b"0123456789")
+    return Recording(id=1, audio="audio/XC1.mp3")
+
+
+def test_parse_range():
+    assert audio.parse_range("bytes=0-3", 10) == (0, 3)
+    assert audio.parse_range("bytes=4-", 10) == (4, 9)
+    assert audio.parse_range("bytes=-3", 10) == (7, 9)
+    assert audio.parse_range("bytes=5-100", 10) == (5, 9)
+    assert audio.parse_range("bytes=0-1,4-5", 10) is None  # multiple ranges are answered with the whole file
+    assert audio.parse_range("bytes=a-b", 10) is None
+    with pytest.raises(ValueError):
+        audio.parse_range("bytes=10-", 10)
+
+
+def test_audio_view_1(client, audio_file):
+    """Whole file should be served with validators and long-lived caching."""
+    response = client.get(audio_file.audio.url)
+
+    assert response.status_code == 200
+    assert b"".join(response.streaming_content) == b"0123456789"
+    assert response["Content-Type"] == "audio/mpeg"
+    assert response["Accept-Ranges"] == "bytes"
+    assert "max-age=31536000" in response["Cache-Control"]
+    assert client.get(audio_file.audio.url, headers={"If-None-Match": response["ETag"]}).status_code == 304
+
+
+def test_audio_view_2(client, audio_file):
+    """Range requests should be answered with the requested part of the file."""
+    url = audio_file.audio.url
+
+    response = client.get(url, headers={"Range": "bytes=2-5"})
+    suffix_response = client.get(url, headers={"Range": "bytes=-2"})
+    stale_response = client.get(url, headers={"Range": "bytes=2-5", "If-Range": '"outdated"'})
+    unsatisfiable_response = client.get(url, headers={"Range": "bytes=20-"})
+
+    assert response.status_code == 206
+    assert b"".join(response.streaming_content) == b"2345"
+    assert response["Content-Range"] == "bytes 2-5/10"
+    assert b"".join(suffix_response.streaming_content) == b"89"
+    assert stale_response.status_code == 200
+    assert unsatisfiable_response.status_code == 416
+    assert unsatisfiable_response["Content-Range"] == "bytes */10"
+
+
+def test_audio_view_3(client, settings, audio_file):
+    """Transfers should be handed off to the web server if configured."""
+    settings.AUDIO_SENDFILE = "x-accel-redirect"
+    accel_response = client.get(audio_file.audio.url)
+    settings.AUDIO_SENDFILE = "x-sendfile"
+    sendfile_response = client.get(audio_file.audio.url)
+
+    assert accel_response["X-Accel-Redirect"] == "/protected-media/audio/XC1.mp3"
+    assert accel_response.content == b""
+    assert sendfile_response["X-Sendfile"] == str(settings.MEDIA_ROOT / "audio" / "XC1.mp3")
+
+
+def test_audio_view_4(client, settings, audio_file, monkeypatch):
+    """Signed URLs should be required when enabled, and expire."""
+    settings.AUDIO_URL_MAX_AGE = 3600
+    signed_url = audio_file.audio.url
+    unsigned_url = reverse("audio", kwargs={"name": "audio/XC1.mp3"})
+    tampered_url = signed_url.replace("XC1.mp3", "XC2.mp3")
+
+    assert client.get(signed_url).status_code == 200
+    assert client.get(unsigned_url).status_code == 403
+    assert client.get(tampered_url).status_code == 403
+    now = audio.time.time()
+    monkeypatch.setattr(audio.time, "time", lambda: now + 2 * 3600)
+    assert client.get(signed_url).status_code == 403
+
+
+def test_audio_view_5(client, settings, audio_file):
+    """Only existing audio files should be served, and only when audio is self-hosted."""
+    assert client.get(reverse("audio", kwargs={"name": "audio/XC2.mp3"})).status_code == 404
+    assert client.get("/media/audio/../../etc/passwd").status_code == 404
+    settings.SELF_HOST_AUDIO = False
+    assert client.get(audio_file.audio.url).status_code == 404
+
+
+def test_audio_url_prefix():
+    """Audio URLs should be served under MEDIA_URL."""
+    def reload_urls():
+        importlib.reload(urls)
+        importlib.reload(project_urls)
+        clear_url_caches()
+
+    try:
+        with override_settings(MEDIA_URL="https://cdn.example.com/files/"):
+            reload_urls()
+            audio_url = reverse("audio", kwargs={"name": "audio/XC1.mp3"})
+    finally:
+        reload_urls()
+
+    assert audio_url == "/files/audio/XC1.mp3"
+    assert reverse("audio", kwargs={"name": "audio/XC1.mp3"}) == "/media/audio/XC1.mp3"
+
+
+def test_store_by_content(settings, tmp_path):
+    """Files should be stored under their content hash, and identical files only once."""
+    settings.MEDIA_ROOT = tmp_path
+    storage = audio.AudioStorage()
+    (tmp_path / "audio").mkdir()
+    for name in ("XC1.MP3", "XC2.mp3", "XC3.mp3"):
+        (tmp_path / "audio" / name).write_bytes(b"same" if name != "XC3.mp3" else b"other")
+
+    name_1 = storage.store_by_content(tmp_path / "audio" / "XC1.MP3", "audio")
+    name_2 = storage.store_by_content(tmp_path / "audio" / "XC2.mp3", "audio")
+    name_3 = storage.store_by_content(tmp_path / "audio" / "XC3.mp3", "audio", keep_original=True)
+
+    digest = audio.hash_file(tmp_path / name_1)
+    assert name_1 == name_2 == f"audio/{digest[:2]}/{digest[2:4]}/{digest}.mp3"
+    assert audio.is_content_addressed(name_3) and not audio.is_content_addressed("audio/XC3.mp3")
+    assert {path.name for path in (tmp_path / "audio").iterdir()} == {"XC3.mp3", digest[:2], name_3[6:8]}
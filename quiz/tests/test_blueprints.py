@@ -0,0 +1,89 @@
+"""Unit tests for pools of pre-generated quizzes"""
+
+from django.core.cache import cache
+import pytest
+
+from quiz import blueprints
+
+
+@pytest.fixture(autouse=True)
+def empty_cache(settings):
+    settings.QUIZ_POOL_SIZE = 3
+    cache.clear()
+    yield
+    cache.clear()
+
+
+def test_pop_quiz_blueprint_1():
+    """Blueprints should be popped in the order they were pushed."""
+    for i in range(3):
+        blueprints.push_quiz_blueprint(1, "NML", "MULTI", {"recording_ids": [i], "choice_ids": {}})
+
+    popped = [blueprints.pop_quiz_blueprint(1, "NML", "MULTI")["recording_ids"] for _ in range(3)]
+
+    assert popped == [[0], [1], [2]]
+    assert blueprints.get_pool_size(1, "NML", "MULTI") == 0
+
+
+def test_pop_quiz_blueprint_2():
+    """Popping from an empty pool should return None and be counted as a miss."""
+    blueprints.push_quiz_blueprint(1, "NML", "OPEN", {"recording_ids": [], "choice_ids": {}})
+
+    assert blueprints.pop_quiz_blueprint(1, "NML", "MULTI") is None  # pools are separate per mode
+    assert blueprints.pop_quiz_blueprint(1, "NML", "OPEN") is not None
+    assert blueprints.pop_quiz_blueprint(1, "NML", "OPEN") is None
+    assert blueprints.get_quiz_pool_stats() == {"hits": 1, "misses": 2, "refills": 1}
+
+
+def test_push_quiz_blueprint():
+    """Blueprints shouldn't be pushed to a full pool, and freed slots should be reused."""
+    pushed = [blueprints.push_quiz_blueprint(1, "HRD", "MULTI", {"recording_ids": [i]}) for i in range(4)]
+    blueprints.pop_quiz_blueprint(1, "HRD", "MULTI")
+    pushed_after_pop = blueprints.push_quiz_blueprint(1, "HRD", "MULTI", {"recording_ids": [4]})
+
+    assert pushed == [True, True, True, False]
+    assert pushed_after_pop
+    assert [blueprints.pop_quiz_blueprint(1, "HRD", "MULTI")["recording_ids"] for _ in range(3)] == [[1], [2], [4]]
+
+
+def test_pop_quiz_blueprint_3():
+    """Pools with and without subregions should be kept separate."""
+    blueprints.push_quiz_blueprint(1, "NML", "MULTI", {"recording_ids": [1]}, include_subregions=True)
+
+    assert blueprints.pop_quiz_blueprint(1, "NML", "MULTI") is None
+    assert blueprints.pop_quiz_blueprint(1, "NML", "MULTI", include_subregions=True) == {"recording_ids": [1]}
+
+
+def test_push_quiz_blueprint_2(monkeypatch):
+    """Pushes racing past the size check shouldn't overwrite blueprints that haven't been popped."""
+    for i in range(3):
+        blueprints.push_quiz_blueprint(1, "NML", "MULTI", {"recording_ids": [i]})
+    monkeypatch.setattr(blueprints, "get_pool_size", lambda *args: 0)  # the size was checked before the pool filled
+
+    assert not blueprints.push_quiz_blueprint(1, "NML", "MULTI", {"recording_ids": [3]})
+    monkeypatch.undo()
+    assert [blueprints.pop_quiz_blueprint(1, "NML", "MULTI")["recording_ids"] for _ in range(3)] == [[0], [1], [2]]
+    assert blueprints.pop_quiz_blueprint(1, "NML", "MULTI") is None  # the skipped slot
+
+
+def test_pop_quiz_blueprint_4():
+    """Slots that have been reserved but not written yet should be skipped."""
+    key = blueprints._pool_key(1, "NML", "MULTI", False)
+    blueprints._incr(f"{key}:tail")  # a concurrent push reserved the first slot
+    blueprints.push_quiz_blueprint(1, "NML", "MULTI", {"recording_ids": [1]})
+
+    assert blueprints.pop_quiz_blueprint(1, "NML", "MULTI") == {"recording_ids": [1]}
+    assert blueprints.get_quiz_pool_stats()["hits"] == 1
+
+
+def test_clear_quiz_pools():
+    """Clearing the pools of a region should leave pools of other regions untouched."""
+    for region_id in (1, 2):
+        blueprints.push_quiz_blueprint(region_id, "HRD", "OPEN", {"recording_ids": [region_id]})
+        blueprints.push_quiz_blueprint(region_id, "HRD", "OPEN", {"recording_ids": []}, include_subregions=True)
+
+    blueprints.clear_quiz_pools([1])
+
+    assert blueprints.get_pool_size(1, "HRD", "OPEN") == 0
+    assert blueprints.get_pool_size(1, "HRD", "OPEN", include_subregions=True) == 0
+    assert blueprints.pop_quiz_blueprint(2, "HRD", "OPEN") == {"recording_ids": [2]}
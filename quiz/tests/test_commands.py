@@ -0,0 +1,304 @@
+"""Tests for management commands"""
+
+from datetime import datetime, timezone
+from io import StringIO
+import json
+import queue
+import shutil
+import subprocess
+import threading
+from urllib.parse import parse_qs, urlsplit
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from model_bakery import baker
+import pytest
+import responses
+
+from quiz.audio import is_content_addressed
+from quiz.management.commands import populate_recording_table
+from quiz.management.commands.transcode_audio import FORMATS, build_ffmpeg_command
+from quiz.models import (
+    Answer, Observation, Quiz, Recording, RecordingSyncCheckpoint, Region, Species, SpeciesMastery
+)
+from quiz import services
+
+
+User = get_user_model()
+
+
+@pytest.mark.django_db
+def test_update_quiz_results_1(django_assert_max_num_queries):
+    """Changed answers and scores should be updated in bulk, regardless of the number of quizzes."""
+    cache.clear()
+    species = baker.make(Species, name_en="Common Tern", name_fi="kalatiira", name_sci="Sterna hirundo")
+    recording = baker.make(Recording, species=species, _create_files=True)
+    quizzes = baker.make(Quiz, mode="OPEN", length=3, score=0, _quantity=5)
+    for quiz in quizzes:
+        baker.make(Answer, quiz=quiz, recording=recording, user_answer="Comon Tern", is_correct=False)
+        baker.make(Answer, quiz=quiz, recording=recording, user_answer="kalatiira", is_correct=True)
+        baker.make(Answer, quiz=quiz, recording=None, user_answer="tavi", is_correct=True)
+    quiz_unchanged = baker.make(Quiz, mode="MULTI", length=1, score=1)
+    baker.make(Answer, quiz=quiz_unchanged, recording=recording, user_answer="Common Tern", is_correct=True)
+
+    # count, species, quizzes, name index, and answers plus the bulk updates and their savepoint per chunk of quizzes,
+    # then the leaderboard rebuild
+    with django_assert_max_num_queries(14):
+        call_command("update_quiz_results", chunk_size=100, stdout=StringIO())
+
+    assert set(Quiz.objects.filter(mode="OPEN").values_list("score", flat=True)) == {3}
+    assert Answer.objects.filter(is_correct=False).count() == 0
+    assert Quiz.objects.get(id=quiz_unchanged.id).score == 1
+    assert all(quiz.graded_at > quiz.finished_at for quiz in Quiz.objects.filter(mode="OPEN"))
+    assert Quiz.objects.get(id=quiz_unchanged.id).graded_at == quiz_unchanged.graded_at
+
+
+@pytest.mark.django_db
+def test_update_quiz_results_2():
+    """Quizzes should be updated chunk by chunk."""
+    cache.clear()
+    species = baker.make(Species, name_en="Common Tern", name_fi="kalatiira", name_sci="Sterna hirundo")
+    recording = baker.make(Recording, species=species, _create_files=True)
+    for quiz in baker.make(Quiz, mode="MULTI", length=1, score=1, _quantity=5):
+        baker.make(Answer, quiz=quiz, recording=recording, user_answer="Arctic Tern", is_correct=True)
+    stdout = StringIO()
+
+    call_command("update_quiz_results", chunk_size=2, stdout=stdout)
+
+    assert set(Quiz.objects.values_list("score", flat=True)) == {0}
+    assert "5/5 answers and 5/5 quizzes changed" in stdout.getvalue()
+
+
+@pytest.mark.django_db
+def test_backfill_species_mastery():
+    """Backfilled mastery should match mastery updated incrementally when quizzes are finished."""
+    users = baker.make(User, _quantity=3)
+    species = baker.make(Species, _quantity=4)
+    recordings = [baker.make(Recording, species=sp, _create_files=True) for sp in species]
+    for i, user in enumerate(users):
+        for j in range(3):
+            quiz = baker.make(Quiz, user=user, mode="MULTI", length=4, score=0)
+            results = [(rec.species_id, (i + j + k) % 2 == 0) for k, rec in enumerate(recordings)]
+            for rec, (_, is_correct) in zip(recordings, results):
+                baker.make(Answer, quiz=quiz, recording=rec, is_correct=is_correct)
+            services.update_species_mastery(user.id, results, quiz.finished_at)
+    incremental = set(SpeciesMastery.objects.values_list("user_id", "species_id", "attempts", "correct", "ease"))
+
+    call_command("backfill_species_mastery", chunk_size=2, stdout=StringIO())
+
+    backfilled = set(SpeciesMastery.objects.values_list("user_id", "species_id", "attempts", "correct", "ease"))
+    assert backfilled == incremental
+
+
+@pytest.mark.django_db
+@responses.activate
+def test_download_audio(settings, tmp_path, monkeypatch):
+    """Missing audio files should be downloaded concurrently and marked as downloaded in batches."""
+    settings.MEDIA_ROOT = tmp_path
+    recordings = [
+        baker.make(Recording, id=i, url=f"//xeno-canto.org/{i}", audio=f"audio/XC{i}.mp3") for i in range(1, 6)
+    ]
+    for recording in recordings[:4]:
+        responses.add(responses.GET, url=f"https:{recording.url}/download", body=f"audio {recording.id}".encode())
+    responses.add(responses.GET, url="https://xeno-canto.org/5/download", status=404)
+    monkeypatch.setattr("builtins.input", lambda prompt: "n")
+    stderr = StringIO()
+
+    call_command(
+        "download_audio", workers=3, rate_limit=0, batch_size=2, stdout=StringIO(), stderr=stderr
+    )
+
+    downloaded = Recording.objects.filter(downloaded=True)
+    assert set(downloaded.values_list("id", flat=True)) == {1, 2, 3, 4}
+    assert (tmp_path / downloaded.get(id=4).audio.name).read_bytes() == b"audio 4"
+    assert not (tmp_path / "audio" / "XC4.mp3").exists()
+    assert "xeno-canto.org/5" in stderr.getvalue()
+
+
+def make_xc_recording(recording_id: int) -> dict:
+    return {
+        "id": str(recording_id),
+        "url": f"//xeno-canto.org/{recording_id}",
+        "rec": "John Doe",
+        "cnt": "Finland",
+        "loc": "Helsinki",
+        "type": "call",
+        "lic": "//creativecommons.org/licenses/by-nc-sa/4.0/",
+        "file-name": f"XC{recording_id}.mp3",
+        "sono": {"small": f"//xeno-canto.org/sounds/uploaded/ABCDEFGHIJ/ffts/XC{recording_id}-small.png"}
+    }
+
+
+@pytest.mark.django_db
+@responses.activate
+def test_populate_recording_table():
+    """Recordings of all species and pages should be fetched concurrently and inserted, skipping failed species."""
+    region = baker.make(Region, code="FI")
+    common_gull = baker.make(Species, name_sci="Larus canus")
+    great_gull = baker.make(Species, name_sci="Larus marinus")
+    for species in (common_gull, great_gull):
+        baker.make(Observation, species=species, region=region)
+    pages = {1: [1, 2], 2: [3], 3: [4, 5]}
+
+    def get_page(request):
+        query = parse_qs(urlsplit(request.url).query)
+        if "marinus" in query["query"][0]:
+            return 404, {}, "{}"
+        page = int(query.get("page", ["1"])[0])
+        body = {"numRecordings": "5", "numPages": 3, "recordings": [make_xc_recording(i) for i in pages[page]]}
+        return 200, {}, json.dumps(body)
+
+    responses.add_callback(responses.GET, "https://xeno-canto.org/api/3/recordings", callback=get_page)
+    stderr = StringIO()
+
+    call_command(
+        "populate_recording_table", region=["FI"], workers=2, page_workers=2, rate_limit=0, batch_size=2,
+        stdout=StringIO(), stderr=stderr
+    )
+
+    assert set(Recording.objects.values_list("id", "species_id")) == {(i, common_gull.id) for i in range(1, 6)}
+    assert "Larus marinus" in stderr.getvalue()
+    assert list(RecordingSyncCheckpoint.objects.values_list("species_id", "max_recording_id")) == [(common_gull.id, 5)]
+
+
+@pytest.mark.django_db
+@responses.activate
+def test_populate_recording_table_interrupted(monkeypatch):
+    """An interrupted import should save the species that have already been fetched without waiting for the others."""
+    region = baker.make(Region, code="FI")
+    common_gull = baker.make(Species, name_sci="Larus canus")
+    great_gull = baker.make(Species, name_sci="Larus marinus")
+    for species in (common_gull, great_gull):
+        baker.make(Observation, species=species, region=region)
+    release = threading.Event()
+
+    def get_page(request):
+        if "marinus" in parse_qs(urlsplit(request.url).query)["query"][0]:
+            release.wait(timeout=5)  # still being fetched when the import is interrupted
+        body = {"numRecordings": "1", "numPages": 1, "recordings": [make_xc_recording(1)]}
+        return 200, {}, json.dumps(body)
+
+    class InterruptedQueue(queue.SimpleQueue):
+        num_gets = 0
+
+        def get(self, *args, **kwargs):
+            self.num_gets += 1
+            if self.num_gets > 2:  # after the page and the finished result of the first species
+                raise KeyboardInterrupt
+            return super().get(*args, **kwargs)
+
+    responses.add_callback(responses.GET, "https://xeno-canto.org/api/3/recordings", callback=get_page)
+    monkeypatch.setattr(populate_recording_table, "SimpleQueue", InterruptedQueue)
+
+    with pytest.raises(KeyboardInterrupt):
+        call_command(
+            "populate_recording_table", region=["FI"], workers=2, rate_limit=0, stdout=StringIO(), stderr=StringIO()
+        )
+    interrupted = not release.is_set()
+    release.set()
+
+    assert interrupted
+    assert list(RecordingSyncCheckpoint.objects.values_list("species_id", flat=True)) == [common_gull.id]
+    assert list(Recording.objects.values_list("species_id", flat=True)) == [common_gull.id]
+
+
+@pytest.mark.django_db
+@responses.activate
+def test_populate_recording_table_incremental():
+    """Incremental syncs should only fetch new uploads of checkpointed species and advance their checkpoints."""
+    region = baker.make(Region, code="FI")
+    common_gull = baker.make(Species, name_sci="Larus canus")
+    great_gull = baker.make(Species, name_sci="Larus marinus")
+    for species in (common_gull, great_gull):
+        baker.make(Observation, species=species, region=region)
+    baker.make(Recording, id=3, species=common_gull, url="//xeno-canto.org/3", audio="audio/XC3.mp3")
+    RecordingSyncCheckpoint.objects.create(
+        species=common_gull, synced_at=datetime(2026, 10, 10, 3, tzinfo=timezone.utc), max_recording_id=3
+    )
+    queries = []
+
+    def get_page(request):
+        query = parse_qs(urlsplit(request.url).query)["query"][0]
+        queries.append(query)
+        ids = [3, 6] if "canus" in query else [4]  # recording 3 was uploaded on the day of the last sync
+        body = {"numRecordings": str(len(ids)), "numPages": 1, "recordings": [make_xc_recording(i) for i in ids]}
+        return 200, {}, json.dumps(body)
+
+    responses.add_callback(responses.GET, "https://xeno-canto.org/api/3/recordings", callback=get_page)
+
+    call_command(
+        "populate_recording_table", region=["FI"], incremental=True, rate_limit=0, stdout=StringIO(), stderr=StringIO()
+    )
+
+    assert sorted(queries) == [
+        'sp:"Larus canus" grp:birds q:A len:5-30 since:2026-10-09', 'sp:"Larus marinus" grp:birds q:A len:5-30'
+    ]
+    assert set(Recording.objects.values_list("id", flat=True)) == {3, 4, 6}
+    checkpoints = RecordingSyncCheckpoint.objects.in_bulk()
+    assert checkpoints[common_gull.id].max_recording_id == 6
+    assert checkpoints[great_gull.id].max_recording_id == 4
+    assert checkpoints[common_gull.id].synced_at > datetime(2026, 10, 10, 3, tzinfo=timezone.utc)
+
+
+@pytest.mark.django_db
+def test_shard_audio(settings, tmp_path):
+    """Audio files should be moved into the sharded layout and identical files should be stored once."""
+    settings.MEDIA_ROOT = tmp_path
+    (tmp_path / "audio" / "opus").mkdir(parents=True)
+    for name, content in (("XC1.mp3", b"same"), ("XC2.mp3", b"same"), ("XC3.mp3", b"other"), ("opus/XC3.ogg", b"ogg")):
+        (tmp_path / "audio" / name).write_bytes(content)
+    baker.make(Recording, id=1, audio="audio/XC1.mp3", downloaded=True)
+    baker.make(Recording, id=2, audio="audio/XC2.mp3", downloaded=True)
+    baker.make(Recording, id=3, audio="audio/XC3.mp3", audio_opus="audio/opus/XC3.ogg", downloaded=True)
+    baker.make(Recording, id=4, audio="audio/XC4.mp3", downloaded=True)  # missing file
+
+    stderr = StringIO()
+    call_command("shard_audio", workers=2, batch_size=2, stdout=StringIO(), stderr=stderr)
+
+    recordings = Recording.objects.in_bulk()
+    assert recordings[1].audio.name == recordings[2].audio.name
+    assert recordings[3].audio_opus.name.startswith("audio/opus/")
+    assert all(is_content_addressed(recordings[i].audio.name) for i in (1, 2, 3))
+    assert (tmp_path / recordings[3].audio.name).read_bytes() == b"other"
+    stored_files = {path.relative_to(tmp_path).as_posix() for path in tmp_path.glob("audio/**/*") if path.is_file()}
+    assert stored_files == {recordings[1].audio.name, recordings[3].audio.name, recordings[3].audio_opus.name}
+    assert recordings[4].audio.name == "audio/XC4.mp3"
+    assert "recording 4" in stderr.getvalue()
+
+
+def test_build_ffmpeg_command():
+    """Transcoding should normalize loudness, downmix to mono and write the format explicitly."""
+    command = build_ffmpeg_command("ffmpeg", "in.mp3", "out.m4a.part", FORMATS["aac"], "48k")
+
+    assert command[command.index("-af") + 1].startswith("loudnorm=")
+    assert command[command.index("-ac") + 1] == "1"
+    assert command[command.index("-b:a") + 1] == "48k"
+    assert command[-3:] == ["-f", "ipod", "out.m4a.part"]
+
+
+@pytest.mark.django_db
+def test_transcode_audio_1():
+    """Missing ffmpeg binary should fail with a clear error."""
+    with pytest.raises(CommandError):
+        call_command("transcode_audio", ffmpeg="no-such-ffmpeg", stdout=StringIO())
+
+
+@pytest.mark.django_db
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg is not installed")
+def test_transcode_audio_2(settings, tmp_path):
+    """Downloaded audio files should be transcoded into variants whose names and sizes are saved."""
+    settings.MEDIA_ROOT = tmp_path
+    (tmp_path / "audio").mkdir()
+    subprocess.run(
+        ["ffmpeg", "-loglevel", "error", "-f", "lavfi", "-i", "sine=duration=5", str(tmp_path / "audio" / "XC1.mp3")],
+        check=True
+    )
+    baker.make(Recording, id=1, audio="audio/XC1.mp3", downloaded=True)
+
+    call_command("transcode_audio", workers=2, stdout=StringIO())
+
+    recording = Recording.objects.get(id=1)
+    assert is_content_addressed(recording.audio_opus.name) and recording.audio_opus.name.endswith(".ogg")
+    assert is_content_addressed(recording.audio_aac.name) and recording.audio_aac.name.endswith(".m4a")
+    assert recording.audio_opus_size == (tmp_path / recording.audio_opus.name).stat().st_size
@@ -0,0 +1,130 @@
+"""Tests for leaderboard rollups"""
+
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.utils import timezone
+from model_bakery import baker
+import pytest
+
+from accounts.models import UserStats
+from quiz import leaderboards
+from quiz.models import LeaderboardEntry, Quiz, Region
+
+
+User = get_user_model()
+Period = LeaderboardEntry.Period
+
+
+def make_quiz(user, score: int, difficulty: str = "NML", **kwargs) -> Quiz:
+    defaults = {"mode": "MULTI", "length": 10, "region": None}
+    return baker.make(Quiz, user=user, score=score, difficulty=difficulty, **(defaults | kwargs))
+
+
+@pytest.mark.django_db
+def test_record_quiz_1():
+    """A quiz should be added to the global and regional leaderboards of every period, keeping the user's best."""
+    cache.clear()
+    user = baker.make(User)
+    region = baker.make(Region)
+
+    best_quiz = make_quiz(user, 8, region=region)
+    make_quiz(user, 7, region=region)
+    make_quiz(user, 9, difficulty="BGN", region=region)
+
+    entries = LeaderboardEntry.objects.filter(user=user)
+    assert entries.count() == 6
+    assert {entry.quiz_id for entry in entries} == {best_quiz.id}
+    assert {entry.points for entry in entries} == {16}
+    assert entries.filter(region=None).count() == 3
+
+
+@pytest.mark.django_db
+def test_record_quiz_2(settings, django_assert_num_queries):
+    """A quiz that doesn't make it to full cached leaderboards should be skipped without queries."""
+    cache.clear()
+    settings.LEADERBOARD_SIZE = 2
+    users = baker.make(User, _quantity=3)
+    make_quiz(users[0], 9)
+    make_quiz(users[1], 8)
+    UserStats.objects.create(user=users[2])
+    for period in Period:
+        leaderboards.get_leaderboard(period)
+
+    with django_assert_num_queries(5):  # quiz insert and the user stats update in a savepoint, no leaderboard queries
+        make_quiz(users[2], 5)
+
+    assert not LeaderboardEntry.objects.filter(user=users[2]).exists()
+
+
+@pytest.mark.django_db
+def test_record_quiz_3():
+    """Short quizzes and quizzes of unknown difficulty shouldn't be ranked, and shouldn't break rebuilds."""
+    cache.clear()
+    user = baker.make(User)
+    make_quiz(user, 9, length=5)
+    make_quiz(user, 9, length=200)
+    make_quiz(user, 9, difficulty="XX")
+
+    assert not LeaderboardEntry.objects.exists()
+    assert leaderboards.rebuild_leaderboards() == 0
+
+
+@pytest.mark.django_db
+def test_get_leaderboard(django_assert_num_queries, django_capture_on_commit_callbacks):
+    """Leaderboards should be read with one query and then from the cache until they change."""
+    cache.clear()
+    users = baker.make(User, _quantity=3)
+    region = baker.make(Region)
+    make_quiz(users[0], 6, difficulty="HRD", region=region)
+    make_quiz(users[1], 9)
+    make_quiz(users[2], 9, region=region)
+
+    with django_assert_num_queries(1):
+        rows = leaderboards.get_leaderboard(Period.WEEK)
+    with django_assert_num_queries(0):
+        assert leaderboards.get_leaderboard(Period.WEEK) == rows
+    assert [(row.rank, row.user_id, row.points) for row in rows] == [
+        (1, users[0].id, 18), (2, users[1].id, 18), (3, users[2].id, 18)
+    ]
+    assert [row.user_id for row in leaderboards.get_leaderboard(Period.DAY, region.id)] == [users[0].id, users[2].id]
+
+    with django_capture_on_commit_callbacks(execute=True):
+        make_quiz(users[2], 10, difficulty="HRD")
+
+    assert leaderboards.get_leaderboard(Period.WEEK)[0].user_id == users[2].id
+
+
+@pytest.mark.django_db
+def test_compact_leaderboards(settings):
+    """Compaction should drop leaderboards of past periods and trim the rest to their size."""
+    cache.clear()
+    users = baker.make(User, _quantity=3)
+    for score, user in enumerate(users, start=1):
+        make_quiz(user, score)
+    settings.LEADERBOARD_SIZE = 2
+
+    num_expired, num_trimmed = leaderboards.compact_leaderboards(now=timezone.now() + timedelta(days=8))
+
+    assert (num_expired, num_trimmed) == (6, 1)
+    assert list(LeaderboardEntry.objects.values_list("period", "user_id").order_by("user_id")) == [
+        (Period.ALL_TIME, users[1].id), (Period.ALL_TIME, users[2].id)
+    ]
+
+
+@pytest.mark.django_db
+def test_rebuild_leaderboards():
+    """Rebuilt leaderboards should match the incrementally maintained ones."""
+    cache.clear()
+    users = baker.make(User, _quantity=3)
+    regions = baker.make(Region, _quantity=2)
+    for i in range(12):
+        make_quiz(users[i % 3], i % 10, difficulty=["BGN", "NML", "HRD"][i % 4 % 3], region=regions[i % 2])
+    fields = ("board", "user_id", "quiz_id", "points")
+    incremental = set(LeaderboardEntry.objects.values_list(*fields))
+
+    num_entries = leaderboards.rebuild_leaderboards()
+
+    assert num_entries == len(incremental)
+    assert set(LeaderboardEntry.objects.values_list(*fields)) == incremental
@@ -0,0 +1,73 @@
+"""Unit tests for species name indexes"""
+
+from django.core.cache import cache
+from model_bakery import baker
+import pytest
+
+from quiz.models import Species
+from quiz.utils import get_accepted_answers
+from quiz import names
+
+
+def test_species_name_index():
+    """Index should find names within edit distance 1, including transpositions."""
+    index = names.SpeciesNameIndex([
+        (1, "Common Tern"),
+        (2, "Common Teal"),
+        (3, "Arctic Tern"),
+        (4, "Selkälokki"),
+        (5, None)
+    ])
+
+    assert len(index) == 4
+    assert index.find("common tern", 0) == {1}
+    assert index.find("common tean", 1) == {1, 2}
+    assert index.find("ocmmon tern", 1) == {1}
+    assert index.find("common ter", 1) == {1}
+    assert index.find("selkalokki", 0) == {4}
+    assert index.find("arctic ter", 0) == set()
+    assert index.find("commn teal", 1) == {2}
+
+
+@pytest.mark.django_db
+def test_match_answer_1():
+    """Answers should be exact, typos of the correct species or wrong."""
+    cache.clear()
+    species = baker.make(Species, name_en="Common Tern", name_fi="kalatiira", name_sci="Sterna hirundo")
+    baker.make(Species, name_en="Arctic Tern", name_fi="lapintiira", name_sci="Sterna paradisaea")
+    accepted_answers = get_accepted_answers(species)
+
+    assert names.match_answer("common tern", species.id, accepted_answers) == names.Verdict.EXACT
+    assert names.match_answer("Comon Tren", species.id, accepted_answers) == names.Verdict.TYPO
+    assert names.match_answer("kalatiira ", species.id, accepted_answers) == names.Verdict.EXACT
+    assert names.match_answer("lapintiira", species.id, accepted_answers) == names.Verdict.WRONG
+
+
+@pytest.mark.django_db
+def test_match_answer_2():
+    """Answers close to the correct species but closer to another species should be rejected."""
+    cache.clear()
+    species = baker.make(Species, name_en="Common Tern", name_fi="kalatiira", name_sci="Sterna hirundo")
+    baker.make(Species, name_en="Common Teal", name_fi="tavi", name_sci="Anas crecca")
+    accepted_answers = get_accepted_answers(species)
+
+    assert names.match_answer("Common Teal", species.id, accepted_answers) == names.Verdict.OTHER_SPECIES
+    assert names.match_answer("Common Tea", species.id, accepted_answers) == names.Verdict.OTHER_SPECIES
+    assert names.match_answer("Common Ter", species.id, accepted_answers) == names.Verdict.TYPO
+
+
+@pytest.mark.django_db
+def test_get_species_name_indexes(django_assert_num_queries):
+    """Indexes should be built once and rebuilt after species have changed."""
+    cache.clear()
+    baker.make(Species, name_en="Common Tern", name_fi="kalatiira", name_sci="Sterna hirundo")
+
+    with django_assert_num_queries(1):
+        names.get_species_name_indexes()
+        indexes = names.get_species_name_indexes()
+    baker.make(Species, name_en="Common Teal", name_fi="tavi", name_sci="Anas crecca")
+    rebuilt_indexes = names.get_species_name_indexes()
+
+    assert set(indexes) == {"en", "fi", "sci"}
+    assert len(indexes["en"]) == 1
+    assert len(rebuilt_indexes["en"]) == 2
@@ -1,11 +1,22 @@
 """Unit tests for business logic"""
 
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.utils import timezone
 from django.utils.translation import override
 from model_bakery import baker
 import pytest
 
-from quiz.models import Region, Species, Observation, Recording
-from quiz import services
+from accounts.models import UserStats
+from quiz.models import (
+    ListSpecies, Region, Species, SpeciesList, SpeciesMastery, Observation, Quiz, Recording, RegionQuizPool
+)
+from quiz import blueprints, services
+
+
+User = get_user_model()
 
 
 @pytest.mark.django_db
@@ -73,6 +84,81 @@ def test_get_available_regions_2():
     assert [region.name_fi for region in available_regions] == ["A-Alue", "B-Alue", "C-Alue"]  # ordered by Finnish name, as specified by locale arg
 
 
+@pytest.mark.django_db
+def test_get_region_catalog_1():
+    """Region catalog should be sorted by display name in the active language and include parent regions."""
+    cache.clear()
+    parent_region = baker.make(Region, name_en="Finland", name_fi="Suomi")
+    region_1 = baker.make(Region, name_en="Uusimaa", name_fi="Uusimaa", parent_region=parent_region)
+    region_2 = baker.make(Region, name_en="Aland", name_fi="Ahvenanmaa")
+    for region in (region_1, region_2):
+        baker.make(Observation, region=region)
+
+    with override("fi"):
+        catalog_fi = services.get_region_catalog("observed")
+    catalog_en = services.get_region_catalog("observed")
+
+    assert [region.display_name for region in catalog_fi] == ["Ahvenanmaa", "Suomi - Uusimaa"]
+    assert [region.display_name for region in catalog_en] == ["Aland", "Finland - Uusimaa"]
+
+
+@pytest.mark.django_db
+def test_get_region_catalog_2(django_assert_num_queries):
+    """Region catalog should be cached until a region is changed."""
+    cache.clear()
+    region = baker.make(Region, name_en="Finland")
+    baker.make(Observation, region=region)
+    services.get_region_catalog("observed")
+
+    with django_assert_num_queries(0):
+        catalog = services.get_region_catalog("observed")
+    region.name_en = "Suomi"
+    region.save()
+
+    assert catalog[0].display_name == "Finland"
+    assert services.get_region_catalog("observed")[0].display_name == "Suomi"
+
+
+@pytest.mark.django_db
+def test_get_region_catalog_3(django_assert_num_queries):
+    """Region catalog should be built with a single query using stored display names."""
+    cache.clear()
+    country = baker.make(Region, code="US", name_en="United States")
+    state = baker.make(Region, code="US-TX", name_en="Texas", parent_region=country)
+    county = baker.make(Region, code="US-TX-015", name_en="Austin", parent_region=state)
+    for region in (country, state, county):
+        baker.make(Observation, region=region)
+    cache.clear()
+
+    with django_assert_num_queries(1):
+        catalog = services.get_region_catalog("observed")
+
+    assert [region.display_name for region in catalog] == [
+        "United States",
+        "United States - Texas",
+        "United States - Texas - Austin"
+    ]
+
+
+@pytest.mark.django_db
+def test_refresh_region_hierarchy():
+    """Stored paths and display names of subregions should follow a renamed parent region."""
+    country = baker.make(Region, code="US", name_en="United States", name_fi="Yhdysvallat")
+    state = baker.make(Region, code="US-TX", name_en="Texas", name_fi="Texas", parent_region=country)
+    county = baker.make(Region, code="US-TX-015", name_en="Austin", name_fi="Austin", parent_region=state)
+    Region.objects.filter(id=country.id).update(name_en="USA", name_fi="USA")
+    country.refresh_from_db()
+    country.save()
+
+    num_refreshed = services.refresh_region_hierarchy(Region.objects.filter(id=country.id))
+
+    county.refresh_from_db()
+    assert num_refreshed == 2
+    assert county.path == "US/US-TX/US-TX-015"
+    assert county.full_name_en == "USA - Texas - Austin"
+    assert county.full_name_fi == "USA - Texas - Austin"
+
+
 @pytest.mark.django_db
 def test_get_species_by_region_1():
     """Species for a given region should only include species that have been observed in that region."""
@@ -91,6 +177,7 @@ def test_get_species_by_region_1():
     baker.make(Recording, species=species_2, _create_files=True)
     baker.make(Recording, species=species_3, _create_files=True)
 
+    services.refresh_region_quiz_pool()
     region_species = services.get_species_by_region(region.id)
 
     assert {species.name_en for species in region_species} == {"Blue-footed Booby", "Tufted Titmouse"}
@@ -114,6 +201,7 @@ def test_get_species_by_region_2():
     # no recording for species 2
     baker.make(Recording, species=species_3, _create_files=True)
 
+    services.refresh_region_quiz_pool()
     region_species = services.get_species_by_region(region.id)
 
     assert {species.name_en for species in region_species} == {"Blue-footed Booby", "Andean Cock-of-the-rock"}
@@ -137,6 +225,7 @@ def test_get_species_by_region_3():
     baker.make(Recording, species=species_2, _create_files=True)
     baker.make(Recording, species=species_3, _create_files=True)
 
+    services.refresh_region_quiz_pool()
     region_species = services.get_species_by_region(region.id)
 
     assert len(region_species) == 3
@@ -160,11 +249,196 @@ def test_get_species_by_region_4():
     baker.make(Recording, species=species_2, _create_files=True)
     baker.make(Recording, species=species_3, _create_files=True)
 
+    services.refresh_region_quiz_pool()
     region_species = services.get_species_by_region(target_region.id)
 
     assert {species.name_en for species in region_species} == {"Tufted Titmouse", "Andean Cock-of-the-rock"}
 
 
+@pytest.mark.django_db
+def test_sample_species_1():
+    """Sampling should select k distinct species from the query set."""
+    species_set = baker.make(Species, _quantity=30)
+    species_qs = Species.objects.filter(id__in=[sp.id for sp in species_set[:20]])
+
+    sampled_species = services.sample_species(species_qs, 10)
+
+    assert len({sp.id for sp in sampled_species}) == 10
+    assert {sp.id for sp in sampled_species} <= {sp.id for sp in species_set[:20]}
+
+
+@pytest.mark.django_db
+def test_sample_species_2():
+    """If there are fewer species than requested, all species should be selected."""
+    species_set = baker.make(Species, _quantity=3)
+
+    sampled_species = services.sample_species(Species.objects.all(), 10)
+
+    assert {sp.id for sp in sampled_species} == {sp.id for sp in species_set}
+
+
+@pytest.mark.django_db
+def test_sample_species_3():
+    """Species with large weights should be preferred."""
+    species_set = baker.make(Species, _quantity=20)
+    weights = {sp.id: 1e6 for sp in species_set[:3]}
+
+    sampled_species = services.sample_species(Species.objects.all(), 3, weights=weights, default_weight=1e-6)
+
+    assert {sp.id for sp in sampled_species} == {sp.id for sp in species_set[:3]}
+
+
+@pytest.mark.django_db
+def test_refresh_region_quiz_pool_1():
+    """Pool rows should store recording counts and sound types of the species' recordings."""
+    region = baker.make(Region)
+    species = baker.make(Species)
+    baker.make(Observation, region=region, species=species)
+    baker.make(Recording, species=species, sound_type="SNG", _create_files=True)
+    baker.make(Recording, species=species, sound_type="SNG", _create_files=True)
+    baker.make(Recording, species=species, sound_type="CAL", _create_files=True)
+
+    num_rows = services.refresh_region_quiz_pool()
+
+    pool_row = RegionQuizPool.objects.get(region=region, species=species, includes_subregions=False)
+    assert num_rows == 2  # direct row + subtree rollup row
+    assert pool_row.recording_count == 3
+    assert pool_row.eligible_sound_types == "CAL,SNG"
+
+
+@pytest.mark.django_db
+def test_refresh_region_quiz_pool_2():
+    """Refreshing a subset of regions should leave pool rows of other regions untouched."""
+    region_1 = baker.make(Region)
+    region_2 = baker.make(Region)
+    species = baker.make(Species)
+    baker.make(Observation, region=region_1, species=species)
+    baker.make(Observation, region=region_2, species=species)
+    baker.make(Recording, species=species, _create_files=True)
+    services.refresh_region_quiz_pool()
+
+    Observation.objects.filter(region=region_1).delete()
+    baker.make(Recording, species=species, _create_files=True)
+    services.refresh_region_quiz_pool(region_ids=[region_1.id])
+
+    assert not RegionQuizPool.objects.filter(region=region_1).exists()
+    assert RegionQuizPool.objects.get(region=region_2, includes_subregions=False).recording_count == 1  # not refreshed
+
+
+@pytest.mark.django_db
+def test_get_species_by_region_5():
+    """Species observed in subregions should be included only when requested."""
+    country = baker.make(Region, code="US")
+    state = baker.make(Region, code="US-NY", parent_region=country)
+    county = baker.make(Region, code="US-NY-061", parent_region=state)
+    other_country = baker.make(Region, code="FI")
+    species_1, species_2, species_3, species_4 = baker.make(Species, _quantity=4)
+    baker.make(Observation, region=country, species=species_1)
+    baker.make(Observation, region=state, species=species_2)
+    baker.make(Observation, region=county, species=species_3)
+    baker.make(Observation, region=other_country, species=species_4)
+    for species in (species_1, species_2, species_3, species_4):
+        baker.make(Recording, species=species, _create_files=True)
+    services.refresh_region_quiz_pool()
+
+    country_species = services.get_species_by_region(country.id)
+    country_subtree_species = services.get_species_by_region(country.id, include_subregions=True)
+    state_subtree_species = services.get_species_by_region(state.id, include_subregions=True)
+
+    assert {sp.id for sp in country_species} == {species_1.id}
+    assert {sp.id for sp in country_subtree_species} == {species_1.id, species_2.id, species_3.id}
+    assert {sp.id for sp in state_subtree_species} == {species_2.id, species_3.id}
+
+
+@pytest.mark.django_db
+def test_refresh_region_quiz_pool_3():
+    """Refreshing a subregion should update the subtree rollups of its ancestors."""
+    country = baker.make(Region, code="US")
+    state = baker.make(Region, code="US-NY", parent_region=country)
+    species_1, species_2 = baker.make(Species, _quantity=2)
+    baker.make(Observation, region=country, species=species_1)
+    for species in (species_1, species_2):
+        baker.make(Recording, species=species, _create_files=True)
+    services.refresh_region_quiz_pool()
+
+    baker.make(Observation, region=state, species=species_2)
+    services.refresh_region_quiz_pool(region_ids=[state.id])
+
+    country_subtree_species = services.get_species_by_region(country.id, include_subregions=True)
+    assert {sp.id for sp in country_subtree_species} == {species_1.id, species_2.id}
+
+
+@pytest.mark.django_db
+def test_refresh_region_quiz_pool_4():
+    """Refreshing species should update the subtree rollups of regions where they were or are observed."""
+    country = baker.make(Region, code="US")
+    state_1 = baker.make(Region, code="US-NY", parent_region=country)
+    state_2 = baker.make(Region, code="US-TX", parent_region=country)
+    species = baker.make(Species)
+    baker.make(Recording, species=species, _create_files=True)
+    observation = baker.make(Observation, region=state_1, species=species)
+    services.refresh_region_quiz_pool()
+
+    observation.region = state_2
+    observation.save()
+    services.refresh_region_quiz_pool(species_ids=[species.id])
+
+    rollup_region_ids = RegionQuizPool.objects.filter(includes_subregions=True).values_list("region_id", flat=True)
+    assert set(rollup_region_ids) == {country.id, state_2.id}
+
+
+@pytest.mark.django_db
+def test_refresh_region_quiz_pool_5():
+    """Refreshing a region should drop the pre-generated quizzes of the region and its ancestors."""
+    cache.clear()
+    country = baker.make(Region, code="US")
+    state = baker.make(Region, code="US-NY", parent_region=country)
+    other_country = baker.make(Region, code="FI")
+    for region in (country, state, other_country):
+        blueprints.push_quiz_blueprint(region.id, "NML", "MULTI", {"recording_ids": [], "choice_ids": {}}, True)
+
+    services.refresh_region_quiz_pool(region_ids=[state.id])
+
+    assert blueprints.get_pool_size(country.id, "NML", "MULTI", True) == 0
+    assert blueprints.get_pool_size(state.id, "NML", "MULTI", True) == 0
+    assert blueprints.get_pool_size(other_country.id, "NML", "MULTI", True) == 1
+
+
+@pytest.mark.django_db
+def test_get_quiz_regions():
+    """Only regions with enough eligible species for a full quiz should be listed."""
+    region_1 = baker.make(Region)
+    region_2 = baker.make(Region)
+    species_set = baker.make(Species, _quantity=services.QUIZ_LENGTH)
+    for species in species_set:
+        baker.make(Observation, region=region_1, species=species)
+        baker.make(Recording, species=species, _create_files=True)
+    for species in species_set[:-1]:
+        baker.make(Observation, region=region_2, species=species)
+    services.refresh_region_quiz_pool()
+
+    quiz_regions = services.get_quiz_regions()
+
+    assert [region.id for region in quiz_regions] == [region_1.id]
+
+
+@pytest.mark.django_db
+def test_get_regions_requiring_subregions():
+    """Regions that only have a full quiz with species of their subregions should be listed separately."""
+    cache.clear()
+    country = baker.make(Region, code="US")
+    state = baker.make(Region, code="US-NY", parent_region=country)
+    for species in baker.make(Species, _quantity=services.QUIZ_LENGTH):
+        baker.make(Observation, region=state, species=species)
+        baker.make(Recording, species=species, _create_files=True)
+    services.refresh_region_quiz_pool()
+
+    assert [region.id for region in services.get_quiz_regions()] == [state.id]
+    assert {region.id for region in services.get_quiz_regions(include_subregions=True)} == {country.id, state.id}
+    assert services.get_regions_requiring_subregions() == [country.id]
+    assert {region.id for region in services.get_region_catalog("quiz")} == {country.id, state.id}
+
+
 @pytest.mark.django_db
 def test_get_quiz_recordings_1():
     """Selection of quiz recordings should be random."""
@@ -282,3 +556,210 @@ def test_get_multiple_choices_4():
         )
 
     assert set(multiple_choice_species) == {"Fallback name 1", "Fallback name 2", "Finnish name 1", "Finnish name 2"}
+
+
+@pytest.mark.django_db
+def test_get_quiz_multiple_choices(django_assert_num_queries):
+    """Choices for a whole quiz should be selected with a single query and include each target species."""
+    available_species = baker.make(Species, _quantity=20)
+    quiz_species = available_species[:10]
+    available_species_qs = Species.objects.filter(id__in=[sp.id for sp in available_species])
+
+    with django_assert_num_queries(1):
+        options = services.get_quiz_multiple_choices(
+            quiz_species=quiz_species,
+            available_species=available_species_qs,
+            num_choices=3,
+            mode="random"
+        )
+
+    assert set(options) == {sp.id for sp in quiz_species}
+    for sp in quiz_species:
+        assert sp.name in options[sp.id]
+        assert len(set(options[sp.id])) == 4
+
+
+@pytest.mark.django_db
+def test_get_multiple_choices_5():
+    """Taxonomic choices should prefer species of the same genus, then family, then order."""
+    target_species = baker.make(Species, name_en="Common Gull", genus="Larus", family="Laridae", order="Charadriiformes")
+    same_genus = baker.make(Species, name_en="Herring Gull", genus="Larus", family="Laridae", order="Charadriiformes")
+    same_family = baker.make(Species, name_en="Common Tern", genus="Sterna", family="Laridae", order="Charadriiformes")
+    same_order = baker.make(Species, name_en="Eurasian Oystercatcher", genus="Haematopus", family="Haematopodidae", order="Charadriiformes")
+    baker.make(Species, genus="Parus", family="Paridae", order="Passeriformes", _quantity=10)
+    available_species_qs = Species.objects.all()
+
+    multiple_choice_species = services.get_multiple_choices(
+        target_species=target_species,
+        available_species=available_species_qs,
+        num_choices=3,
+        mode="taxonomic"
+    )
+
+    assert set(multiple_choice_species) == {sp.name_en for sp in (target_species, same_genus, same_family, same_order)}
+
+
+@pytest.mark.django_db
+def test_get_multiple_choices_6():
+    """Taxonomic choices should be filled with random species if there are not enough close relatives."""
+    target_species = baker.make(Species, genus="Larus", family="Laridae", order="Charadriiformes")
+    baker.make(Species, genus="Parus", family="Paridae", order="Passeriformes", _quantity=10)
+    index = services.TaxonomyIndex(Species.objects.all())
+
+    multiple_choice_species = services.get_multiple_choices(
+        target_species=target_species,
+        available_species=index,
+        num_choices=3,
+        mode="taxonomic"
+    )
+
+    assert len(set(multiple_choice_species)) == 4
+    assert target_species.name_en in multiple_choice_species
+
+
+@pytest.mark.django_db
+def test_get_quiz_recordings_3(django_assert_num_queries):
+    """Recordings and their species should be selected in a single query."""
+    species_set = baker.make(Species, _quantity=10)
+    for species in species_set:
+        baker.make(Recording, species=species, _quantity=5, _create_files=True)
+
+    with django_assert_num_queries(1):
+        selected_recordings = list(services.get_quiz_recordings(species_set))
+        species_names = {rec.species.name for rec in selected_recordings}
+
+    assert species_names == {species.name for species in species_set}
+
+
+@pytest.mark.django_db
+def test_generate_quiz_blueprint():
+    """Blueprint should contain one recording per quiz species and choices that include each species."""
+    region = baker.make(Region)
+    species_set = baker.make(Species, _quantity=15)
+    for species in species_set:
+        baker.make(Observation, region=region, species=species)
+        baker.make(Recording, species=species, _create_files=True)
+    services.refresh_region_quiz_pool()
+
+    blueprint = services.generate_quiz_blueprint(region.id, "NML", "MULTI")
+    recordings, options = services.load_quiz_blueprint(blueprint)
+
+    assert len(recordings) == services.QUIZ_LENGTH
+    assert set(options) == {rec.species_id for rec in recordings}
+    for rec in recordings:
+        assert rec.species.name in options[rec.species_id]
+        assert len(options[rec.species_id]) == 4
+
+
+@pytest.mark.django_db
+def test_generate_quiz_blueprint_2(django_assert_num_queries):
+    """Beginner quizzes should only use listed species with songs or calls, read from the quiz pool."""
+    region = baker.make(Region)
+    species_list = baker.make(SpeciesList, type="BGN", is_official=True, regions=[region])
+    species_set = baker.make(Species, _quantity=15)
+    for i, species in enumerate(species_set):
+        baker.make(Observation, region=region, species=species)
+        baker.make(Recording, species=species, sound_type="DRU" if i == 0 else ["SNG", "CAL"][i % 2])
+        baker.make(ListSpecies, list=species_list, species=species)
+    baker.make(ListSpecies, list=baker.make(SpeciesList, type="BGN", is_official=True), species=species_set[1])
+    services.refresh_region_quiz_pool()
+
+    # sampled species IDs and species, recordings, then taxonomy index of the species pool
+    with django_assert_num_queries(4):
+        blueprint = services.generate_quiz_blueprint(region.id, "BGN", "MULTI")
+    beginner_species = services.get_beginner_species_by_region(region.id)
+
+    assert len(blueprint["recording_ids"]) == services.QUIZ_LENGTH
+    assert species_set[0].id not in blueprint["choice_ids"]
+    assert sorted(sp.id for sp in beginner_species) == sorted(sp.id for sp in species_set[1:])
+
+
+@pytest.mark.django_db
+def test_update_species_mastery_1():
+    """Mastery rows should be created and updated incrementally, with ease growing for correct answers."""
+    user = baker.make(User)
+    species_1, species_2 = baker.make(Species, _quantity=2)
+    first_seen, last_seen = timezone.now() - timedelta(days=1), timezone.now()
+
+    services.update_species_mastery(user.id, [(species_1.id, True), (species_2.id, False)], first_seen)
+    services.update_species_mastery(user.id, [(species_1.id, True)], last_seen)
+
+    mastery_1 = SpeciesMastery.objects.get(user=user, species=species_1)
+    mastery_2 = SpeciesMastery.objects.get(user=user, species=species_2)
+    assert (mastery_1.attempts, mastery_1.correct, mastery_1.last_seen) == (2, 2, last_seen)
+    assert (mastery_2.attempts, mastery_2.correct, mastery_2.last_seen) == (1, 0, first_seen)
+    assert mastery_1.ease > SpeciesMastery.DEFAULT_EASE > mastery_2.ease
+
+
+@pytest.mark.django_db
+def test_update_species_mastery_2(django_assert_num_queries):
+    """Saving a user's quiz results should update mastery with a constant number of queries."""
+    cache.clear()
+    user = baker.make(User)
+    species = [baker.make(Species, name_en=f"Bird {i}", name_sci=f"Avis {i}") for i in range(10)]
+    recordings = [baker.make(Recording, species=sp, _create_files=True) for sp in species]
+    services.update_species_mastery(user.id, [(sp.id, False) for sp in species[:5]], timezone.now())
+    UserStats.objects.create(user=user)
+    quiz = Quiz(user=user, mode="MULTI", difficulty="NML", started_at=timezone.now())
+
+    # recordings, quiz, answers, mastery rows and their update and insert, user stats, leaderboards, savepoints
+    with django_assert_num_queries(16):
+        services.save_quiz_results(quiz, [rec.id for rec in recordings], [sp.name for sp in species])
+
+    assert SpeciesMastery.objects.filter(user=user).count() == 10
+    assert SpeciesMastery.objects.filter(user=user, correct=1).count() == 10
+
+
+@pytest.mark.django_db
+def test_get_mastery_weights():
+    """Species with lower ease should get larger weights than unseen species, and mastered species smaller."""
+    user = baker.make(User)
+    weak_species, mastered_species = baker.make(Species, _quantity=2)
+    baker.make(SpeciesMastery, user=user, species=weak_species, ease=SpeciesMastery.MIN_EASE)
+    baker.make(SpeciesMastery, user=user, species=mastered_species, ease=SpeciesMastery.MAX_EASE)
+
+    weights = services.get_mastery_weights(user.id)
+
+    unseen_weight = services.get_mastery_weight(SpeciesMastery.DEFAULT_EASE)
+    assert weights[weak_species.id] > unseen_weight > weights[mastered_species.id]
+
+
+@pytest.mark.django_db
+def test_get_audio_sources(settings):
+    """Self-hosted audio should be offered as transcoded variants from smallest to largest, then the original file."""
+    recording = baker.prepare(
+        Recording,
+        audio="audio/XC1.mp3",
+        audio_opus="audio/opus/XC1.ogg",
+        audio_opus_size=40_000,
+        audio_aac="audio/aac/XC1.m4a",
+        audio_aac_size=30_000,
+        xc_audio_url="https://xeno-canto.org/sounds/XC1.mp3"
+    )
+
+    settings.SELF_HOST_AUDIO = True
+    self_hosted_sources = services.get_audio_sources(recording)
+    settings.SELF_HOST_AUDIO = False
+    xc_sources = services.get_audio_sources(recording)
+
+    assert [source.url.rsplit("/", 1)[-1] for source in self_hosted_sources] == ["XC1.m4a", "XC1.ogg", "XC1.mp3"]
+    assert self_hosted_sources[-1].type == "audio/mpeg"
+    assert xc_sources == [services.AudioSource("https://xeno-canto.org/sounds/XC1.mp3", "audio/mpeg")]
+
+
+def test_get_audio_preload_links():
+    """Only the first source should be preloaded, with a preconnect to external audio hosts."""
+    local_sources = [
+        services.AudioSource("/media/audio/opus/XC1.ogg", 'audio/ogg; codecs="opus"'),
+        services.AudioSource("/media/audio/XC1.mp3", "audio/mpeg")
+    ]
+    xc_sources = [services.AudioSource("https://xeno-canto.org/sounds/XC1.mp3", "audio/mpeg")]
+
+    assert services.get_audio_preload_links(local_sources) == [
+        '</media/audio/opus/XC1.ogg>; rel=preload; as=audio; type="audio/ogg"'
+    ]
+    assert services.get_audio_preload_links(xc_sources) == [
+        "<https://xeno-canto.org>; rel=preconnect",
+        '<https://xeno-canto.org/sounds/XC1.mp3>; rel=preload; as=audio; type="audio/mpeg"'
+    ]
+    assert services.get_audio_preload_links([]) == []
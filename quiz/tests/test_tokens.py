@@ -0,0 +1,51 @@
+"""Unit tests for answer tokens"""
+
+from django.core.signing import BadSignature
+from django.utils.translation import override
+import pytest
+
+from quiz.models import Recording, Species
+from quiz import tokens
+
+
+def make_recording() -> Recording:
+    species = Species(
+        id=1,
+        name_en="Great Black-backed Gull",
+        name_fi="merilokki",
+        name_sci="Larus marinus"
+    )
+    return Recording(id=123, species=species)
+
+
+def test_answer_token_1():
+    """Token should contain the recording ID, the localized answer and all accepted answers."""
+    with override("fi"):
+        token = tokens.create_answer_token(make_recording())
+
+    answer_token = tokens.read_answer_token(token)
+
+    assert answer_token.recording_id == 123
+    assert answer_token.answer == "merilokki"
+    assert sorted(answer_token.accepted_answers) == ["great black-backed gull", "larus marinus", "merilokki"]
+
+
+def test_answer_token_2():
+    """Token shouldn't reveal the answer, and tokens of the same question should differ."""
+    recording = make_recording()
+    token_1 = tokens.create_answer_token(recording)
+    token_2 = tokens.create_answer_token(recording)
+
+    assert token_1 != token_2
+    assert not any(name in token_1.lower() for name in ("gull", "lokki", "larus"))
+
+
+def test_answer_token_3():
+    """Tampered tokens should be rejected."""
+    token = tokens.create_answer_token(make_recording())
+    value, signature = token.rsplit(":", 1)
+    tampered_value = ("A" if value[0] != "A" else "B") + value[1:]
+
+    with pytest.raises(BadSignature):
+        tokens.read_answer_token(f"{tampered_value}:{signature}")
+
@@ -26,13 +26,31 @@ def test_check_answer():
     # Accepted answers, variations
     answer_4 = "MeriLokki"          # answer checking should be case insensitive
     answer_5 = " Larus marinus \n"  # surrounding whitespace should be stripped before checking
-    assert all(utils.check_answer(answer, sp) for answer in (answer_4, answer_5))
+    answer_6 = "Great Black backed Gull"  # a few typos should be tolerated
+    answer_7 = "Meri lokki"
+    answer_8 = "Larus mrainus"
+    assert all(utils.check_answer(answer, sp) for answer in (answer_4, answer_5, answer_6, answer_7, answer_8))
 
     # Incorrect answers
-    answer_6 = "Great Black backed Gull"
-    answer_7 = "Meri lokki"
-    answer_8 = ""
-    assert not any(utils.check_answer(answer, sp) for answer in (answer_6, answer_7, answer_8))
+    answer_9 = "Lesser Black-backed Gull"
+    answer_10 = "harmaalokki"
+    answer_11 = "Meri lokkki"  # too many typos for a short name
+    answer_12 = ""
+    assert not any(utils.check_answer(answer, sp) for answer in (answer_9, answer_10, answer_11, answer_12))
+
+
+def test_normalize_answer():
+    assert utils.normalize_answer("  Selkälokki ") == "selkalokki"
+    assert utils.normalize_answer("Great  Black-backed\tGull") == "great black-backed gull"
+    assert utils.normalize_answer("STRAßE") == "strasse"
+
+
+def test_edit_distance():
+    assert utils.edit_distance("merilokki", "merilokki", 2) == 0
+    assert utils.edit_distance("merilokki", "merlokki", 2) == 1   # deletion
+    assert utils.edit_distance("merilokki", "mreilokki", 2) == 1  # transposition
+    assert utils.edit_distance("merilokki", "harmaalokki", 2) == 3  # distance exceeds the bound
+    assert utils.edit_distance("tern", "common tern", 2) == 3
 
 
 def test_create_region_display_name_1():
@@ -0,0 +1,255 @@
+"""Tests for views"""
+
+from io import StringIO
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.urls import reverse
+from django.utils.http import http_date
+from model_bakery import baker
+import pytest
+
+from quiz.models import Answer, Observation, Quiz, Recording, Region, Species
+from quiz.services import QUIZ_LENGTH
+from quiz import blueprints, names, services, tokens
+
+
+def make_quiz_token(recording_ids: list[int], difficulty: str = "NML", region_id: int | None = None) -> str:
+    return tokens.create_quiz_token(tokens.QuizToken(
+        str(uuid.uuid4()), recording_ids, region_id, difficulty, "OPEN", "2025-01-01T12:00:00+00:00"
+    ))
+
+
+def make_recording(recording_id: int, species_id: int, name_en: str, name_fi: str, name_sci: str) -> Recording:
+    species = Species(id=species_id, name_en=name_en, name_fi=name_fi, name_sci=name_sci)
+    return Recording(id=recording_id, species=species)
+
+
+@pytest.mark.django_db
+def test_check_answer_view(client, django_assert_num_queries):
+    """Checking an answer shouldn't query the database."""
+    token = tokens.create_answer_token(make_recording(123, 1, "Great Black-backed Gull", "merilokki", "Larus marinus"))
+
+    with django_assert_num_queries(0):
+        correct_response = client.post(reverse("check_answer"), {"token": token, "user_answer": " MeriLokki "})
+        wrong_response = client.post(reverse("check_answer"), {"token": token, "user_answer": "harmaalokki"})
+    invalid_response = client.post(reverse("check_answer"), {"token": token + "x", "user_answer": "merilokki"})
+
+    assert correct_response.json() == {
+        "id": 123, "answer": "Great Black-backed Gull", "correct": True, "verdict": "exact"
+    }
+    assert wrong_response.json() == {
+        "id": 123, "answer": "Great Black-backed Gull", "correct": False, "verdict": "wrong"
+    }
+    assert invalid_response.status_code == 400
+
+
+@pytest.mark.django_db
+def test_check_answers_view_1(client, django_assert_num_queries):
+    """All answers of a quiz should be checked with one request without querying the database."""
+    answer_tokens = [
+        tokens.create_answer_token(make_recording(1, 1, "Great Black-backed Gull", "merilokki", "Larus marinus")),
+        tokens.create_answer_token(make_recording(2, 2, "Common Tern", "kalatiira", "Sterna hirundo")),
+        tokens.create_answer_token(make_recording(3, 3, "Eurasian Teal", "tavi", "Anas crecca")),
+    ]
+
+    with django_assert_num_queries(0):
+        response = client.post(
+            reverse("check_answers"),
+            {"tokens[]": answer_tokens, "user_answers[]": ["merilokki", "", "tavi"]}
+        )
+
+    assert response.status_code == 200
+    assert [(result["id"], result["correct"]) for result in response.json()["results"]] == [
+        (1, True), (2, False), (3, True)
+    ]
+
+
+@pytest.mark.django_db
+def test_check_answers_view_2(client):
+    """Requests with invalid tokens or mismatched answers should be rejected."""
+    token = tokens.create_answer_token(make_recording(1, 1, "Great Black-backed Gull", "merilokki", "Larus marinus"))
+
+    mismatched_response = client.post(reverse("check_answers"), {"tokens[]": [token], "user_answers[]": []})
+    invalid_response = client.post(reverse("check_answers"), {"tokens[]": ["x", token], "user_answers[]": ["", ""]})
+
+    assert mismatched_response.status_code == 400
+    assert invalid_response.status_code == 400
+
+
+@pytest.mark.django_db
+def test_quiz_page(client):
+    """Quizzes of regions that require subregions should include them even if not requested."""
+    cache.clear()
+    country = baker.make(Region, code="US")
+    state = baker.make(Region, code="US-NY", parent_region=country)
+    for species in baker.make(Species, _quantity=QUIZ_LENGTH):
+        baker.make(Observation, region=state, species=species)
+        baker.make(Recording, species=species, _create_files=True)
+    services.refresh_region_quiz_pool()
+
+    response = client.post(reverse("quiz"), {"region": country.id, "mode": "MULTI", "difficulty": "NML"})
+
+    assert response.status_code == 200
+    assert len(response.context["recordings"]) == QUIZ_LENGTH
+
+
+@pytest.mark.django_db
+def test_quiz_page_2(client):
+    """Pre-generated quizzes that use deleted recordings or species should be replaced with new quizzes."""
+    cache.clear()
+    region = baker.make(Region)
+    species_set = baker.make(Species, _quantity=QUIZ_LENGTH + 1)
+    for species in species_set:
+        baker.make(Observation, region=region, species=species)
+        baker.make(Recording, species=species)
+    services.refresh_region_quiz_pool()
+    blueprint = services.generate_quiz_blueprint(region.id, "NML", "MULTI")
+    blueprints.push_quiz_blueprint(region.id, "NML", "MULTI", blueprint)
+    deleted_species_id = next(iter(blueprint["choice_ids"]))
+    Species.objects.filter(id=deleted_species_id).delete()
+
+    response = client.post(reverse("quiz"), {"region": region.id, "mode": "MULTI", "difficulty": "NML"})
+
+    assert response.status_code == 200
+    assert len(response.context["recordings"]) == QUIZ_LENGTH
+    assert deleted_species_id not in response.context["options"]
+    assert services.load_quiz_blueprint(blueprint) is None
+
+
+@pytest.mark.django_db
+def test_results_page(client, django_assert_num_queries):
+    """Answers should be graded on the server, and the quiz saved with a constant number of queries."""
+    cache.clear()
+    region = baker.make(Region)
+    species = [baker.make(Species, name_en=f"Bird {i}", name_sci=f"Avis {i}") for i in range(10)]
+    recordings = [baker.make(Recording, species=sp, _create_files=True) for sp in species]
+    names.get_species_name_indexes()  # built once per species catalog version
+    data = {
+        "quiz_token": make_quiz_token([recording.id for recording in recordings], region_id=region.id),
+        "ids[]": [recording.id for recording in recordings],
+        "is_correct[]": [1] * 10,  # client-side statuses should be ignored
+        "answer_0": "Bird 0",
+        "answer_1": "Avis 1",
+        "answer_2": "Bird 3",
+    }
+
+    # recordings with species, quiz, answers, and the transaction savepoint and its release
+    with django_assert_num_queries(5):
+        response = client.post(reverse("results"), data)
+
+    quiz = Quiz.objects.get()
+    assert response.status_code == 302
+    assert (quiz.length, quiz.score, quiz.region_id, quiz.difficulty) == (10, 2, region.id, "NML")
+    assert list(quiz.answers.order_by("id").values_list("is_correct", flat=True)) == [True, True] + [False] * 8
+
+
+@pytest.mark.django_db
+def test_results_page_2(client):
+    """Invalid recording IDs should be rejected, and answers to deleted recordings shown without them."""
+    cache.clear()
+    recording = baker.make(
+        Recording, species=baker.make(Species, name_en="Common Tern"), xc_audio_url="https://xeno-canto.org/1.mp3"
+    )
+    ids = [recording.id, recording.id + 1]
+
+    assert client.post(reverse("results"), {"quiz_token": make_quiz_token(["x"]), "ids[]": ["x"]}).status_code == 400
+    duplicate_ids = [recording.id] * 2
+    assert client.post(
+        reverse("results"), {"quiz_token": make_quiz_token(duplicate_ids), "ids[]": duplicate_ids}
+    ).status_code == 400
+    assert client.post(
+        reverse("results"), {"quiz_token": make_quiz_token(list(range(1, 12))), "ids[]": list(range(1, 12))}
+    ).status_code == 400
+    response = client.post(reverse("results"), {"quiz_token": make_quiz_token(ids), "ids[]": ids})
+    results_response = client.get(response.url)
+
+    assert results_response.status_code == 200
+    assert "Common Tern" in results_response.content.decode()
+    assert results_response.content.decode().count("data-audio=") == 1
+
+
+@pytest.mark.django_db
+def test_results_page_3(client):
+    """Only quizzes chosen by the server should be saved, and each of them only once."""
+    cache.clear()
+    user = baker.make(get_user_model())
+    recordings = baker.make(Recording, species=baker.make(Species, name_en="Common Tern"), _quantity=10)
+    ids = [recording.id for recording in recordings]
+    token = make_quiz_token(ids, difficulty="HRD")
+    answers = {f"answer_{i}": "Common Tern" for i in range(10)}
+    client.force_login(user)
+
+    assert client.post(reverse("results"), {"ids[]": ids}).status_code == 400
+    assert client.post(reverse("results"), {"quiz_token": token + "x", "ids[]": ids}).status_code == 400
+    assert client.post(reverse("results"), {"quiz_token": token, "ids[]": ids[:1]}).status_code == 400
+    assert client.post(
+        reverse("results"), {"quiz_token": make_quiz_token(ids, difficulty="XX"), "ids[]": ids}
+    ).status_code == 400
+    first_response = client.post(reverse("results"), {"quiz_token": token, "ids[]": ids})
+    second_response = client.post(reverse("results"), {"quiz_token": token, "ids[]": ids} | answers)
+
+    quiz = Quiz.objects.get()
+    assert first_response.url == second_response.url
+    assert (quiz.difficulty, quiz.score) == ("HRD", 0)  # the resubmitted answers are ignored
+
+
+@pytest.mark.django_db
+def test_results_page_get(client, django_assert_num_queries):
+    """Results should be cached, and repeat views with a matching ETag should get a 304 response."""
+    cache.clear()
+    quiz = baker.make(Quiz, score=1, length=1)
+    recording = baker.make(Recording, species=baker.make(Species, name_en="Common Tern"), _create_files=True)
+    baker.make(Answer, quiz=quiz, recording=recording, user_answer="common tern", is_correct=True)
+    url = reverse("results_get", kwargs={"quiz_id": quiz.id})
+
+    response = client.get(url)
+    with django_assert_num_queries(0):
+        cached_response = client.get(url)
+        not_modified_response = client.get(url, headers={"if-none-match": response["ETag"]})
+
+    assert response.status_code == 200
+    assert "Common Tern" in response.content.decode()
+    assert "Common Tern" in cached_response.content.decode()
+    assert not_modified_response.status_code == 304
+    assert response["Last-Modified"] == http_date(quiz.graded_at.timestamp())
+    assert client.get(reverse("results_get", kwargs={"quiz_id": uuid.uuid4()})).status_code == 404
+
+
+@pytest.mark.django_db
+def test_results_page_get_2(client):
+    """Regraded results should no longer match the validators of the old results."""
+    cache.clear()
+    quiz = baker.make(Quiz, mode="OPEN", score=0, length=1)
+    species = baker.make(Species, name_en="Common Tern", name_fi="kalatiira", name_sci="Sterna hirundo")
+    recording = baker.make(Recording, species=species, _create_files=True)
+    baker.make(Answer, quiz=quiz, recording=recording, user_answer="Comon Tern", is_correct=False)
+    url = reverse("results_get", kwargs={"quiz_id": quiz.id})
+    response = client.get(url)
+
+    call_command("update_quiz_results", stdout=StringIO())
+    regraded_response = client.get(url, headers={"if-none-match": response["ETag"]})
+
+    assert regraded_response.status_code == 200
+    assert regraded_response["ETag"] != response["ETag"]
+    assert regraded_response["Last-Modified"] == http_date(Quiz.objects.get(id=quiz.id).graded_at.timestamp())
+
+
+@pytest.mark.django_db
+def test_leaderboard_page(client, django_assert_max_num_queries):
+    """Leaderboard page should be rendered from cached leaderboards and region catalog."""
+    cache.clear()
+    user = baker.make("accounts.User", username="tern_fan")
+    baker.make(Quiz, user=user, mode="MULTI", difficulty="HRD", length=10, score=7, region=None)
+    client.get(reverse("leaderboards"), {"period": "day"})
+
+    with django_assert_max_num_queries(0):
+        response = client.get(reverse("leaderboards"), {"period": "day"})
+    invalid_response = client.get(reverse("leaderboards"), {"period": "year", "region": "x"})
+
+    assert response.status_code == 200
+    assert [(row.username, row.points) for row, _ in response.context["rows"]] == [("tern_fan", 21)]
+    assert invalid_response.context["period"] == "week"
+    assert invalid_response.context["region_id"] is None
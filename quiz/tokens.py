@@ -0,0 +1,111 @@
+"""
+Signed answer tokens of quiz questions, and signed quiz tokens of whole quizzes.
+
+A token is created for each question when the quiz page is rendered and sent back with the user's answer, so answers
+can be checked without querying the database. The token is signed with django.core.signing so it can't be tampered
+with, and its contents are encrypted with a keystream derived from SECRET_KEY so the correct answer can't be read
+from the page source.
+
+A quiz token holds what the server chose for the quiz: its ID, recordings, region, difficulty, mode and start time.
+Results are saved from the quiz token rather than from client-provided fields, so quizzes can be ranked fairly, and
+since the quiz ID comes from the token, the same quiz can't be submitted twice.
+"""
+
+import base64
+import json
+import os
+from typing import NamedTuple
+
+from django.core import signing
+from django.utils.crypto import salted_hmac
+
+from quiz.models import Recording
+from quiz.utils import get_accepted_answers
+
+
+SIGNING_SALT = "quiz.tokens.answer"
+KEYSTREAM_SALT = "quiz.tokens.keystream"
+QUIZ_SIGNING_SALT = "quiz.tokens.quiz"
+NONCE_SIZE = 16
+QUIZ_TOKEN_MAX_AGE = 60 * 60 * 24  # seconds
+
+
+class AnswerToken(NamedTuple):
+    recording_id: int
+    species_id: int
+    answer: str  # localized name of the correct species, shown to the user after checking
+    accepted_answers: list[str]
+
+
+class QuizToken(NamedTuple):
+    quiz_id: str
+    recording_ids: list[int]
+    region_id: int | None
+    difficulty: str
+    mode: str
+    started_at: str  # ISO 8601 timestamp
+
+
+def _keystream(nonce: bytes, length: int) -> bytes:
+    """Derive a pseudorandom keystream of `length` bytes from SECRET_KEY and a nonce."""
+    blocks = []
+    for counter in range(-(-length // 32)):  # one 32-byte SHA-256 digest per block
+        blocks.append(salted_hmac(KEYSTREAM_SALT, nonce + counter.to_bytes(4), algorithm="sha256").digest())
+    return b"".join(blocks)[:length]
+
+
+def _xor(data: bytes, keystream: bytes) -> bytes:
+    return bytes(a ^ b for a, b in zip(data, keystream))
+
+
+def create_answer_token(recording: Recording) -> str:
+    """
+    Create an answer token for a quiz question. The species of the recording should be loaded beforehand.
+
+    :param recording: Recording of the quiz question.
+    :return token: Signed and encrypted token containing the correct answer of the question.
+    """
+    payload = json.dumps(
+        [recording.id, recording.species_id, recording.species.name, get_accepted_answers(recording.species)],
+        separators=(",", ":")
+    ).encode()
+    nonce = os.urandom(NONCE_SIZE)
+    ciphertext = _xor(payload, _keystream(nonce, len(payload)))
+    value = base64.urlsafe_b64encode(nonce + ciphertext).decode()
+    return signing.Signer(salt=SIGNING_SALT).sign(value)
+
+
+def read_answer_token(token: str) -> AnswerToken:
+    """
+    Verify and decrypt an answer token.
+
+    :param token: Token created with create_answer_token.
+    :return answer_token: Contents of the token.
+    :raises django.core.signing.BadSignature: If the token is invalid or has been tampered with.
+    """
+    value = signing.Signer(salt=SIGNING_SALT).unsign(token)
+    data = base64.urlsafe_b64decode(value)
+    nonce, ciphertext = data[:NONCE_SIZE], data[NONCE_SIZE:]
+    return AnswerToken(*json.loads(_xor(ciphertext, _keystream(nonce, len(ciphertext)))))
+
+
+def create_quiz_token(quiz_token: QuizToken) -> str:
+    """
+    Sign the contents of a quiz token.
+
+    :param quiz_token: Quiz as chosen by the server.
+    :return token: Signed token, readable but not modifiable by the client.
+    """
+    return signing.dumps(list(quiz_token), salt=QUIZ_SIGNING_SALT, compress=True)
+
+
+def read_quiz_token(token: str) -> QuizToken:
+    """
+    Verify a quiz token.
+
+    :param token: Token created with create_quiz_token.
+    :return quiz_token: Contents of the token.
+    :raises django.core.signing.BadSignature: If the token is invalid, has been tampered with or is older than
+        QUIZ_TOKEN_MAX_AGE.
+    """
+    return QuizToken(*signing.loads(token, salt=QUIZ_SIGNING_SALT, max_age=QUIZ_TOKEN_MAX_AGE))
@@ -9,7 +9,7 @@ class SpeciesTranslationOptions(TranslationOptions):
 
 
 class RegionTranslationOptions(TranslationOptions):
-    fields = ("name",)
+    fields = ("name", "full_name")
     required_languages = ("en",)
 
 
@@ -1,11 +1,22 @@
-from django.urls import path
+import re
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.urls import path, re_path
 
 from . import views
 
+
+MEDIA_PATH = urlsplit(settings.MEDIA_URL).path.strip("/")  # MEDIA_URL may also be an absolute URL
+MEDIA_PREFIX = f"{re.escape(MEDIA_PATH)}/" if MEDIA_PATH else ""
+
 urlpatterns = [
     path("", views.index, name="index"),
     path("quiz/", views.quiz_page, name="quiz"),
     path("results/", views.results_page, name="results"),
     path("quiz/results/<uuid:quiz_id>/", views.results_page_get, name="results_get"),
-    path("check_answer/", views.check_answer_view, name="check_answer")
+    path("check_answer/", views.check_answer_view, name="check_answer"),
+    path("check_answers/", views.check_answers_view, name="check_answers"),
+    path("leaderboards/", views.leaderboard_page, name="leaderboards"),
+    re_path(rf"^{MEDIA_PREFIX}(?P<name>audio/.+)$", views.audio_view, name="audio")
 ]
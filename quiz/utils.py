@@ -1,6 +1,10 @@
+from functools import cache
 from typing import TYPE_CHECKING
+import unicodedata
 
 if TYPE_CHECKING:
+    from django.db.models import Model
+
     from quiz.models import Region, Species
 
 
@@ -17,6 +21,114 @@ def create_region_display_name(region: "Region") -> str:
     return " - ".join([reg.name for reg in [parent_region_2, parent_region_1, region] if reg])
 
 
+def normalize_answer(answer: str) -> str:
+    """
+    Normalize an answer or a species name for comparison: fold case and diacritics (e.g. "ä" -> "a") and collapse
+    whitespace.
+
+    :param answer: Answer or species name to normalize.
+    :return normalized_answer: Normalized answer.
+    """
+    decomposed = unicodedata.normalize("NFKD", answer.casefold())
+    folded = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return " ".join(folded.split())
+
+
+def edit_distance(a: str, b: str, max_distance: int) -> int:
+    """
+    Compute the optimal string alignment distance (Levenshtein distance with adjacent transpositions) of two strings,
+    giving up as soon as the distance is known to exceed max_distance.
+
+    :param a: First string.
+    :param b: Second string.
+    :param max_distance: Largest distance of interest.
+    :return distance: Edit distance, or max_distance + 1 if the distance is larger than max_distance.
+    """
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    # Common prefix and suffix don't affect the distance, so only the (usually short) differing middle is compared
+    start = 0
+    while start < len(a) and start < len(b) and a[start] == b[start]:
+        start += 1
+    end = 0
+    while end < len(a) - start and end < len(b) - start and a[-1 - end] == b[-1 - end]:
+        end += 1
+    a, b = a[start:len(a) - end], b[start:len(b) - end]
+    previous_row = None
+    row = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        previous_row, prior_row, row = row, previous_row, [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            row[j] = min(previous_row[j] + 1, row[j - 1] + 1, previous_row[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                row[j] = min(row[j], prior_row[j - 2] + 1)
+        if min(row) > max_distance:
+            return max_distance + 1
+    return min(row[-1], max_distance + 1)
+
+
+def get_max_typo_distance(name: str) -> int:
+    """
+    Get the number of typos tolerated in an answer to a species name. Short names must be spelled exactly.
+
+    :param name: Normalized species name.
+    :return max_distance: Largest accepted edit distance between the answer and the name.
+    """
+    if len(name) <= 4:
+        return 0
+    if len(name) <= 9:
+        return 1
+    return 2
+
+
+@cache
+def get_name_fields(model: type["Model"]) -> tuple[str, ...]:
+    """Get the names of all (translated and scientific) name fields of a model, e.g. ("name_en", "name_fi", ...)."""
+    return tuple(field.name for field in model._meta.fields if field.name.startswith("name_"))
+
+
+def get_accepted_answers(species: "Species") -> list[str]:
+    """
+    Get the normalized names of a species that are accepted as correct answers, in every language.
+
+    :param species: Species whose names are returned.
+    :return accepted_answers: Normalized, non-empty names of the species.
+    """
+    names = (normalize_answer(getattr(species, name_field) or "") for name_field in get_name_fields(type(species)))
+    return list(dict.fromkeys(name for name in names if name))
+
+
+def get_answer_distance(user_answer: str, accepted_answers: list[str]) -> int | None:
+    """
+    Get the edit distance of an answer to the closest accepted answer, if it's within the tolerated number of typos.
+
+    :param user_answer: Answer given by user.
+    :param accepted_answers: Normalized accepted answers, see get_accepted_answers.
+    :return distance: Smallest edit distance, or None if the answer isn't close enough to any accepted answer.
+    """
+    answer = normalize_answer(user_answer)
+    if not answer:
+        return None
+    distances = [
+        distance for name in accepted_answers
+        if (distance := edit_distance(answer, name, get_max_typo_distance(name))) <= get_max_typo_distance(name)
+    ]
+    return min(distances, default=None)
+
+
+def is_accepted_answer(user_answer: str, accepted_answers: list[str]) -> bool:
+    """
+    Check if user answer matches any of the accepted answers, allowing for a few typos.
+    Use quiz.names.match_answer to also reject answers that are closer to another species.
+
+    :param user_answer: Answer given by user.
+    :param accepted_answers: Normalized accepted answers, see get_accepted_answers.
+    :returns is_correct: Boolean that indicates whether answer is correct.
+    """
+    return get_answer_distance(user_answer, accepted_answers) is not None
+
+
 def check_answer(user_answer: str, correct_species: "Species") -> bool:
     """
     Check if user answer to a quiz question is correct.
@@ -25,7 +137,4 @@ def check_answer(user_answer: str, correct_species: "Species") -> bool:
     :param correct_species: The species that is the correct answer to the quiz question.
     :returns is_correct: Boolean that indicates whether answer is correct.
     """
-    user_answer_normalized = user_answer.lower().strip()
-    name_fields = (field.name for field in correct_species._meta.fields if field.name.startswith("name_"))
-    is_correct = any(user_answer_normalized == getattr(correct_species, name_field, "").lower().strip() for name_field in name_fields)
-    return is_correct
+    return is_accepted_answer(user_answer, get_accepted_answers(correct_species))
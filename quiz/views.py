@@ -1,21 +1,57 @@
-import random
+from pathlib import Path
+import uuid
 
 from django.conf import settings
-from django.http import JsonResponse
+from django.contrib import messages
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.signing import BadSignature
+from django.db import IntegrityError
+from django.http import Http404, HttpResponseBadRequest, HttpResponseForbidden, JsonResponse
 from django.shortcuts import render, redirect
-from django.views.decorators.http import require_http_methods
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_http_methods
 from django.utils import timezone
-from django.utils.translation import gettext_lazy as _
+from django.utils.translation import get_language, gettext_lazy as _
 
-from quiz.models import Recording, Quiz, Answer
-from quiz.services import get_available_regions, get_regions_with_beginner_quiz, get_species_by_region, get_beginner_species_by_region, get_quiz_recordings, get_multiple_choices
-from quiz.utils import check_answer
+from quiz.audio import check_audio_signature, get_url_expiry, serve_audio, sign_audio_url
+from quiz.blueprints import pop_quiz_blueprint
+from quiz.leaderboards import get_leaderboard
+from quiz.models import DIFFICULTY_LABELS, LeaderboardEntry, Quiz, Recording
+from quiz.names import Verdict, match_answer
+from quiz.services import (
+    QUIZ_LENGTH,
+    get_audio_preload_links,
+    get_audio_sources,
+    get_quiz_results,
+    get_region_catalog,
+    get_regions_requiring_subregions,
+    get_regions_with_beginner_quiz,
+    generate_quiz_blueprint,
+    load_quiz_blueprint,
+    save_quiz_results
+)
+from quiz.tokens import QuizToken, create_answer_token, create_quiz_token, read_answer_token, read_quiz_token
+
+
+PERIOD_LABELS = {
+    LeaderboardEntry.Period.DAY: _("DailyLeaderboardTab"),
+    LeaderboardEntry.Period.WEEK: _("WeeklyLeaderboardTab"),
+    LeaderboardEntry.Period.ALL_TIME: _("AllTimeLeaderboardTab")
+}
 
 
 def index(request):
-    regions = sorted(get_available_regions(), key=lambda r: r.display_name.lower())
+    regions = get_region_catalog("quiz")
     regions_with_beginner_quiz = get_regions_with_beginner_quiz()
-    return render(request, 'index.html', context={"regions": regions, "beginner_quiz_regions": regions_with_beginner_quiz})
+    return render(
+        request,
+        'index.html',
+        context={
+            "regions": regions,
+            "beginner_quiz_regions": regions_with_beginner_quiz,
+            "subregion_quiz_regions": get_regions_requiring_subregions()
+        }
+    )
 
 
 @require_http_methods(["POST"])
@@ -25,110 +61,198 @@ def quiz_page(request):
     mode = request.POST.get("mode")
     started_at = timezone.now().astimezone(timezone.get_default_timezone()).isoformat()
     difficulty = request.POST.get("difficulty")
-    match difficulty:
-        case "BGN":
-            region_species = get_beginner_species_by_region(region_id)
-            num_choices = 2
-        case "NML":
-            region_species = get_species_by_region(region_id)
-            num_choices = 3
-        case _:
-            raise ValueError("Unexpected difficulty")
-    quiz_species = random.sample(list(region_species), 10)
-    recordings = get_quiz_recordings(quiz_species)
-    options = {}
-    match mode:
-        case "MULTI":
-            for sp in quiz_species:
-                sp_options = get_multiple_choices(
-                    target_species=sp,
-                    available_species=region_species,
-                    num_choices=num_choices,
-                    mode="random"
-                )
-                options[sp.id] = sp_options
-        case "OPEN":
-            pass
-        case _:
-            raise ValueError("Unexpected game mode")
-    audio_field = "audio.url" if settings.SELF_HOST_AUDIO else "xc_audio_url"
-    return render(
+    include_subregions = request.POST.get("include_subregions") == "on"
+    if region_id and int(region_id) in get_regions_requiring_subregions():  # a quiz without them would be short
+        include_subregions = True
+    check_at_end = request.POST.get("check_at_end") == "on"
+    quiz_contents = None
+    if request.POST.get("practice_weak_species") == "on" and request.user.is_authenticated:
+        # Practice quizzes are personal, so they can't be taken from the shared pool
+        blueprint = generate_quiz_blueprint(
+            region_id, difficulty, mode, include_subregions, practice_user_id=request.user.id
+        )
+        quiz_contents = load_quiz_blueprint(blueprint)
+    else:
+        blueprint = pop_quiz_blueprint(int(region_id), difficulty, mode, include_subregions)
+        if blueprint is not None:
+            quiz_contents = load_quiz_blueprint(blueprint)
+        if quiz_contents is None:  # pool is empty or the quiz uses deleted recordings, generate quiz on the fly
+            blueprint = generate_quiz_blueprint(region_id, difficulty, mode, include_subregions)
+            quiz_contents = load_quiz_blueprint(blueprint)
+    recordings, options = quiz_contents or ([], {})
+    if not recordings:
+        messages.error(request, _("NoSpeciesInRegionMessage"))
+        return redirect("index")
+    answer_tokens = {recording.id: create_answer_token(recording) for recording in recordings}
+    quiz_token = create_quiz_token(QuizToken(
+        str(uuid.uuid4()),
+        [recording.id for recording in recordings],
+        int(region_id) if region_id else None,
+        difficulty,
+        mode,
+        started_at
+    ))
+    audio_sources = {recording.id: get_audio_sources(recording) for recording in recordings}
+    response = render(
         request,
         'quiz.html',
         context={
             "recordings": recordings,
-            "audio_field": audio_field,
+            "audio_sources": audio_sources,
             "options": options,
-            "difficulty": difficulty,
-            "mode": mode,
-            "region_id": region_id,
-            "started_at": started_at
+            "answer_tokens": answer_tokens,
+            "quiz_token": quiz_token,
+            "check_at_end": check_at_end,
+            "mode": mode
         }
     )
+    preload_links = get_audio_preload_links(audio_sources[recordings[0].id])
+    if preload_links:
+        response.headers["Link"] = ", ".join(preload_links)
+    return response
+
+
+def _check_answer_token(token: str, user_answer: str) -> dict:
+    """Check an answer against an answer token. Raises BadSignature or ValueError if the token is invalid."""
+    answer_token = read_answer_token(token)
+    verdict = match_answer(user_answer, answer_token.species_id, answer_token.accepted_answers)
+    correct = verdict in (Verdict.EXACT, Verdict.TYPO)
+    return {"id": answer_token.recording_id, "answer": answer_token.answer, "correct": correct, "verdict": verdict}
 
 
 @require_http_methods(["POST"])
 def check_answer_view(request):
-    recording_id = request.POST.get("id")
-    user_answer = request.POST.get("user_answer")
     try:
-        recording = Recording.objects.get(id=recording_id)
-    except Recording.DoesNotExist:
-        return JsonResponse({"error": "Recording not found"}, status=404)
-    correct_answer = recording.species.name
-    correct = check_answer(user_answer, recording.species)
-    return JsonResponse({"answer": correct_answer, "correct": correct})
+        result = _check_answer_token(request.POST.get("token", ""), request.POST.get("user_answer", ""))
+    except (BadSignature, ValueError):
+        return JsonResponse({"error": "Invalid answer token"}, status=400)
+    return JsonResponse(result)
+
+
+@require_http_methods(["POST"])
+def check_answers_view(request):
+    tokens = request.POST.getlist("tokens[]")
+    user_answers = request.POST.getlist("user_answers[]")
+    if len(tokens) != len(user_answers) or len(tokens) > QUIZ_LENGTH:
+        return JsonResponse({"error": "Invalid number of answers"}, status=400)
+    try:
+        results = [_check_answer_token(token, user_answer) for token, user_answer in zip(tokens, user_answers)]
+    except (BadSignature, ValueError):
+        return JsonResponse({"error": "Invalid answer token"}, status=400)
+    return JsonResponse({"results": results})
 
 
 @require_http_methods(["POST"])
 def results_page(request):
+    # The quiz is saved as the server chose it, client-provided fields only have to match it
+    try:
+        quiz_token = read_quiz_token(request.POST.get("quiz_token", ""))
+    except BadSignature:
+        return HttpResponseBadRequest("Invalid quiz token")
+    if quiz_token.mode not in Quiz.QuizMode.values or quiz_token.difficulty not in Quiz.QuizDifficulty.values:
+        return HttpResponseBadRequest("Invalid quiz mode or difficulty")
+    try:
+        recording_ids = [int(recording_id) for recording_id in request.POST.getlist("ids[]")]
+    except ValueError:
+        return HttpResponseBadRequest("Invalid recording IDs")
+    if len(recording_ids) > QUIZ_LENGTH or len(set(recording_ids)) != len(recording_ids):
+        return HttpResponseBadRequest("Invalid number of recordings")
+    if recording_ids != quiz_token.recording_ids:
+        return HttpResponseBadRequest("Recordings don't match the quiz")
     quiz = Quiz(
-        mode=request.POST.get("mode"),
-        difficulty=request.POST.get("difficulty"),
-        started_at=request.POST.get("started_at")
+        id=quiz_token.quiz_id,
+        mode=quiz_token.mode,
+        difficulty=quiz_token.difficulty,
+        started_at=quiz_token.started_at
     )
     quiz.user_id = request.user.id
-    quiz.region_id = request.POST.get("region_id")
-
-    recording_ids = request.POST.getlist("ids[]")
-    answer_statuses = request.POST.getlist("is_correct[]")
-
-    user_answers = []
-    score = 0
-    for i, (recording_id, answer_status) in enumerate(zip(recording_ids, answer_statuses)):
-        user_answer = request.POST.get(f"answer_{i}")
-        recording = Recording.objects.get(id=recording_id)
-        is_correct = bool(int(answer_status))
-        score += is_correct
-        answer = Answer(
-            quiz=quiz,
-            recording=recording,
-            user_answer=user_answer or "",
-            is_correct=is_correct
-        )
-        user_answers.append(answer)
-
-    quiz.length = len(user_answers)
-    quiz.score = score
-    quiz.save()
-    Answer.objects.bulk_create(user_answers)
+    quiz.region_id = quiz_token.region_id
 
+    user_answers = [request.POST.get(f"answer_{i}") or "" for i in range(len(recording_ids))]
+    try:
+        save_quiz_results(quiz, recording_ids, user_answers)
+    except IntegrityError:  # the quiz has already been submitted, its results can't be replaced
+        if not Quiz.objects.filter(id=quiz.id).exists():
+            raise
     return redirect("results_get", quiz_id=quiz.id)
 
 
+def _results_etag(request, quiz_id):
+    results = get_quiz_results(quiz_id)
+    if results is None:
+        return None
+    # The page also shows the logged in user, so a login or logout must change the ETag
+    return "-".join(str(part) for part in (
+        quiz_id,
+        results.score,
+        int(results.graded_at.timestamp() * 1_000_000),  # regrading changes the results
+        get_language(),
+        int(settings.SELF_HOST_AUDIO),
+        request.user.pk,
+        get_url_expiry() if settings.SELF_HOST_AUDIO else None  # signed audio URLs change over time
+    ))
+
+
+def _results_last_modified(request, quiz_id):
+    if settings.SELF_HOST_AUDIO and settings.AUDIO_URL_MAX_AGE:
+        return None  # the page changes when audio URLs are signed again, see _results_etag
+    results = get_quiz_results(quiz_id)
+    return results.graded_at if results is not None else None
+
+
 @require_http_methods(["GET"])
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=_results_etag, last_modified_func=_results_last_modified)
 def results_page_get(request, quiz_id):
-    quiz = Quiz.objects.select_related("user").get(id=quiz_id)
-    answers = Answer.objects.filter(quiz=quiz).order_by("id").select_related("recording__species")
+    results = get_quiz_results(quiz_id)
+    if results is None:
+        raise Http404("Quiz not found")
     placeholder = _("EmptyAnswerPlaceholderText")
-    results = [
+    deleted_placeholder = _("DeletedRecordingPlaceholderText")
+    answers = [
         (
-            ans.user_answer or f"<{placeholder}>",
-            ans.recording.species.name,
-            ans.is_correct,
-            ans.recording.audio.url if settings.SELF_HOST_AUDIO else ans.recording.xc_audio_url
+            user_answer or f"<{placeholder}>",
+            correct_answer if correct_answer is not None else f"<{deleted_placeholder}>",
+            is_correct,
+            sign_audio_url(audio_url) if settings.SELF_HOST_AUDIO and audio_url else audio_url  # cache is unsigned
         )
-        for ans in answers
+        for user_answer, correct_answer, is_correct, audio_url in results.answers
     ]
 
-    return render(request, "results.html", context={"score": quiz.score, "results": results})
+    return render(request, "results.html", context={"score": results.score, "results": answers})
+
+
+@require_http_methods(["GET"])
+def leaderboard_page(request):
+    period = request.GET.get("period")
+    if period not in PERIOD_LABELS:
+        period = LeaderboardEntry.Period.WEEK
+    try:
+        region_id = int(request.GET.get("region") or 0) or None
+    except ValueError:
+        region_id = None
+    rows = [(row, DIFFICULTY_LABELS.get(row.difficulty)) for row in get_leaderboard(period, region_id)]
+    return render(
+        request,
+        "leaderboards.html",
+        context={
+            "rows": rows,
+            "period": period,
+            "periods": PERIOD_LABELS.items(),
+            "region_id": region_id,
+            "regions": get_region_catalog("quiz")
+        }
+    )
+
+
+@require_http_methods(["GET", "HEAD"])
+def audio_view(request, name):
+    if not settings.SELF_HOST_AUDIO:
+        raise Http404("Audio files are not self-hosted")
+    if not check_audio_signature(request):
+        return HttpResponseForbidden("Invalid or expired audio URL")
+    storage = Recording._meta.get_field("audio").storage
+    try:
+        return serve_audio(request, name, Path(storage.path(name)))
+    except (SuspiciousFileOperation, FileNotFoundError, IsADirectoryError):
+        raise Http404("Audio file not found")